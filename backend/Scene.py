@@ -1,9 +1,27 @@
-class Scene:
-    def __init__(self, title, narrative_text, scene_number, image_prompt):
-        self.id = None  # Will be set when saved to database
+from typing import Optional
+from row_model import RowModel
+
+class Scene(RowModel):
+    __slots__ = ("id", "story_id", "image_url", "paragraph", "title", "narrative_text", "scene_number", "image_prompt")
+
+    COLUMNS = (
+        ("id", None),
+        ("story_id", None),
+        ("scene_number", 0),
+        ("title", ""),
+        ("narrative_text", ""),
+        ("image_prompt", ""),
+        ("image_url", ""),
+        ("paragraph", ""),
+    )
+    JSON_FIELDS = ("id", "title", "narrative_text", "scene_number", "image_prompt", "image_url", "paragraph")
+
+    def __init__(self, title: str, narrative_text: str, scene_number: int, image_prompt: str):
+        self.id: Optional[str] = None  # Will be set when saved to database
+        self.story_id: Optional[str] = None  # Will be set when saved to database
         self.image_url = ""
         self.paragraph = ""
         self.title = title
         self.narrative_text = narrative_text
         self.scene_number = scene_number
-        self.image_prompt = image_prompt
\ No newline at end of file
+        self.image_prompt = image_prompt
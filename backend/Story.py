@@ -1,8 +1,41 @@
 from datetime import datetime
+from typing import Any, List, Optional, Union
+from row_model import RowModel
 
-class Story:
-    def __init__(self, user_id, title, nb_scenes, nb_chars, story_mode, cover_image_url):
-        self.id = None  # Will be set when saved to database
+class Story(RowModel):
+    __slots__ = (
+        "id", "user_id", "title", "status", "nb_scenes", "nb_chars", "story_mode",
+        "cover_image_url", "chars", "background_story", "scenes_paragraph", "scenes",
+        "created_at", "updated_at"
+    )
+
+    COLUMNS = (
+        ("id", None),
+        ("user_id", ""),
+        ("title", ""),
+        ("nb_scenes", 0),
+        ("nb_chars", 0),
+        ("story_mode", ""),
+        ("cover_image_url", ""),
+        ("background_story", ""),
+        ("scenes_paragraph", ""),
+        ("status", "created"),
+        ("created_at", None),
+        ("updated_at", None),
+    )
+    EXTRA = (("chars", list), ("scenes", list))
+    JSON_FIELDS = (
+        "id", "user_id", "title", "nb_scenes", "nb_chars", "story_mode", "cover_image_url",
+        "background_story", "scenes_paragraph", "created_at", "updated_at", "status"
+    )
+    # Fields returned for each story in a user's library listing
+    LISTING_FIELDS = (
+        "id", "title", "status", "cover_image_url", "created_at", "updated_at",
+        "nb_scenes", "nb_chars", "story_mode"
+    )
+
+    def __init__(self, user_id: str, title: str, nb_scenes: int, nb_chars: int, story_mode: str, cover_image_url: Optional[str]):
+        self.id: Optional[str] = None  # Will be set when saved to database
         self.user_id = user_id
         self.title = title
         self.status = "created"  # Default status
@@ -10,11 +43,9 @@ class Story:
         self.nb_chars = nb_chars
         self.story_mode = story_mode
         self.cover_image_url = cover_image_url
-        self.chars = []
+        self.chars: List[Any] = []
         self.background_story = ""
         self.scenes_paragraph = ""  # Add scenes_paragraph field to store the storyline
-        self.scenes = []
-        self.created_at = None  # Will be set when saved to database
-        self.updated_at = None  # Will be set when updated
-        
-        
\ No newline at end of file
+        self.scenes: List[Any] = []
+        self.created_at: Optional[Union[str, datetime]] = None  # Will be set when saved to database
+        self.updated_at: Optional[Union[str, datetime]] = None  # Will be set when updated
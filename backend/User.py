@@ -1,8 +1,23 @@
-class User:
-    def __init__(self, username=None, email=None, credits=999, id=None, created_at=None, updated_at=None):
+from typing import Optional
+from row_model import RowModel
+
+class User(RowModel):
+    __slots__ = ("id", "username", "email", "credits", "created_at", "updated_at")
+
+    COLUMNS = (
+        ("id", None),
+        ("username", None),
+        ("email", None),
+        ("credits", 999),
+        ("created_at", None),
+        ("updated_at", None),
+    )
+    JSON_FIELDS = ("id", "username", "email", "credits")
+
+    def __init__(self, username=None, email=None, credits: int = 999, id: Optional[str] = None, created_at=None, updated_at=None):
         self.id = id  # UUID primary key
         self.username = username
         self.email = email
         self.credits = credits  # Default 999 credits
         self.created_at = created_at
-        self.updated_at = updated_at
\ No newline at end of file
+        self.updated_at = updated_at
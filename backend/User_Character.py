@@ -1,8 +1,24 @@
-class User_Character:
-    def __init__(self, story_id, image_url, name, description):
-        self.id = None  # Will be set when saved to database
+from typing import Optional
+from row_model import RowModel
+
+class User_Character(RowModel):
+    __slots__ = ("id", "story_id", "image_url", "name", "description", "analysis")
+
+    COLUMNS = (
+        ("id", None),
+        ("story_id", ""),
+        ("name", ""),
+        ("description", ""),
+        ("image_url", ""),
+        ("analysis", ""),
+    )
+    COALESCE = ("analysis",)
+    JSON_FIELDS = ("id", "name", "description", "image_url", "analysis")
+
+    def __init__(self, story_id: str, image_url: str, name: str, description: str):
+        self.id: Optional[str] = None  # Will be set when saved to database
         self.story_id = story_id
         self.image_url = image_url
         self.name = name
         self.description = description
-        self.analysis = "" # Will be set when generate_narrative_scenes() called 
\ No newline at end of file
+        self.analysis = "" # Will be set when generate_narrative_scenes() called 
@@ -0,0 +1,107 @@
+"""
+Typed response models for story payloads
+Declared as response_model on the story read endpoints. Those routes keep
+FastAPI's default response class, which is what lets FastAPI serialize the
+validated model straight to JSON bytes with pydantic-core instead of walking
+nested dicts with jsonable_encoder and json.dumps; a custom response class
+on these routes would turn that path off. Attributes are optional because
+fields= can ask for any subset; the routes use response_model_exclude_unset,
+so only what the handler set appears in the response.
+
+Routes that return plain dicts declare response_class=FastJSONResponse,
+which renders with orjson when it is installed. jsonable_encoder still runs
+first on those, so the gain there is only the encoding step.
+"""
+
+from typing import Any, List, Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson, falling back to the json module"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class CharacterOut(BaseModel):
+    id: Optional[str] = None
+    name: Optional[str] = None
+    description: Optional[str] = None
+    image_url: Optional[str] = None
+    analysis: Optional[str] = None
+
+
+class SceneOut(BaseModel):
+    id: Optional[str] = None
+    title: Optional[str] = None
+    narrative_text: Optional[str] = None
+    scene_number: Optional[int] = None
+    image_prompt: Optional[str] = None
+    image_url: Optional[str] = None
+    paragraph: Optional[str] = None
+
+
+class StoryOut(BaseModel):
+    id: Optional[str] = None
+    user_id: Optional[str] = None
+    title: Optional[str] = None
+    nb_scenes: Optional[int] = None
+    nb_chars: Optional[int] = None
+    story_mode: Optional[str] = None
+    cover_image_url: Optional[str] = None
+    background_story: Optional[str] = None
+    scenes_paragraph: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    status: Optional[str] = None
+    characters: Optional[List[CharacterOut]] = None
+    scenes: Optional[List[SceneOut]] = None
+
+
+class StoryListingOut(BaseModel):
+    """One story in a user's library listing (Story.LISTING_FIELDS)"""
+    id: Optional[str] = None
+    title: Optional[str] = None
+    status: Optional[str] = None
+    cover_image_url: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    nb_scenes: Optional[int] = None
+    nb_chars: Optional[int] = None
+    story_mode: Optional[str] = None
+
+
+class StoryDetailResponse(BaseModel):
+    success: bool
+    story: Optional[StoryOut] = None
+    error: Optional[str] = None
+
+
+class StoryListResponse(BaseModel):
+    success: bool
+    stories: Optional[List[StoryListingOut]] = None
+    message: Optional[str] = None
+
+
+class StoryBatchResponse(BaseModel):
+    success: bool
+    stories: List[StoryOut]
+    missing: List[str]
+
+
+class SceneDeltaResponse(BaseModel):
+    success: bool
+    story_id: str
+    status: Optional[str] = None
+    version: str
+    scenes: List[SceneOut]
@@ -0,0 +1,161 @@
+"""
+Structured, non-blocking logging
+Every module logs through get_logger(__name__), a child of the "creaition"
+logger. Records are handed to a bounded queue on the calling thread and
+written to stdout by a background listener, so request and generation code
+never waits on the terminal; when the queue is full records are dropped (and
+counted) rather than blocking.
+
+Levels are set globally with LOG_LEVEL and per module with LOG_LEVELS
+(e.g. "image_to_image=DEBUG,dao=WARNING"). Records below WARNING that pass
+extra={"sample": rate} are kept with that probability (sample=True uses
+LOG_SAMPLE_RATE), for lines logged on every poll. Other extra= keys become
+structured fields. Large payload dumps are only logged when
+LOG_DEBUG_PAYLOADS is on.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_SAMPLE_RATE, LOG_QUEUE_SIZE, LOG_DEBUG_PAYLOADS
+from request_context import get_request_id
+
+ROOT_LOGGER = "creaition"
+
+# Attributes every LogRecord has; anything else came from extra= and is a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "sample"}
+
+_setup_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+
+
+def record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    """Structured fields passed through extra="""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class ContextFilter(logging.Filter):
+    """Stamps the current request id and applies per-record sampling"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample = getattr(record, "sample", None)
+        if sample is not None and record.levelno < logging.WARNING:
+            rate = LOG_SAMPLE_RATE if sample is True else float(sample)
+            if random.random() >= rate:
+                return False
+        record.request_id = get_request_id()
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking or erroring when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+        line = f"{timestamp} {record.levelname:<7} {record.name.removeprefix(ROOT_LOGGER + '.')}"
+        if getattr(record, "request_id", None):
+            line += f" [{record.request_id}]"
+        line += f" {record.getMessage()}"
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name.removeprefix(ROOT_LOGGER + "."),
+            "msg": record.getMessage()
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update(record_fields(record))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """Parse "module=LEVEL,..." into logger levels, ignoring malformed entries"""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.strip().partition("=")
+        level_number = logging.getLevelName(level.strip().upper())
+        if name and isinstance(level_number, int):
+            levels[name.strip()] = level_number
+    return levels
+
+
+def setup_logging():
+    """Attach the queue handler and start the writer thread (idempotent)"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _queue_handler is not None:
+            return
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(ContextFilter())
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(parse_levels(f"root={LOG_LEVEL}").get("root", logging.INFO))
+        root.addHandler(_queue_handler)
+        root.propagate = False
+        for name, level in parse_levels(LOG_LEVELS).items():
+            logging.getLogger(f"{ROOT_LOGGER}.{name}").setLevel(level)
+
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread; later records stay queued until dropped"""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for a module; pass __name__"""
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name.rsplit('.', 1)[-1]}")
+
+
+def debug_payloads() -> bool:
+    """Whether full model responses and binary dumps may be logged"""
+    return LOG_DEBUG_PAYLOADS
+
+
+def logging_stats() -> Dict[str, Any]:
+    handler = _queue_handler
+    return {
+        "queued": handler.queue.qsize() if handler else 0,
+        "dropped": handler.dropped if handler else 0
+    }
@@ -0,0 +1,159 @@
+"""
+Serialization benchmark for story payloads
+Serves the same payloads from three routes declared the way fast_api.py
+declares them and compares:
+  - the old path: a plain dict with the default JSONResponse
+    (jsonable_encoder, then json.dumps)
+  - a response_model route with the default response class, which FastAPI
+    serializes straight to JSON bytes with pydantic-core (its dump_json path)
+  - a plain dict with response_class=FastJSONResponse, as the remaining dict
+    routes are served (jsonable_encoder still runs, orjson replaces json.dumps)
+
+For each it reports the serialization step as the router runs it (the
+route's serialize_response call plus rendering the response), its peak
+allocation, and the full request through TestClient.
+
+Run from backend/: python benchmark_serialization.py [repeats]
+"""
+
+import asyncio
+import sys
+import timeit
+import tracemalloc
+
+from fastapi import FastAPI, Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.routing import APIRoute, serialize_response
+from fastapi.testclient import TestClient
+
+from api_models import FastJSONResponse, StoryDetailResponse, StoryListResponse
+
+NB_SCENES = 40
+NB_CHARS = 6
+NB_STORIES = 200
+
+
+def sample_story(index: int = 0) -> dict:
+    story_id = f"story-{index:05d}"
+    return {
+        "id": story_id,
+        "user_id": "user-1",
+        "title": f"The Crimson Jesters {index}",
+        "nb_scenes": NB_SCENES,
+        "nb_chars": NB_CHARS,
+        "story_mode": "adventure",
+        "cover_image_url": f"https://example.com/covers/{story_id}.png",
+        "background_story": "The city of Veridia was once known for its gleaming towers. " * 20,
+        "scenes_paragraph": "A series of bizarre, highly theatrical crimes terrorized the populace. " * 40,
+        "created_at": "2025-06-01T12:00:00+00:00",
+        "updated_at": "2025-06-02T08:30:00+00:00",
+        "status": "completed",
+        "characters": [
+            {
+                "id": f"{story_id}-char-{c}",
+                "name": f"Character {c}",
+                "description": "A mysterious jester with a split black and white face. " * 5,
+                "image_url": f"https://example.com/chars/{story_id}-{c}.png",
+                "analysis": "Tall, theatrical, always smiling. " * 10
+            }
+            for c in range(NB_CHARS)
+        ],
+        "scenes": [
+            {
+                "id": f"{story_id}-scene-{s}",
+                "title": f"Scene {s}",
+                "narrative_text": "The detective follows the trail of red cards through the rain. " * 8,
+                "scene_number": s + 1,
+                "image_prompt": "Noir city street at night, rain, red playing card on the ground. " * 3,
+                "image_url": f"https://example.com/scenes/{story_id}-{s}.png",
+                "paragraph": "Chapter text. " * 30
+            }
+            for s in range(NB_SCENES)
+        ]
+    }
+
+
+def sample_listing() -> dict:
+    stories = []
+    for i in range(NB_STORIES):
+        story = sample_story(i)
+        stories.append({key: story[key] for key in (
+            "id", "title", "status", "cover_image_url", "created_at", "updated_at",
+            "nb_scenes", "nb_chars", "story_mode"
+        )})
+    return {"success": True, "stories": stories, "message": f"Found {len(stories)} stories"}
+
+
+def build_app(payloads: dict) -> FastAPI:
+    """One route per (payload, path) pair, declared like the real endpoints"""
+    app = FastAPI()
+    for name, (content, model) in payloads.items():
+        def endpoint(content=content):
+            async def handler():
+                return content
+            return handler
+        app.add_api_route(f"/{name}/old", endpoint(), methods=["GET"])
+        app.add_api_route(f"/{name}/model", endpoint(), methods=["GET"],
+                          response_model=model, response_model_exclude_unset=True)
+        app.add_api_route(f"/{name}/fast", endpoint(), methods=["GET"], response_class=FastJSONResponse)
+    return app
+
+
+def route_serializer(route: APIRoute, loop: asyncio.AbstractEventLoop):
+    """The serialization step of fastapi.routing's request handler for this route"""
+    use_dump_json = route.response_field is not None and isinstance(route.response_class, DefaultPlaceholder)
+    response_class = route.response_class.value if isinstance(route.response_class, DefaultPlaceholder) else route.response_class
+
+    def serialize(content) -> bytes:
+        body = loop.run_until_complete(serialize_response(
+            field=route.response_field,
+            response_content=content,
+            exclude_unset=route.response_model_exclude_unset,
+            dump_json=use_dump_json
+        ))
+        if use_dump_json:
+            return Response(content=body, media_type="application/json").body
+        return response_class(body).body
+    return serialize
+
+
+def measure(serialize, content, repeats: int):
+    seconds = timeit.timeit(lambda: serialize(content), number=repeats) / repeats
+    tracemalloc.start()
+    serialize(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak, len(serialize(content))
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    payloads = {
+        "story": ({"success": True, "story": sample_story()}, StoryDetailResponse),
+        "listing": (sample_listing(), StoryListResponse)
+    }
+    app = build_app(payloads)
+    routes = {route.path: route for route in app.routes if isinstance(route, APIRoute)}
+    loop = asyncio.new_event_loop()
+    with TestClient(app) as client:
+        for name, (content, _) in payloads.items():
+            print(f"\n📊 {name} ({repeats} runs)")
+            baseline = request_baseline = None
+            for label, variant in (
+                ("dict + JSONResponse", "old"),
+                ("response_model (dump_json)", "model"),
+                ("dict + FastJSONResponse", "fast")
+            ):
+                path = f"/{name}/{variant}"
+                seconds, peak, size = measure(route_serializer(routes[path], loop), content, repeats)
+                request_seconds = timeit.timeit(lambda: client.get(path), number=repeats) / repeats
+                baseline = baseline or seconds
+                request_baseline = request_baseline or request_seconds
+                print(f"   {label:<28} serialize {seconds * 1000:7.3f} ms {baseline / seconds:5.1f}x  "
+                      f"peak {peak / 1024:7.1f} KiB  {size} bytes  |  "
+                      f"request {request_seconds * 1000:7.3f} ms {request_baseline / request_seconds:5.1f}x")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
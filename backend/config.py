@@ -1,6 +1,7 @@
 from dotenv import load_dotenv
 from supabase import create_client
 import os
+import secrets
 
 load_dotenv()  # load variables from .env into environment
 
@@ -14,16 +15,131 @@ BUCKET_NAME = os.getenv("BUCKET_NAME")
 ASSETS_FOLDER = "/assets/"
 OUTPUT_FOLDER = "/output/"
 
-# Create main client with anon key for general operations
-supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+# Local runtime state (journals, caches, SQLite database) lives here
+DATA_DIR = os.getenv("DATA_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
 
-# Create service client with service role key for storage operations (bypasses RLS)
+# Read-through cache in front of the DAOs (see dao_cache.py)
+DAO_CACHE_ENABLED = os.getenv("DAO_CACHE_ENABLED", "true").lower() == "true"
+DAO_CACHE_MAX_ENTRIES = int(os.getenv("DAO_CACHE_MAX_ENTRIES", "1024"))
+DAO_CACHE_TTL_SECONDS = float(os.getenv("DAO_CACHE_TTL_SECONDS", "30"))
+
+# Credit ledger (see credit_ledger.py)
+CREDIT_LEDGER_FLUSH_INTERVAL = float(os.getenv("CREDIT_LEDGER_FLUSH_INTERVAL", "2"))
+CREDIT_LEDGER_BATCH_SIZE = int(os.getenv("CREDIT_LEDGER_BATCH_SIZE", "50"))
+CREDITS_PER_SCENE_IMAGE = int(os.getenv("CREDITS_PER_SCENE_IMAGE", "1"))
+
+# Write-behind buffer for scene image URLs and story status (see write_buffer.py)
+WRITE_BUFFER_ENABLED = os.getenv("WRITE_BUFFER_ENABLED", "true").lower() == "true"
+WRITE_BUFFER_FLUSH_INTERVAL = float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL", "0.5"))
+WRITE_BUFFER_JOURNAL_PATH = os.getenv("WRITE_BUFFER_JOURNAL_PATH") or os.path.join(DATA_DIR, "write_buffer.journal")
+
+# Backends: "supabase" (default) or "sqlite" for the database, "supabase" or "local" for storage.
+# sqlite + local runs the whole API on one machine without a Supabase project.
+DB_BACKEND = os.getenv("DB_BACKEND", "supabase").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH") or os.path.join(DATA_DIR, "creaition.db")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR") or os.path.join(DATA_DIR, "storage")
+# Public base URL the API serves local storage objects from (fast_api.py mounts it at /storage)
+API_ROOT = (API_URL or "http://localhost:8002/api/").rstrip("/").removesuffix("/api")
+LOCAL_STORAGE_URL = (os.getenv("LOCAL_STORAGE_URL") or f"{API_ROOT}/storage").rstrip("/")
+
+# Per-request DAO query instrumentation (see query_stats.py)
+QUERY_STATS_ENABLED = os.getenv("QUERY_STATS_ENABLED", "true").lower() == "true"
+# Flag a request as N+1 when it runs the same query shape more than this many times
+QUERY_STATS_N_PLUS_ONE_THRESHOLD = int(os.getenv("QUERY_STATS_N_PLUS_ONE_THRESHOLD", "5"))
+# Add X-DAO-Queries / X-DAO-N-Plus-One debug headers to every response
+QUERY_STATS_DEBUG_HEADERS = os.getenv("QUERY_STATS_DEBUG_HEADERS", "false").lower() == "true"
+# /api/debug/queries endpoints require this token in X-Admin-Token; they are disabled while it is empty
+QUERY_STATS_ADMIN_TOKEN = os.getenv("QUERY_STATS_ADMIN_TOKEN", "")
+
+# Shared HTTP client for storage downloads (see http_client.py)
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "20"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+
+# Local disk cache for storage objects (see storage_cache.py)
+STORAGE_CACHE_ENABLED = os.getenv("STORAGE_CACHE_ENABLED", "true").lower() == "true"
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR") or os.path.join(DATA_DIR, "storage_cache")
+STORAGE_CACHE_MAX_BYTES = int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+STORAGE_CACHE_REVALIDATE_SECONDS = float(os.getenv("STORAGE_CACHE_REVALIDATE_SECONDS", "300"))
+
+# Presigned direct-to-storage uploads (see uploads.py)
+UPLOAD_PRESIGN_TTL_SECONDS = int(os.getenv("UPLOAD_PRESIGN_TTL_SECONDS", "900"))
+UPLOAD_MAX_DIMENSION = int(os.getenv("UPLOAD_MAX_DIMENSION", "2048"))
+# Hard cap on upload request bodies, and the chunk size uploads are forwarded to storage in
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+# Batch character uploads: files per request and how many are normalized/uploaded at once
+MAX_BATCH_UPLOAD_FILES = int(os.getenv("MAX_BATCH_UPLOAD_FILES", "12"))
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "4"))
+# Signs local-storage upload URLs; a random per-process secret unless set
+UPLOAD_SIGNING_SECRET = os.getenv("UPLOAD_SIGNING_SECRET") or secrets.token_hex(32)
+
+# Most stories one POST /api/stories/batch request may ask for
+MAX_BATCH_STORIES = int(os.getenv("MAX_BATCH_STORIES", "100"))
+
+# Responses at least this large are gzip-compressed for clients that accept it
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+
+# Story package export: images fetched in parallel, and the time budget for one export
+EXPORT_FETCH_CONCURRENCY = int(os.getenv("EXPORT_FETCH_CONCURRENCY", "6"))
+EXPORT_DEADLINE_SECONDS = float(os.getenv("EXPORT_DEADLINE_SECONDS", "60"))
+# Stories read per page by the library export
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "25"))
+# Prebuilt packages of completed stories (see package_store.py)
+PACKAGE_CACHE_ENABLED = os.getenv("PACKAGE_CACHE_ENABLED", "true").lower() == "true"
+PACKAGE_CACHE_DIR = os.getenv("PACKAGE_CACHE_DIR") or os.path.join(DATA_DIR, "packages")
+
+# Expose GET /metrics (Prometheus text format, see metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Generation run tracing (see tracing.py): timelines kept per story, and an
+# optional collector URL every finished trace is POSTed to as JSON
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_DIR = os.getenv("TRACE_DIR") or os.path.join(DATA_DIR, "traces")
+TRACE_MAX_RUNS = int(os.getenv("TRACE_MAX_RUNS", "20"))
+TRACE_EXPORT_URL = os.getenv("TRACE_EXPORT_URL", "")
+
+# Event loop watchdog (see loop_monitor.py): heartbeat interval, and how long the
+# loop may go without a heartbeat before the blocking stack is captured
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.5"))
+# Token for /api/debug/loop, sent in X-Admin-Token; stall reports carry stacks and request paths
+LOOP_MONITOR_ADMIN_TOKEN = os.getenv("LOOP_MONITOR_ADMIN_TOKEN", "")
+
+# Per-request sampling profiler (see profiler.py); disabled unless an admin token is set.
+# Requests sending it in X-Profile are profiled; collapsed stacks are kept under PROFILE_DIR
+PROFILER_ADMIN_TOKEN = os.getenv("PROFILER_ADMIN_TOKEN", "")
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(DATA_DIR, "profiles")
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "50"))
+
+# Logging (see app_logging.py): level, per-module levels ("image_to_image=DEBUG,dao=WARNING"),
+# text or json lines, the keep rate for sampled lines, and the writer queue bound
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Log full model responses and image byte dumps (very large; debugging only)
+LOG_DEBUG_PAYLOADS = os.getenv("LOG_DEBUG_PAYLOADS", "false").lower() == "true"
+
+supabase = None
 supabase_service = None
-if SUPABASE_SERVICE_KEY:
-    supabase_service = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-    print("✅ Supabase service client initialized for storage operations")
-else:
-    print("⚠️  Warning: SUPABASE_SERVICE_KEY not found - storage uploads may fail due to RLS policies")
+if DB_BACKEND == "supabase" or STORAGE_BACKEND == "supabase":
+    # Create main client with anon key for general operations
+    supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+
+    # Create service client with service role key for storage operations (bypasses RLS)
+    if SUPABASE_SERVICE_KEY:
+        supabase_service = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+        print("✅ Supabase service client initialized for storage operations")
+    else:
+        print("⚠️  Warning: SUPABASE_SERVICE_KEY not found - storage uploads may fail due to RLS policies")
 
 # Safe import and initialization of genai
 try:
@@ -0,0 +1,263 @@
+"""
+Server-side credit ledger for CreAItion
+Reserves credits atomically when a generation job starts, settles or refunds
+them when it ends, and writes ledger entries to the database in batches.
+Balances are served from an in-process aggregate so credit checks never add
+a database round trip to the generation hot path.
+"""
+
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class InsufficientCreditsError(Exception):
+    """Raised when a reservation exceeds the user's available credits"""
+
+    def __init__(self, email: str, requested: int, available: int):
+        super().__init__(f"Insufficient credits for {email}: requested {requested}, available {available}")
+        self.email = email
+        self.requested = requested
+        self.available = available
+
+
+class CreditReservation:
+    def __init__(self, email: str, user_id: str, amount: int, job_id: str):
+        self.id = str(uuid.uuid4())
+        self.email = email
+        self.user_id = user_id
+        self.amount = amount
+        self.job_id = job_id
+        self.created_at = datetime.utcnow()
+        self.closed = False
+
+
+class _Account:
+    """Cached aggregate for one user: last persisted balance plus in-memory changes"""
+
+    def __init__(self, user_id: str, persisted: int):
+        self.user_id = user_id
+        self.persisted = persisted  # credits column as last read from / written to the database
+        self.pending = 0            # sum of deltas queued but not yet flushed
+        self.held = 0               # sum of open reservations
+        self.loaded_at = time.monotonic()
+
+    @property
+    def available(self) -> int:
+        return self.persisted + self.pending - self.held
+
+
+class CreditLedger:
+    """In-process credit ledger with batched, write-behind persistence
+
+    reserve() only touches memory (under a lock), so two concurrent jobs for the
+    same user can never both spend the same credits in this process. Entries
+    are flushed by a background thread every flush_interval seconds, or as soon
+    as batch_size entries are queued; the database function applies them in a
+    single transaction and returns the new balances.
+    """
+
+    def __init__(self, user_dao, flush_interval: float = 2.0, batch_size: int = 50, balance_ttl: float = 60.0):
+        self.user_dao = user_dao
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.balance_ttl = balance_ttl
+        self._accounts: Dict[str, _Account] = {}
+        self._reservations: Dict[str, CreditReservation] = {}
+        self._queue: List[Dict[str, Any]] = []
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._flush_epoch = 0
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # Balances
+
+    def _load_account(self, email: str) -> Optional[_Account]:
+        """Return the cached aggregate for email, (re)loading it from the database when stale"""
+        with self._lock:
+            account = self._accounts.get(email)
+            if account and time.monotonic() - account.loaded_at < self.balance_ttl:
+                return account
+            epoch = self._flush_epoch
+
+        user = self.user_dao.get_user_by_email(email, use_cache=False)
+        if not user:
+            return account
+
+        with self._lock:
+            account = self._accounts.get(email)
+            if account is None:
+                account = _Account(str(user.id), user.credits)
+                self._accounts[email] = account
+            elif epoch == self._flush_epoch:
+                # Only trust the fresh row if no flush landed while we were reading it
+                account.persisted = user.credits
+                account.loaded_at = time.monotonic()
+            return account
+
+    def balance(self, email: str) -> Optional[int]:
+        """Available credits (persisted + unflushed changes - open reservations)"""
+        account = self._load_account(email)
+        return account.available if account else None
+
+    def balance_details(self, email: str) -> Optional[Dict[str, int]]:
+        account = self._load_account(email)
+        if not account:
+            return None
+        with self._lock:
+            return {
+                "credits": account.available,
+                "held": account.held,
+                "pending": account.pending
+            }
+
+    # Reservations
+
+    def reserve(self, email: str, amount: int, job_id: str) -> CreditReservation:
+        """Atomically hold amount credits for a job, raising InsufficientCreditsError if short"""
+        account = self._load_account(email)
+        if not account:
+            raise LookupError(f"User not found: {email}")
+
+        with self._lock:
+            if account.available < amount:
+                raise InsufficientCreditsError(email, amount, account.available)
+            account.held += amount
+            reservation = CreditReservation(email, account.user_id, amount, job_id)
+            self._reservations[reservation.id] = reservation
+            self._enqueue(reservation, "reserve", amount, 0)
+        return reservation
+
+    def settle(self, reservation: CreditReservation, used: Optional[int] = None):
+        """Charge used credits (default: the whole reservation) and release the rest"""
+        used = reservation.amount if used is None else max(0, min(used, reservation.amount))
+        with self._lock:
+            if not self._close(reservation):
+                return
+            account = self._accounts[reservation.email]
+            account.pending -= used
+            self._enqueue(reservation, "settle", used, -used)
+            if used < reservation.amount:
+                self._enqueue(reservation, "refund", reservation.amount - used, 0)
+        self._maybe_wake()
+
+    def refund(self, reservation: CreditReservation):
+        """Release the whole reservation without charging anything"""
+        with self._lock:
+            if not self._close(reservation):
+                return
+            self._enqueue(reservation, "refund", reservation.amount, 0)
+        self._maybe_wake()
+
+    def _close(self, reservation: CreditReservation) -> bool:
+        """Remove an open reservation's hold; returns False if it was already closed"""
+        if reservation.closed or self._reservations.pop(reservation.id, None) is None:
+            return False
+        reservation.closed = True
+        self._accounts[reservation.email].held -= reservation.amount
+        return True
+
+    def _enqueue(self, reservation: CreditReservation, kind: str, amount: int, delta: int):
+        self._queue.append({
+            "id": str(uuid.uuid4()),
+            "user_id": reservation.user_id,
+            "email": reservation.email,
+            "reservation_id": reservation.id,
+            "job_id": reservation.job_id,
+            "kind": kind,
+            "amount": amount,
+            "delta": delta,
+            "created_at": datetime.utcnow().isoformat()
+        })
+
+    def _maybe_wake(self):
+        if len(self._queue) >= self.batch_size:
+            self._wake_event.set()
+
+    # Absolute updates
+
+    def set_balance(self, email: str, credits: int) -> bool:
+        """Set an absolute balance (admin/top-up path); pending entries are flushed first"""
+        with self._flush_lock:
+            # Writing the absolute balance over unflushed entries would lose or double-apply them
+            if not self._flush_locked():
+                logger.warning(f"⚠️  Not setting credits for {email}: pending ledger entries could not be flushed")
+                return False
+            success = self.user_dao.update_user_credits(email, credits)
+            with self._lock:
+                account = self._accounts.get(email)
+                if account and success:
+                    # Open reservations stay held against the new balance
+                    account.persisted = credits
+                    account.loaded_at = time.monotonic()
+            return success
+
+    # Persistence
+
+    def flush(self) -> bool:
+        """Write every queued ledger entry in one batch and refresh cached balances"""
+        with self._flush_lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> bool:
+        # Caller holds _flush_lock
+        with self._lock:
+            if not self._queue:
+                return True
+            batch = self._queue
+            self._queue = []
+
+        entries = [{k: v for k, v in entry.items() if k != "email"} for entry in batch]
+        balances = self.user_dao.record_credit_entries(entries)
+
+        with self._lock:
+            if balances is None:
+                # Keep the entries (in order) for the next attempt
+                self._queue = batch + self._queue
+                return False
+            self._flush_epoch += 1
+            flushed: Dict[str, int] = {}
+            for entry in batch:
+                flushed[entry["email"]] = flushed.get(entry["email"], 0) + entry["delta"]
+            for email, delta in flushed.items():
+                account = self._accounts.get(email)
+                if not account:
+                    continue
+                account.pending -= delta
+                if account.user_id in balances:
+                    account.persisted = balances[account.user_id]
+                    account.loaded_at = time.monotonic()
+            return True
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.flush_interval)
+            self._wake_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️  Credit ledger flush failed: {e}")
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="credit-ledger-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread and write out whatever is still queued"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
@@ -4,13 +4,40 @@ Handles all database operations for Story, User_Character, and scene entities
 """
 
 import uuid
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Sequence, Tuple
 from datetime import datetime
 from supabase import Client
 from User_Character import User_Character
 from Story import Story
 from Scene import Scene
 from User import User
+from dao_cache import EntityCache, CachedStoryDAO, CachedCharacterDAO, CachedSceneDAO, CachedUserDAO
+from write_buffer import SceneWriteBuffer, BufferedSceneDAO, BufferedStoryDAO
+from query_stats import QueryRecorder, instrument
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+# Column lists for partial updates
+STORY_UPDATE_COLUMNS = (
+    "title", "nb_scenes", "nb_chars", "story_mode", "cover_image_url",
+    "background_story", "scenes_paragraph", "updated_at"
+)
+CHARACTER_UPDATE_COLUMNS = ("story_id", "name", "description", "image_url", "analysis")
+
+
+def select_list(columns: Optional[Sequence[str]]) -> str:
+    """Column list for a select: the given (validated) columns, or every column"""
+    return ", ".join(columns) if columns else "*"
+
+
+def story_version(updated_at, scenes: List[Any], characters: List[Any]) -> str:
+    """Version token of a story from its updated_at, its scenes' (number, image URL, updated_at)
+    and its characters' (id, updated_at)"""
+    scene_state = sorted(tuple("" if value is None else str(value) for value in scene) for scene in scenes)
+    character_state = sorted(tuple("" if value is None else str(value) for value in character) for character in characters)
+    return f"{updated_at}|{scene_state}|{character_state}"
 
 
 class StoryDAO:
@@ -22,27 +49,16 @@ class StoryDAO:
         try:
             story_id = str(uuid.uuid4())
             story.id = story_id  # Set the ID on the story object
-            story_data = {
-                "id": story_id,
-                "user_id": story.user_id,
-                "title": story.title,
-                "nb_scenes": story.nb_scenes,
-                "nb_chars": story.nb_chars,
-                "story_mode": story.story_mode,
-                "cover_image_url": story.cover_image_url,
-                "background_story": story.background_story,
-                "scenes_paragraph": getattr(story, "scenes_paragraph", ""),
-                "status": "created",
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }
+            story.status = "created"
+            story.created_at = story.updated_at = datetime.utcnow().isoformat()
+            story_data = story.to_row()
             
             result = self.db.table("stories").insert(story_data).execute()
             if result.data:
                 return story_id
             return None
         except Exception as e:
-            print(f"Error creating story: {e}")
+            logger.error(f"Error creating story: {e}")
             return None
     
     def update_story_complete(self, story: Story) -> bool:
@@ -56,91 +72,127 @@ class StoryDAO:
             result = self.db.table("stories").update(update_data).eq("id", story.id).execute()
             return bool(result.data)
         except Exception as e:
-            print(f"Error updating story to complete: {e}")
+            logger.error(f"Error updating story to complete: {e}")
             return False
     
-    def update_story(self, story: Story) -> str:
-        """Update story with new details"""
+    def update_story_status(self, story_id: str, status: str) -> bool:
+        """Set the status of a story by ID"""
         try:
             update_data = {
-                "title": story.title,
-                "nb_scenes": story.nb_scenes,
-                "nb_chars": story.nb_chars,
-                "story_mode": story.story_mode,
-                "cover_image_url": story.cover_image_url,
-                "background_story": story.background_story,
-                "scenes_paragraph": getattr(story, "scenes_paragraph", ""),  # Add scenes_paragraph
-                "updated_at": story.updated_at.isoformat() if story.updated_at else None
+                "status": status,
+                "updated_at": datetime.utcnow().isoformat()
             }
             
+            result = self.db.table("stories").update(update_data).eq("id", story_id).execute()
+            return bool(result.data)
+        except Exception as e:
+            logger.error(f"Error updating story status: {e}")
+            return False
+    
+    def update_story(self, story: Story) -> str:
+        """Update story with new details"""
+        try:
+            update_data = story.to_row(STORY_UPDATE_COLUMNS)
+            
             result = self.db.table("stories").update(update_data).eq("id", story.id).execute()
             if result.data:
                 return str(story.id)
             return None
         except Exception as e:
-            print(f"Error updating story: {e}")
+            logger.error(f"Error updating story: {e}")
             return None
     
-    def get_story(self, story_id: str) -> Optional[Story]:
-        """Get story by ID"""
+    def get_story(self, story_id: str, use_cache: bool = True, columns: Optional[Sequence[str]] = None) -> Optional[Story]:
+        """Get story by ID, reading only columns when given (use_cache only matters on the cached wrapper)"""
         try:
             result = self.db.table("stories")\
-                .select("*")\
+                .select(select_list(columns))\
                 .eq("id", story_id)\
                 .execute()
             
             if result.data:
-                story_data = result.data[0]
-                story = Story(
-                    user_id=story_data.get("user_id", ""),
-                    title=story_data.get("title", ""),
-                    nb_scenes=story_data.get("nb_scenes", 0),
-                    nb_chars=story_data.get("nb_chars", 0),
-                    story_mode=story_data.get("story_mode", ""),
-                    cover_image_url=story_data.get("cover_image_url", "")
-                )
-                story.id = story_data.get("id")
-                story.background_story = story_data.get("background_story", "")
-                story.scenes_paragraph = story_data.get("scenes_paragraph", "")  # Add scenes_paragraph
-                story.created_at = story_data.get("created_at")
-                story.updated_at = story_data.get("updated_at")
-                return story
+                return Story.from_row(result.data[0])
             return None
         except Exception as e:
-            print(f"Error fetching story: {e}")
+            logger.error(f"Error fetching story: {e}")
             return None
     
-    def get_user_stories(self, user_id: str) -> List[Story]:
-        """Get all stories for a user"""
+    def get_stories(self, story_ids: List[str], columns: Optional[Sequence[str]] = None) -> List[Story]:
+        """Get several stories by ID in one query (in no particular order)"""
+        if not story_ids:
+            return []
         try:
             result = self.db.table("stories")\
+                .select(select_list(columns))\
+                .in_("id", story_ids)\
+                .execute()
+            
+            return Story.from_rows(result.data)
+        except Exception as e:
+            logger.error(f"Error fetching stories: {e}")
+            return []
+    
+    def get_user_stories(self, user_id: str, limit: Optional[int] = None, offset: int = 0) -> List[Story]:
+        """Get all stories for a user, newest first (one page of them when limit is given)"""
+        try:
+            query = self.db.table("stories")\
                 .select("*")\
                 .eq("user_id", user_id)\
                 .order("created_at", desc=True)\
+                .order("id")
+            if limit is not None:
+                query = query.range(offset, offset + limit - 1)
+            result = query.execute()
+            
+            return Story.from_rows(result.data)
+        except Exception as e:
+            logger.error(f"Error fetching user stories: {e}")
+            return []
+    
+    def get_story_version(self, story_id: str) -> Optional[str]:
+        """Cheap change token for a story, its scenes' images and its characters (None if not found)"""
+        try:
+            result = self.db.table("stories")\
+                .select("updated_at, scenes(scene_number, image_url, updated_at), user_character(id, updated_at)")\
+                .eq("id", story_id)\
                 .execute()
             
-            stories = []
-            if result.data:
-                for story_data in result.data:
-                    story = Story(
-                        user_id=story_data.get("user_id", ""),
-                        title=story_data.get("title", ""),
-                        nb_scenes=story_data.get("nb_scenes", 0),
-                        nb_chars=story_data.get("nb_chars", 0),
-                        story_mode=story_data.get("story_mode", ""),
-                        cover_image_url=story_data.get("cover_image_url", "")
-                    )
-                    story.created_at = story_data.get("created_at")
-                    story.updated_at = story_data.get("updated_at")
-                    story.status = story_data.get("status", "created")
-                    story.id = story_data.get("id")
-                    story.background_story = story_data.get("background_story", "")
-                    stories.append(story)
+            if not result.data:
+                return None
+            row = result.data[0]
+            scenes = [(s["scene_number"], s.get("image_url"), s.get("updated_at")) for s in row.get("scenes") or []]
+            characters = [(c["id"], c.get("updated_at")) for c in row.get("user_character") or []]
+            return story_version(row["updated_at"], scenes, characters)
+        except Exception as e:
+            logger.error(f"Error fetching story version: {e}")
+            return None
+    
+    def get_user_stories_version(self, user_id: str) -> Optional[str]:
+        """Cheap change token for a user's story listing"""
+        try:
+            result = self.db.table("stories")\
+                .select("id, updated_at")\
+                .eq("user_id", user_id)\
+                .order("id")\
+                .execute()
             
-            return stories
+            return "|".join(f"{row['id']}:{row['updated_at']}" for row in result.data)
         except Exception as e:
-            print(f"Error fetching user stories: {e}")
-            return []
+            logger.error(f"Error fetching user stories version: {e}")
+            return None
+    
+    def count_user_stories(self, user_id: str) -> int:
+        """Number of stories a user has"""
+        try:
+            result = self.db.table("stories")\
+                .select("id", count="exact")\
+                .eq("user_id", user_id)\
+                .limit(1)\
+                .execute()
+            return result.count or 0
+        except Exception as e:
+            logger.error(f"Error counting user stories: {e}")
+            return 0
     
     def get_all_stories(self) -> List[Story]:
         """Get all stories from all users"""
@@ -150,26 +202,20 @@ class StoryDAO:
                 .order("created_at", desc=True)\
                 .execute()
             
-            stories = []
-            if result.data:
-                for story_data in result.data:
-                    story = Story(
-                        user_id=story_data.get("user_id", ""),
-                        title=story_data.get("title", ""),
-                        nb_scenes=story_data.get("nb_scenes", 0),
-                        nb_chars=story_data.get("nb_chars", 0),
-                        story_mode=story_data.get("story_mode", ""),
-                        cover_image_url=story_data.get("cover_image_url", "")
-                    )
-                    story.id = story_data.get("id")
-                    story.background_story = story_data.get("background_story", "")
-                    stories.append(story)
-            
-            return stories
+            return Story.from_rows(result.data)
         except Exception as e:
-            print(f"Error fetching all stories: {e}")
+            logger.error(f"Error fetching all stories: {e}")
             return []
         
+    def delete_all_stories(self) -> int:
+        """Delete every story (demo reset); returns the number of deleted rows"""
+        try:
+            result = self.db.table("stories").delete().neq("id", "").execute()
+            return len(result.data) if result.data else 0
+        except Exception as e:
+            logger.error(f"Error deleting stories: {e}")
+            return 0
+        
     def get_all_story_titles(self):
         """Get all story titles from database"""
         try:
@@ -177,7 +223,7 @@ class StoryDAO:
             all_stories = self.get_all_stories()
             return {story.title.lower() for story in all_stories}
         except Exception as e:
-            print(f"Error fetching story titles from database: {e}")
+            logger.error(f"Error fetching story titles from database: {e}")
             return set()
 
 
@@ -191,39 +237,45 @@ class CharacterDAO:
             char_id = str(uuid.uuid4())
             character.id = char_id  # Set the ID on the character object
             # Use the story_id from the character object if available, otherwise use the parameter
-            story_id_to_use = character.story_id if character.story_id else story_id
-            char_data = {
-                "id": char_id,
-                "story_id": story_id_to_use,
-                "name": character.name,
-                "description": character.description,
-                "image_url": character.image_url,  # Store image_url in image_url field
-                "analysis": character.analysis
-            }
+            if not character.story_id:
+                character.story_id = story_id
+            char_data = character.to_row()
             
             result = self.db.table("user_character").insert(char_data).execute()
             if result.data:
                 return char_id
             return None
         except Exception as e:
-            print(f"Error creating character: {e}")
+            logger.error(f"Error creating character: {e}")
             return None
     
+    def create_characters(self, characters: List[User_Character], story_id: str) -> List[str]:
+        """Create several characters for a story in a single insert"""
+        try:
+            if not characters:
+                return []
+            for character in characters:
+                character.id = str(uuid.uuid4())
+                if not character.story_id:
+                    character.story_id = story_id
+            
+            result = self.db.table("user_character").insert([c.to_row() for c in characters]).execute()
+            if result.data:
+                return [character.id for character in characters]
+            return []
+        except Exception as e:
+            logger.error(f"Error creating characters: {e}")
+            return []
+    
     def update_character(self, character: User_Character) -> bool:
         """Update a single character"""
         try:
-            update_data = {
-                "story_id": character.story_id,  # Include story_id in updates
-                "name": character.name,
-                "description": character.description,
-                "image_url": character.image_url,  # Store image_url in image_url field
-                "analysis": character.analysis
-            }
+            update_data = character.to_row(CHARACTER_UPDATE_COLUMNS)
             
             result = self.db.table("user_character").update(update_data).eq("id", character.id).execute()
             return bool(result.data)
         except Exception as e:
-            print(f"Error updating character: {e}")
+            logger.error(f"Error updating character: {e}")
             return False
     
     def update_characters(self, characters: List[User_Character]) -> bool:
@@ -234,19 +286,17 @@ class CharacterDAO:
                     return False
             return True
         except Exception as e:
-            print(f"Error updating characters: {e}")
+            logger.error(f"Error updating characters: {e}")
             return False
     
     def update_character_analysis(self, character: User_Character) -> bool:
         """Update character with AI analysis"""
         try:
-            update_data = {
-                "analysis": character.analysis
-            }
+            update_data = character.to_row(("analysis",))
             result = self.db.table("user_character").update(update_data).eq("id", character.id).execute()
             return bool(result.data)
         except Exception as e:
-            print(f"Error updating character analysis: {e}")
+            logger.error(f"Error updating character analysis: {e}")
             return False
     
     def update_characters_analysis(self, characters: List[User_Character]) -> bool:
@@ -254,36 +304,38 @@ class CharacterDAO:
             for character in characters:
                 self.update_character_analysis(character)
         except Exception as e:
-            print(f"Error updating characters analysis: {e}")
+            logger.error(f"Error updating characters analysis: {e}")
             return False
     
-    def get_story_characters(self, story_id: str) -> List[User_Character]:
-        """Get all characters for a story"""
+    def get_characters_for_stories(self, story_ids: List[str], columns: Optional[Sequence[str]] = None) -> Dict[str, List[User_Character]]:
+        """Characters of several stories in one query, by story ID (columns, when given, must include story_id)"""
+        characters_by_story: Dict[str, List[User_Character]] = {story_id: [] for story_id in story_ids}
+        if not story_ids:
+            return characters_by_story
         try:
             result = self.db.table("user_character")\
-                .select("*")\
-                .eq("story_id", story_id)\
+                .select(select_list(columns))\
+                .in_("story_id", story_ids)\
                 .execute()
             
-            characters = []
-            if result.data:
-                for char_data in result.data:
-                    print("char: ", char_data)
-                    character = User_Character(
-                        char_data.get("story_id", ""),  # story_id
-                        char_data.get("image_url", ""),  # image_url
-                        char_data.get("name", ""),      # name
-                        char_data.get("description", "")  # description
-                    )
-                    character.id = char_data.get("id")
-                    # Add the analysis if it exists
-                    if char_data.get("analysis"):
-                        character.analysis = char_data.get("analysis")
-                    characters.append(character)
+            for character in User_Character.from_rows(result.data):
+                characters_by_story.setdefault(character.story_id, []).append(character)
+            return characters_by_story
+        except Exception as e:
+            logger.error(f"Error fetching characters for stories: {e}")
+            return characters_by_story
+    
+    def get_story_characters(self, story_id: str, use_cache: bool = True, columns: Optional[Sequence[str]] = None) -> List[User_Character]:
+        """Get all characters for a story, reading only columns when given (use_cache only matters on the cached wrapper)"""
+        try:
+            result = self.db.table("user_character")\
+                .select(select_list(columns))\
+                .eq("story_id", story_id)\
+                .execute()
             
-            return characters
+            return User_Character.from_rows(result.data)
         except Exception as e:
-            print(f"Error fetching story characters: {e}")
+            logger.error(f"Error fetching story characters: {e}")
             return []
 
         
@@ -297,55 +349,70 @@ class SceneDAO:
         try:
             scene_id = str(uuid.uuid4())
             scene.id = scene_id  # Set the ID on the scene object
-            scene_data = {
-                "id": scene_id,
-                "story_id": story_id,
-                "scene_number": scene_number,
-                "title": scene.title,
-                "narrative_text": scene.narrative_text,
-                "image_prompt": scene.image_prompt,
-                "image_url": scene.image_url,
-                "paragraph": scene.paragraph,
-                "created_at": datetime.utcnow().isoformat()
-            }
+            scene.story_id = story_id
+            scene.scene_number = scene_number
+            scene_data = scene.to_row()
+            scene_data["created_at"] = datetime.utcnow().isoformat()
             
             result = self.db.table("scenes").insert(scene_data).execute()
             if result.data:
                 return scene_id
             return None
         except Exception as e:
-            print(f"Error creating scene: {e}")
+            logger.error(f"Error creating scene: {e}")
             return None
     
-    def get_story_scenes(self, story_id: str) -> List[Scene]:
-        """Get all scenes for a story, ordered by scene number"""
+    def get_story_scenes(self, story_id: str, use_cache: bool = True, columns: Optional[Sequence[str]] = None) -> List[Scene]:
+        """Get all scenes for a story, ordered by scene number, reading only columns when given
+        (use_cache only matters on the cached wrapper)"""
         try:
             result = self.db.table("scenes")\
-                .select("*")\
+                .select(select_list(columns))\
                 .eq("story_id", story_id)\
                 .order("scene_number")\
                 .execute()
             
-            scenes = []
-            if result.data:
-                for scene_data in result.data:
-                    # Create a scene object with the available data
-                    scene = Scene(
-                        title=scene_data.get("title", ""),
-                        narrative_text=scene_data.get("narrative_text", ""),
-                        scene_number=scene_data.get("scene_number", 0),
-                        image_prompt=scene_data.get("image_prompt", "")
-                    )
-                    scene.id = scene_data.get("id")
-                    scene.image_url = scene_data.get("image_url", "")
-                    scene.paragraph = scene_data.get("paragraph", "")
-                    scenes.append(scene)
-            
-            return scenes
+            return Scene.from_rows(result.data)
         except Exception as e:
-            print(f"Error fetching story scenes: {e}")
+            logger.error(f"Error fetching story scenes: {e}")
             return []
     
+    def get_scenes_for_stories(self, story_ids: List[str], columns: Optional[Sequence[str]] = None) -> Dict[str, List[Scene]]:
+        """Scenes of several stories in one query, by story ID and ordered by scene number
+        (columns, when given, must include story_id)"""
+        scenes_by_story: Dict[str, List[Scene]] = {story_id: [] for story_id in story_ids}
+        if not story_ids:
+            return scenes_by_story
+        try:
+            result = self.db.table("scenes")\
+                .select(select_list(columns))\
+                .in_("story_id", story_ids)\
+                .order("story_id")\
+                .order("scene_number")\
+                .execute()
+            
+            for scene in Scene.from_rows(result.data):
+                scenes_by_story.setdefault(scene.story_id, []).append(scene)
+            return scenes_by_story
+        except Exception as e:
+            logger.error(f"Error fetching scenes for stories: {e}")
+            return scenes_by_story
+    
+    def get_scenes_since(self, story_id: str, since: Optional[int] = None) -> Tuple[List[Scene], int]:
+        """Scenes of a story changed after revision since (all of them if None), and the newest revision seen"""
+        try:
+            query = self.db.table("scenes")\
+                .select("*")\
+                .eq("story_id", story_id)
+            if since is not None:
+                query = query.gt("revision", since)
+            result = query.order("scene_number").execute()
+            
+            return Scene.from_rows(result.data), max([since or 0] + [row["revision"] for row in result.data])
+        except Exception as e:
+            logger.error(f"Error fetching changed scenes: {e}")
+            return [], since or 0
+    
     def update_scene_image_url(self, story_id: str, scene_number: int, image_url: str) -> bool:
         """Update the image_url for a specific scene"""
         try:
@@ -356,7 +423,24 @@ class SceneDAO:
                 .execute()
             return True
         except Exception as e:
-            print(f"Error updating scene image URL: {e}")
+            logger.error(f"Error updating scene image URL: {e}")
+            return False
+    
+    def update_scene_image_urls(self, story_id: str, image_urls: Dict[int, str]) -> bool:
+        """Update the image_url of several scenes of a story in a single request
+
+        Update only, like the SQLite backend: scenes deleted since the URLs
+        were queued are not recreated.
+        """
+        try:
+            rows = [
+                {"scene_number": scene_number, "image_url": image_url}
+                for scene_number, image_url in image_urls.items()
+            ]
+            self.db.rpc("update_scene_image_urls", {"p_story_id": story_id, "p_image_urls": rows}).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error updating scene image URLs: {e}")
             return False
     
     def delete_story_scenes(self, story_id: str) -> bool:
@@ -368,7 +452,7 @@ class SceneDAO:
                 .execute()
             return True
         except Exception as e:
-            print(f"Error deleting story scenes: {e}")
+            logger.error(f"Error deleting story scenes: {e}")
             return False
 
 
@@ -381,24 +465,19 @@ class UserDAO:
         try:
             user_id = str(uuid.uuid4())
             user.id = user_id
-            user_data = {
-                "id": user_id,
-                "username": user.username,
-                "email": user.email,
-                "credits": 999,  # Default 999 credits
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }
+            user.credits = 999  # Default 999 credits
+            user.created_at = user.updated_at = datetime.utcnow().isoformat()
+            user_data = user.to_row()
             
             result = self.db.table("users").insert(user_data).execute()
             return user_id if result.data else None
                 
         except Exception as e:
-            print(f"Error creating user: {e}")
+            logger.error(f"Error creating user: {e}")
             return None
     
-    def get_user_by_email(self, email: str) -> Optional[User]:
-        """Get user by email address"""
+    def get_user_by_email(self, email: str, use_cache: bool = True) -> Optional[User]:
+        """Get user by email address (use_cache only matters on the cached wrapper)"""
         try:
             result = self.db.table("users")\
                 .select("*")\
@@ -406,35 +485,37 @@ class UserDAO:
                 .execute()
             
             if result.data and len(result.data) > 0:
-                user_data = result.data[0]
-                user = User(
-                    id=user_data.get("id"),
-                    username=user_data.get("username"),
-                    email=user_data.get("email"),
-                    credits=user_data.get("credits", 999),
-                    created_at=user_data.get("created_at"),
-                    updated_at=user_data.get("updated_at")
-                )
-                return user
+                return User.from_row(result.data[0])
             return None
         except Exception as e:
-            print(f"Error getting user by email: {e}")
+            logger.error(f"Error getting user by email: {e}")
+            return None
+    
+    def get_user(self, user_id: str) -> Optional[User]:
+        """Get user by ID"""
+        try:
+            result = self.db.table("users")\
+                .select("*")\
+                .eq("id", user_id)\
+                .execute()
+            
+            if result.data:
+                return User.from_row(result.data[0])
+            return None
+        except Exception as e:
+            logger.error(f"Error getting user by id: {e}")
             return None
     
     def update_user(self, user: User) -> bool:
         """Update user information"""
         try:
-            update_data = {
-                "username": user.username,
-                "email": user.email,
-                "credits": user.credits,
-                "updated_at": datetime.utcnow().isoformat()
-            }
+            update_data = user.to_row(("username", "email", "credits"))
+            update_data["updated_at"] = datetime.utcnow().isoformat()
             
             result = self.db.table("users").update(update_data).eq("id", user.id).execute()
             return bool(result.data)
         except Exception as e:
-            print(f"Error updating user: {e}")
+            logger.error(f"Error updating user: {e}")
             return False
     
     def update_user_credits(self, email: str, credits: int) -> bool:
@@ -448,24 +529,103 @@ class UserDAO:
             result = self.db.table("users").update(update_data).eq("email", email).execute()
             return bool(result.data)
         except Exception as e:
-            print(f"Error updating user credits: {e}")
+            logger.error(f"Error updating user credits: {e}")
             return False
+    
+    def record_credit_entries(self, entries: List[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+        """Persist a batch of credit ledger entries and apply their deltas in one transaction
+        
+        Returns the new balance per user_id, or None if the batch was not written.
+        Entry ids make the call idempotent, so a failed batch can simply be retried.
+        """
+        try:
+            result = self.db.rpc("record_credit_entries", {"p_entries": entries}).execute()
+            return {str(row["user_id"]): row["credits"] for row in (result.data or [])}
+        except Exception as e:
+            logger.error(f"Error recording credit entries: {e}")
+            return None
 
 
 class DAOFactory:
-    """Factory class to create DAO instances"""
+    """Factory class to create DAO instances
     
-    def __init__(self, supabase_client: Client):
-        self.supabase_client = supabase_client
+    When an EntityCache is given, every DAO is wrapped in a read-through cache
+    for get_story, get_story_characters, get_story_scenes and get_user_by_email;
+    write methods on the same DAOs invalidate the affected entries.
+    
+    Once enable_write_buffer() has been called, scene image URL and story status
+    updates are queued in a SceneWriteBuffer and reads see the pending values.
+    
+    The DAO classes default to the Supabase implementations; for_sqlite() builds
+    a factory over the embedded SQLite ones instead (see sqlite_dao.py).
+    
+    With a QueryRecorder, every query the DAOs run is recorded per request
+    (see query_stats.py).
+    """
+    
+    story_dao_class = StoryDAO
+    character_dao_class = CharacterDAO
+    scene_dao_class = SceneDAO
+    user_dao_class = UserDAO
+    
+    def __init__(self, supabase_client: Client, cache: Optional[EntityCache] = None,
+                 recorder: Optional[QueryRecorder] = None):
+        self.supabase_client = instrument(supabase_client, recorder) if recorder else supabase_client
+        self.cache = cache
+        self.recorder = recorder
+        self.write_buffer: Optional[SceneWriteBuffer] = None
+    
+    @classmethod
+    def for_sqlite(cls, path: str, cache: Optional[EntityCache] = None,
+                   recorder: Optional[QueryRecorder] = None) -> "DAOFactory":
+        """Create a factory backed by a local SQLite database file"""
+        from sqlite_dao import SqliteDatabase, SqliteStoryDAO, SqliteCharacterDAO, SqliteSceneDAO, SqliteUserDAO
+        factory = cls(SqliteDatabase(path), cache=cache, recorder=recorder)
+        factory.story_dao_class = SqliteStoryDAO
+        factory.character_dao_class = SqliteCharacterDAO
+        factory.scene_dao_class = SqliteSceneDAO
+        factory.user_dao_class = SqliteUserDAO
+        return factory
+    
+    def enable_write_buffer(self, journal_path: Optional[str] = None, flush_interval: float = 0.5) -> SceneWriteBuffer:
+        """Route scene image URL / story status writes through a write-behind buffer"""
+        self.write_buffer = SceneWriteBuffer(
+            self._scene_dao(),
+            self._story_dao(),
+            journal_path=journal_path,
+            flush_interval=flush_interval
+        )
+        return self.write_buffer
+    
+    def _story_dao(self) -> StoryDAO:
+        dao = self.story_dao_class(self.supabase_client)
+        return CachedStoryDAO(dao, self.cache) if self.cache else dao
+    
+    def _scene_dao(self) -> SceneDAO:
+        dao = self.scene_dao_class(self.supabase_client)
+        return CachedSceneDAO(dao, self.cache) if self.cache else dao
     
     def get_story_dao(self) -> StoryDAO:
-        return StoryDAO(self.supabase_client)
+        dao = self._story_dao()
+        return BufferedStoryDAO(dao, self.write_buffer) if self.write_buffer else dao
     
     def get_character_dao(self) -> CharacterDAO:
-        return CharacterDAO(self.supabase_client)
+        dao = self.character_dao_class(self.supabase_client)
+        return CachedCharacterDAO(dao, self.cache) if self.cache else dao
     
     def get_scene_dao(self) -> SceneDAO:
-        return SceneDAO(self.supabase_client)
+        dao = self._scene_dao()
+        return BufferedSceneDAO(dao, self.write_buffer) if self.write_buffer else dao
     
     def get_user_dao(self) -> UserDAO:
-        return UserDAO(self.supabase_client)
+        dao = self.user_dao_class(self.supabase_client)
+        return CachedUserDAO(dao, self.cache) if self.cache else dao
+    
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Hit-rate statistics of the entity cache, or None when caching is off"""
+        return self.cache.stats() if self.cache else None
+    
+    def clear_cache(self):
+        """Drop every cached entity (e.g. after writes that bypass the DAOs)"""
+        if self.cache:
+            self.cache.clear()
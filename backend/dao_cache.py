@@ -0,0 +1,322 @@
+"""
+Read-through entity cache for the DAO layer
+Wraps the DAOs created by DAOFactory so repeated reads of the same story,
+characters, scenes or user row are served from memory until a write on the
+same DAO invalidates them or the entry expires
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class EntityCache:
+    """Thread-safe LRU cache with a per-entry TTL and hit/miss counters"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Generation and in-flight load count of keys being loaded; invalidating a
+        # key bumps its generation so a load that started earlier is not stored
+        self._loads: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: str):
+        """Return (found, value) for a key, dropping it if it has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key: str, value: Any):
+        """Store a value, evicting the least recently used entries when full"""
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def begin_load(self, key: str) -> int:
+        """Note that key is being read from the database; pass the returned
+        generation to finish_load once the read is over, whether or not it succeeded"""
+        with self._lock:
+            load = self._loads.setdefault(key, [0, 0])
+            load[1] += 1
+            return load[0]
+
+    def finish_load(self, key: str, generation: int, value: Any = None) -> bool:
+        """Store a loaded value unless key was invalidated while it was being read"""
+        with self._lock:
+            load = self._loads[key]
+            load[1] -= 1
+            if load[1] == 0:
+                del self._loads[key]
+            if value is None or load[0] != generation:
+                return False
+            self._store(key, value)
+            return True
+
+    def _bump(self, key: str):
+        load = self._loads.get(key)
+        if load is not None:
+            load[0] += 1
+
+    def invalidate(self, *keys: str):
+        """Drop the given keys"""
+        with self._lock:
+            for key in keys:
+                self._bump(key)
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def invalidate_prefix(self, prefix: str):
+        """Drop every key starting with prefix (used when the exact key is unknown)"""
+        with self._lock:
+            for key in [k for k in self._loads if k.startswith(prefix)]:
+                self._bump(key)
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for key in self._loads:
+                self._bump(key)
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit-rate statistics for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+class _CachedDAO:
+    """Base wrapper: delegates everything it does not override to the wrapped DAO"""
+
+    def __init__(self, dao, cache: EntityCache):
+        self._dao = dao
+        self._cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._dao, name)
+
+    def _read_through(self, key: str, loader: Callable[[], Any], use_cache: bool):
+        """Serve key from the cache or load it, caching only non-empty results"""
+        if use_cache:
+            found, value = self._cache.get(key)
+            if found:
+                return _copy_entity(value)
+        generation = self._cache.begin_load(key)
+        value = None
+        try:
+            value = loader()
+        finally:
+            self._cache.finish_load(key, generation, _copy_entity(value) if value else None)
+        return value
+
+    def _read_columns(self, key: str, loader: Callable[[Any], Any], columns, use_cache: bool):
+        """Like _read_through, but a read of only some columns is served from a cached
+        full entity when there is one and otherwise read from the database uncached"""
+        if columns is None:
+            return self._read_through(key, lambda: loader(None), use_cache)
+        if use_cache:
+            found, value = self._cache.get(key)
+            if found:
+                return _copy_entity(value)
+        return loader(columns)
+
+
+def _copy_entity(value):
+    """Shallow-copy an entity or list of entities so callers mutating the
+    returned objects never corrupt the cached copy"""
+    if isinstance(value, list):
+        return [copy.copy(item) for item in value]
+    return copy.copy(value)
+
+
+def story_key(story_id: str) -> str:
+    return f"story:{story_id}"
+
+
+def characters_key(story_id: str) -> str:
+    return f"characters:{story_id}"
+
+
+def scenes_key(story_id: str) -> str:
+    return f"scenes:{story_id}"
+
+
+def user_key(email: str) -> str:
+    return f"user:{email}"
+
+
+def version_key(story_id: str) -> str:
+    """Story version (StoryDAO.get_story_version) the cached story, characters and scenes were read at"""
+    return f"version:{story_id}"
+
+
+class CachedStoryDAO(_CachedDAO):
+    def get_story(self, story_id: str, use_cache: bool = True, columns=None):
+        """Get story by ID, served from the cache unless use_cache is False"""
+        return self._read_columns(story_key(story_id), lambda cols: self._dao.get_story(story_id, columns=cols), columns, use_cache)
+
+    def create_story(self, story):
+        story_id = self._dao.create_story(story)
+        if story_id:
+            self._cache.invalidate(story_key(story_id))
+        return story_id
+
+    def update_story(self, story):
+        result = self._dao.update_story(story)
+        self._cache.invalidate(story_key(story.id))
+        return result
+
+    def update_story_complete(self, story):
+        result = self._dao.update_story_complete(story)
+        self._cache.invalidate(story_key(story.id))
+        return result
+
+    def delete_all_stories(self):
+        result = self._dao.delete_all_stories()
+        self._cache.clear()
+        return result
+
+    def update_story_status(self, story_id: str, status: str):
+        result = self._dao.update_story_status(story_id, status)
+        self._cache.invalidate(story_key(story_id))
+        return result
+
+
+class CachedCharacterDAO(_CachedDAO):
+    def get_story_characters(self, story_id: str, use_cache: bool = True, columns=None):
+        """Get all characters for a story, served from the cache unless use_cache is False"""
+        return self._read_columns(characters_key(story_id), lambda cols: self._dao.get_story_characters(story_id, columns=cols), columns, use_cache)
+
+    def _invalidate_character(self, character, story_id: Optional[str] = None):
+        story_id = story_id or getattr(character, "story_id", None)
+        if story_id:
+            self._cache.invalidate(characters_key(story_id))
+        else:
+            # Without a story id we cannot tell which list holds this character
+            self._cache.invalidate_prefix("characters:")
+
+    def create_character(self, character, story_id: str):
+        result = self._dao.create_character(character, story_id)
+        self._invalidate_character(character, character.story_id or story_id)
+        return result
+
+    def create_characters(self, characters, story_id: str):
+        result = self._dao.create_characters(characters, story_id)
+        self._cache.invalidate(characters_key(story_id))
+        for character in characters:
+            if character.story_id and character.story_id != story_id:
+                self._invalidate_character(character)
+        return result
+
+    def update_character(self, character):
+        result = self._dao.update_character(character)
+        self._invalidate_character(character)
+        return result
+
+    def update_characters(self, characters):
+        # Route through update_character so every touched story is invalidated
+        for character in characters:
+            if not self.update_character(character):
+                return False
+        return True
+
+    def update_character_analysis(self, character):
+        result = self._dao.update_character_analysis(character)
+        self._invalidate_character(character)
+        return result
+
+    def update_characters_analysis(self, characters):
+        result = self._dao.update_characters_analysis(characters)
+        for character in characters:
+            self._invalidate_character(character)
+        return result
+
+
+class CachedSceneDAO(_CachedDAO):
+    def get_story_scenes(self, story_id: str, use_cache: bool = True, columns=None):
+        """Get all scenes for a story, served from the cache unless use_cache is False"""
+        return self._read_columns(scenes_key(story_id), lambda cols: self._dao.get_story_scenes(story_id, columns=cols), columns, use_cache)
+
+    def create_scene(self, scene, story_id: str, scene_number: int):
+        result = self._dao.create_scene(scene, story_id, scene_number)
+        self._cache.invalidate(scenes_key(story_id))
+        return result
+
+    def update_scene_image_url(self, story_id: str, scene_number: int, image_url: str):
+        result = self._dao.update_scene_image_url(story_id, scene_number, image_url)
+        self._cache.invalidate(scenes_key(story_id))
+        return result
+
+    def update_scene_image_urls(self, story_id: str, image_urls):
+        result = self._dao.update_scene_image_urls(story_id, image_urls)
+        self._cache.invalidate(scenes_key(story_id))
+        return result
+
+    def delete_story_scenes(self, story_id: str):
+        result = self._dao.delete_story_scenes(story_id)
+        self._cache.invalidate(scenes_key(story_id))
+        return result
+
+
+class CachedUserDAO(_CachedDAO):
+    def get_user_by_email(self, email: str, use_cache: bool = True):
+        """Get user by email address, served from the cache unless use_cache is False"""
+        return self._read_through(user_key(email), lambda: self._dao.get_user_by_email(email), use_cache)
+
+    def create_user(self, user):
+        result = self._dao.create_user(user)
+        self._cache.invalidate(user_key(user.email))
+        return result
+
+    def update_user(self, user):
+        result = self._dao.update_user(user)
+        # The email itself may have changed, so the old key is unknown
+        self._cache.invalidate_prefix("user:")
+        return result
+
+    def update_user_credits(self, email: str, credits: int):
+        result = self._dao.update_user_credits(email, credits)
+        self._cache.invalidate(user_key(email))
+        return result
+
+    def record_credit_entries(self, entries):
+        result = self._dao.record_credit_entries(entries)
+        # Entries are keyed by user id, not email
+        self._cache.invalidate_prefix("user:")
+        return result
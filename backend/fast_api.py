@@ -7,57 +7,116 @@ import uuid
 import traceback
 from typing import List, Dict, Any, Optional
 from datetime import datetime
-from pathlib import Path
-import zipfile
-import io
-import requests
-import tempfile
 import os
+import time
+import asyncio
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse, FileResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from config import SUPABASE_URL, SUPABASE_ANON_KEY
+from app_logging import get_logger, logging_stats, shutdown_logging
+
+logger = get_logger(__name__)
 
 # Database imports (will work once supabase is set up)
 try:
     from config import supabase, ASSETS_FOLDER
-    from supabase_storage import upload_to_supabase_storage
+    from supabase_storage import upload_to_supabase_storage, download_image_from_supabase, get_supabase_storage_url
+    from supabase_storage import create_signed_upload_url, storage_object_exists, upload_stream_to_storage
+    from supabase_storage import read_storage_object_head, delete_storage_object
     from supabase import Client
     from dao import DAOFactory
+    from dao_cache import EntityCache, version_key
+    from credit_ledger import CreditLedger, InsufficientCreditsError
     from User import User
     SUPABASE_AVAILABLE = True
 except ImportError as e:
     SUPABASE_AVAILABLE = False
-    print(f"Warning: Supabase not available: {e}")
+    logger.warning(f"Supabase not available: {e}")
 
 from image_to_text import generate_narrative_scenes
 from image_to_image import generate_images_with_updates
 from User_Character import User_Character
 from Story import Story
-from config import gemini_client
+from config import gemini_client, DAO_CACHE_ENABLED, DAO_CACHE_MAX_ENTRIES, DAO_CACHE_TTL_SECONDS
+from config import CREDIT_LEDGER_FLUSH_INTERVAL, CREDIT_LEDGER_BATCH_SIZE, CREDITS_PER_SCENE_IMAGE
+from config import WRITE_BUFFER_ENABLED, WRITE_BUFFER_FLUSH_INTERVAL, WRITE_BUFFER_JOURNAL_PATH
+from config import DB_BACKEND, SQLITE_PATH, STORAGE_BACKEND, LOCAL_STORAGE_DIR
+from config import QUERY_STATS_ENABLED, QUERY_STATS_N_PLUS_ONE_THRESHOLD, QUERY_STATS_DEBUG_HEADERS, METRICS_ENABLED
+from config import QUERY_STATS_ADMIN_TOKEN
+import metrics
+from metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT, GENERATION_JOBS_IN_FLIGHT, limiter_wait
+from query_stats import QueryRecorder
+from request_context import request_id_var, new_request_id, client_request_id
+from http_client import close_http_client, http_client_stats
+from storage_cache import storage_cache_stats
+from uploads import UploadError, object_name, upload_registry, normalize_upload
+from uploads import check_image_upload, normalize_image, sniff_image_type, UploadSizeLimitMiddleware
+from story_package import stream_story_package, package_filename
+from package_store import PackageStore
+from field_selection import FieldSelection, parse_fields
+from Scene import Scene
+from api_models import FastJSONResponse, StoryDetailResponse, StoryListResponse, StoryBatchResponse, SceneDeltaResponse
+from http_cache import make_etag, etag_matches, not_modified, cache_headers
+from config import GZIP_MINIMUM_SIZE, MAX_BATCH_STORIES
+from library_export import export_registry, iter_story_pages, stream_library_export
+from config import EXPORT_FETCH_CONCURRENCY, EXPORT_DEADLINE_SECONDS, EXPORT_PAGE_SIZE, PACKAGE_CACHE_ENABLED, PACKAGE_CACHE_DIR
+from config import UPLOAD_PRESIGN_TTL_SECONDS, MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_FILES, BATCH_UPLOAD_CONCURRENCY
+from config import TRACING_ENABLED, TRACE_DIR, TRACE_MAX_RUNS, TRACE_EXPORT_URL
+from tracing import Tracer, TraceStore, trace_run, set_trace_story, http_exporter
+from http_client import get_http_client
+from config import LOOP_MONITOR_ENABLED, LOOP_MONITOR_INTERVAL, LOOP_STALL_THRESHOLD, LOOP_MONITOR_ADMIN_TOKEN
+from loop_monitor import LoopMonitor
+from config import PROFILER_ADMIN_TOKEN, PROFILER_INTERVAL, PROFILE_DIR, PROFILE_MAX_STORED
+from profiler import RequestProfiler, ProfileStore, profile_token, is_admin_token
 
 # Import AI modules directly
 try:
     from google import genai
     AI_MODULES_AVAILABLE = True
 except ImportError as e:
-    print(f"Warning: Could not import AI modules: {e}")
+    logger.warning(f"Could not import AI modules: {e}")
     AI_MODULES_AVAILABLE = False
 
 # Initialize DAO factory with imported supabase client
 dao_factory: Optional[DAOFactory] = None
+credit_ledger: Optional[CreditLedger] = None
+scene_write_buffer = None
+query_recorder = QueryRecorder(QUERY_STATS_N_PLUS_ONE_THRESHOLD) if QUERY_STATS_ENABLED else None
+package_store = PackageStore(PACKAGE_CACHE_DIR) if PACKAGE_CACHE_ENABLED else None
+tracer = Tracer(TraceStore(TRACE_DIR, TRACE_MAX_RUNS)) if TRACING_ENABLED else None
+loop_monitor = LoopMonitor(LOOP_MONITOR_INTERVAL, LOOP_STALL_THRESHOLD) if LOOP_MONITOR_ENABLED else None
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_MAX_STORED) if PROFILER_ADMIN_TOKEN else None
+if tracer and TRACE_EXPORT_URL:
+    tracer.add_exporter(http_exporter(TRACE_EXPORT_URL, lambda url, **kwargs: get_http_client().post(url, **kwargs)))
 
 if SUPABASE_AVAILABLE:
     try:
-        if SUPABASE_URL and SUPABASE_ANON_KEY and supabase:
-            dao_factory = DAOFactory(supabase)
-            print("✅ Supabase client and DAO factory initialized successfully")
+        entity_cache = EntityCache(DAO_CACHE_MAX_ENTRIES, DAO_CACHE_TTL_SECONDS) if DAO_CACHE_ENABLED else None
+        if DB_BACKEND == "sqlite":
+            os.makedirs(os.path.dirname(os.path.abspath(SQLITE_PATH)), exist_ok=True)
+            dao_factory = DAOFactory.for_sqlite(SQLITE_PATH, cache=entity_cache, recorder=query_recorder)
+            logger.info(f"✅ SQLite DAO factory initialized at {SQLITE_PATH}")
+        elif SUPABASE_URL and SUPABASE_ANON_KEY and supabase:
+            dao_factory = DAOFactory(supabase, cache=entity_cache, recorder=query_recorder)
+            logger.info("✅ Supabase client and DAO factory initialized successfully")
         else:
-            print("Warning: Supabase credentials not found or supabase client not available")
+            logger.warning("Supabase credentials not found or supabase client not available")
+        if dao_factory:
+            if WRITE_BUFFER_ENABLED:
+                scene_write_buffer = dao_factory.enable_write_buffer(WRITE_BUFFER_JOURNAL_PATH, WRITE_BUFFER_FLUSH_INTERVAL)
+            credit_ledger = CreditLedger(
+                dao_factory.get_user_dao(),
+                flush_interval=CREDIT_LEDGER_FLUSH_INTERVAL,
+                batch_size=CREDIT_LEDGER_BATCH_SIZE
+            )
     except Exception as e:
-        print(f"Warning: Could not initialize Supabase: {e}")
+        logger.warning(f"Could not initialize Supabase: {e}")
 
 # FastAPI app
 app = FastAPI(
@@ -73,8 +132,118 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "X-Export-ID", "X-Profile-ID"],
 )
 
+@app.middleware("http")
+async def track_request_queries(request: Request, call_next):
+    """Tag the request with an id, collect the DAO queries it runs and time it"""
+    request_id = new_request_id()
+    incoming_request_id = client_request_id(request.headers.get("x-request-id"))
+    token = request_id_var.set(request_id)
+    # Also on the ASGI scope, where the event loop watchdog and the profiler can find it
+    request.state.request_id = request_id
+    profiler = None
+    if profile_store and is_admin_token(profile_token(request.headers, request.query_params), PROFILER_ADMIN_TOKEN):
+        profiler = RequestProfiler(request_id, PROFILER_INTERVAL)
+        profiler.start()
+    if query_recorder:
+        query_recorder.begin(request_id, f"{request.method} {request.url.path}", incoming_request_id)
+    started = time.perf_counter()
+    status = 500
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        summary = query_recorder.end(request_id) if query_recorder else None
+        request_id_var.reset(token)
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+        # Labelled by route template to keep cardinality bounded; streamed bodies are timed to their first byte
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method=request.method,
+                                      route=getattr(route, "path", "unmatched"), status=status)
+        if profiler:
+            profile = profiler.stop(request.method, request.url.path, status)
+            await run_in_threadpool(profile_store.save, profile)
+    response.headers["X-Request-ID"] = request_id
+    if profiler:
+        response.headers["X-Profile-ID"] = request_id
+    if summary:
+        for flagged in summary["n_plus_one"]:
+            logger.warning(f"⚠️  N+1 query pattern in {summary['request']}: {flagged['count']}x {flagged['shape']}")
+        if QUERY_STATS_DEBUG_HEADERS:
+            response.headers["X-DAO-Queries"] = f"{summary['queries']}; time_ms={summary['total_ms']}; bytes={summary['bytes']}"
+            if summary["n_plus_one"]:
+                response.headers["X-DAO-N-Plus-One"] = ", ".join(
+                    f"{flagged['count']}x {flagged['shape']}" for flagged in summary["n_plus_one"]
+                )
+    return response
+
+# Large story payloads compress well; ZIP downloads and Range responses are left alone
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
+
+# Outermost, so oversized upload bodies are refused before anything reads them
+app.add_middleware(UploadSizeLimitMiddleware)
+
+# Serve objects written by the filesystem storage backend (see local_storage.py)
+if STORAGE_BACKEND == "local":
+    os.makedirs(LOCAL_STORAGE_DIR, exist_ok=True)
+    app.mount("/storage", StaticFiles(directory=LOCAL_STORAGE_DIR), name="storage")
+
+@app.on_event("startup")
+async def start_background_workers():
+    """Start the credit ledger and scene write buffer flush threads, and the event loop watchdog"""
+    if credit_ledger:
+        credit_ledger.start()
+    if scene_write_buffer:
+        scene_write_buffer.start()
+    if loop_monitor:
+        loop_monitor.start(asyncio.get_running_loop())
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    """Flush pending ledger entries and buffered scene writes before the process exits"""
+    if credit_ledger:
+        credit_ledger.stop()
+    if scene_write_buffer:
+        scene_write_buffer.stop()
+    if package_store:
+        package_store.shutdown()
+    if tracer:
+        tracer.shutdown()
+    if loop_monitor:
+        loop_monitor.stop()
+    close_http_client()
+    shutdown_logging()
+
+def build_story_package(story_id: str):
+    """Build the stored package of a completed story from fresh (uncached) data"""
+    story = dao_factory.get_story_dao().get_story(story_id, use_cache=False)
+    if not story or story.status != "completed":
+        return
+    scenes = dao_factory.get_scene_dao().get_story_scenes(story_id, use_cache=False)
+    package_store.build(
+        story, scenes, download_image_from_supabase,
+        concurrency=EXPORT_FETCH_CONCURRENCY,
+        deadline_seconds=EXPORT_DEADLINE_SECONDS
+    )
+
+def stored_story_package(story: Story, scenes: list) -> Optional[str]:
+    """Prebuilt package of a completed story, building it into the store if it is missing"""
+    if not package_store or story.status != "completed":
+        return None
+    return package_store.get(story) or package_store.build(
+        story, scenes, download_image_from_supabase,
+        concurrency=EXPORT_FETCH_CONCURRENCY,
+        deadline_seconds=EXPORT_DEADLINE_SECONDS
+    )
+
+def schedule_package_build(story_id: str):
+    """Queue a background (re)build of a story's package"""
+    if package_store and dao_factory:
+        package_store.schedule(story_id, build_story_package)
+
 def get_all_story_titles():
     """Get all story titles from database"""
     if not dao_factory:
@@ -86,7 +255,7 @@ def get_all_story_titles():
         all_stories = story_dao.get_all_stories()
         return {story.title.lower() for story in all_stories}
     except Exception as e:
-        print(f"Error fetching story titles from database: {e}")
+        logger.error(f"Error fetching story titles from database: {e}")
         return set()
 
 # Pydantic models
@@ -135,9 +304,25 @@ class CreateUserRequest(BaseModel):
 class UpdateCreditsRequest(BaseModel):
     credits: int
 
+class PresignUploadRequest(BaseModel):
+    kind: str  # "character", "cover" or "story_character"
+    filename: str
+    content_type: Optional[str] = None
+    story_id: Optional[str] = None
+    character_index: int = 0
+
+class BatchStoriesRequest(BaseModel):
+    story_ids: List[str]
+    fields: Optional[str] = None  # Same syntax as fields= on GET /api/stories/{story_id}
+
+class FinalizeUploadRequest(BaseModel):
+    upload_id: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+
 # API Routes
 
-@app.get("/")
+@app.get("/", response_class=FastJSONResponse)
 async def root():
     """Root endpoint with API information"""
     return {
@@ -156,6 +341,7 @@ async def root():
             "/api/stories/{story_id}/characters/upload", 
             "/api/stories/{story_id}/characters",
             "/api/stories/{story_id}",
+            "/api/stories/{story_id}/scenes",
             "/api/stories/generate-story",
             "/api/stories/generate-images",
             "/health",
@@ -164,7 +350,8 @@ async def root():
         ]
     }
 
-@app.post("/api/stories/generate-story")
+@app.post("/api/stories/generate-story", response_class=FastJSONResponse)
+@trace_run(lambda: tracer, "generate_story")
 async def generate_story_only(request: StoryRequest):
     """
     Generate only the future story using AI, update characters with analysis
@@ -203,6 +390,7 @@ async def generate_story_only(request: StoryRequest):
                 cover_image_url=request.cover_image_url
             )
             story.id = story_dao.create_story(story)
+        set_trace_story(story.id)
         
         # Update the background story
         story.background_story = request.background_story if request.background_story else f"A {request.story_mode} story with {request.nb_chars} characters spanning {request.nb_scenes} scenes."
@@ -232,13 +420,14 @@ async def generate_story_only(request: StoryRequest):
                 character_dao.create_character(character, story.id)
         
         # Generate story and analysis using AI
-        print(f"🎭 Generating story for: {request.title}")
-        analysis, scenes_paragraph, scenes_list = generate_narrative_scenes(
-            gemini_client, 
-            characters, 
-            story.background_story, 
-            request.nb_scenes
-        )
+        logger.info(f"🎭 Generating story for: {request.title}")
+        with GENERATION_JOBS_IN_FLIGHT.track_inprogress(kind="story"):
+            analysis, scenes_paragraph, scenes_list = generate_narrative_scenes(
+                gemini_client, 
+                characters, 
+                story.background_story, 
+                request.nb_scenes
+            )
         
         character_dao.update_characters_analysis(characters)
         scene_dao = dao_factory.get_scene_dao()
@@ -263,6 +452,8 @@ async def generate_story_only(request: StoryRequest):
         
         # Update story status to indicate scenes are generated
         story_dao.update_story_complete(story)
+        if scene_write_buffer:
+            scene_write_buffer.flush(story.id)
         
         return {
             "success": True,
@@ -277,16 +468,17 @@ async def generate_story_only(request: StoryRequest):
         }
         
     except Exception as e:
-        print(f"Error in generate_story_only: {str(e)}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.error(f"Error in generate_story_only: {str(e)}", exc_info=True)
         return {
             "success": False,
             "error": str(e),
             "traceback": traceback.format_exc()
         }
 
-@app.post("/api/stories/generate-images")
+@app.post("/api/stories/generate-images", response_class=FastJSONResponse)
+@trace_run(lambda: tracer, "generate_images")
 async def generate_story_images(request: GenerateImagesRequest):
+    set_trace_story(request.story_id)
     try:
         # Check if AI modules are available
         if not AI_MODULES_AVAILABLE or not gemini_client:
@@ -328,7 +520,7 @@ async def generate_story_images(request: GenerateImagesRequest):
             }
         
         # Get scenes from database (scenes were created in generate_story_only)
-        print(f"🎬 Getting scenes from database for story: {story.title}")
+        logger.info(f"🎬 Getting scenes from database for story: {story.title}")
         scenes = scene_dao.get_story_scenes(request.story_id)
         
         if not scenes:
@@ -337,31 +529,55 @@ async def generate_story_images(request: GenerateImagesRequest):
                 "error": "No scenes found for this story. Please generate the story first."
             }
         
-        print(f"💾 Found {len(scenes)} scenes in database")
+        logger.info(f"💾 Found {len(scenes)} scenes in database")
+        
+        # Hold the credits for every scene up front; only successful images are charged
+        reservation = None
+        if credit_ledger:
+            owner = dao_factory.get_user_dao().get_user(story.user_id)
+            if not owner:
+                return {
+                    "success": False,
+                    "error": "Story owner not found"
+                }
+            try:
+                reservation = credit_ledger.reserve(owner.email, len(scenes) * CREDITS_PER_SCENE_IMAGE, request.story_id)
+            except InsufficientCreditsError as credit_error:
+                return {
+                    "success": False,
+                    "error": "Insufficient credits",
+                    "credits_required": credit_error.requested,
+                    "credits_available": credit_error.available
+                }
         
         # Generate images with real-time database updates
         try:
-            print(f"🎨 Generating images for story: {story.title}")
-            generate_images_with_updates(gemini_client, story_title, characters, scenes, scene_dao, request.story_id)
+            logger.info(f"🎨 Generating images for story: {story.title}")
+            with GENERATION_JOBS_IN_FLIGHT.track_inprogress(kind="images"):
+                image_urls = generate_images_with_updates(gemini_client, story_title, characters, scenes, scene_dao, request.story_id)
         except Exception as image_error:
-            print(f"Image generation failed: {image_error}")
+            logger.error(f"Image generation failed: {image_error}")
+            if reservation:
+                credit_ledger.refund(reservation)
             return {
                 "success": False,
                 "error": f"Image generation failed: {str(image_error)}"
             }
         
-        # Mark story as completed and return results
+        if reservation:
+            credit_ledger.settle(reservation, len([url for url in image_urls if url]) * CREDITS_PER_SCENE_IMAGE)
+        
+        # Mark story as completed and write the coalesced scene/status updates in one batch
         story_dao.update_story_complete(story)
+        if scene_write_buffer:
+            scene_write_buffer.flush(request.story_id)
+        schedule_package_build(request.story_id)
         
-        # Get updated scenes from database to return
-        updated_scenes = scene_dao.get_story_scenes(request.story_id)
+        # The scenes are already in memory; a failed scene keeps the URL it had before
         scenes_created = []
-        for scene in updated_scenes:
-            scenes_created.append({
-                "scene_number": scene.scene_number,
-                "title": scene.title,
-                "image_url": scene.image_url                
-            })
+        for scene, image_url in zip(scenes, image_urls):
+            scene.image_url = image_url or scene.image_url
+            scenes_created.append(scene.to_json(("scene_number", "title", "image_url")))
         
         return {
             "success": True,
@@ -374,8 +590,7 @@ async def generate_story_images(request: GenerateImagesRequest):
         }
         
     except Exception as e:
-        print(f"Error in generate_story_images: {str(e)}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.error(f"Error in generate_story_images: {str(e)}", exc_info=True)
         return {
             "success": False,
             "error": str(e),
@@ -389,7 +604,7 @@ async def generate_story_simple(request: SimpleStoryRequest, background_tasks: B
     Simple story generation - just creates the story record and returns immediately
     """
     try:
-        print(f"Received story request: {request}")
+        logger.info(f"Received story request: {request.title}")
         
         # Validate required fields
         if not request.title or not request.title.strip():
@@ -408,8 +623,6 @@ async def generate_story_simple(request: SimpleStoryRequest, background_tasks: B
                 message=f"A story with the title '{request.title}' already exists. Please choose a different title."
             )
         
-        story_id = str(uuid.uuid4())
-        
         # Look up user by email to get database user ID
         if not request.user_email or not request.user_email.strip():
             return StoryResponse(
@@ -428,37 +641,23 @@ async def generate_story_simple(request: SimpleStoryRequest, background_tasks: B
                 message="User not found. Please make sure you are logged in."
             )
         
-        # Save basic story record to database if available
-        if supabase:
-            try:
-                initial_data = {
-                    "id": story_id,
-                    "user_id": str(user.id),  # Only store user_id as foreign key
-                    "title": request.title,
-                    "story_mode": request.story_mode or "",  # Handle None values
-                    "nb_scenes": request.nb_scenes,
-                    "nb_chars": request.nb_chars,
-                    "cover_image_url": request.cover_image_url,
-                    "status": "created",
-                    "created_at": datetime.utcnow().isoformat(),
-                    "updated_at": datetime.utcnow().isoformat()
-                }
-                
-                result = supabase.table("stories").insert(initial_data).execute()
-                if not result.data:
-                    print("Warning: Failed to create story record in database")
-                    return StoryResponse(
-                        success=False,
-                        status="error",
-                        message="Failed to create story record in database"
-                    )
-            except Exception as db_error:
-                print(f"Database error: {db_error}")
-                return StoryResponse(
-                    success=False,
-                    status="error",
-                    message=f"Database error: {str(db_error)}"
-                )
+        # Save basic story record to database
+        story = Story(
+            user_id=str(user.id),  # Only store user_id as foreign key
+            title=request.title,
+            nb_scenes=request.nb_scenes,
+            nb_chars=request.nb_chars,
+            story_mode=request.story_mode or "",  # Handle None values
+            cover_image_url=request.cover_image_url
+        )
+        story_id = dao_factory.get_story_dao().create_story(story)
+        if not story_id:
+            logger.warning("Failed to create story record in database")
+            return StoryResponse(
+                success=False,
+                status="error",
+                message="Failed to create story record in database"
+            )
         
         return StoryResponse(
             success=True,
@@ -468,30 +667,40 @@ async def generate_story_simple(request: SimpleStoryRequest, background_tasks: B
         )
         
     except Exception as e:
-        print(f"Error in generate_story_simple: {str(e)}")
+        logger.error(f"Error in generate_story_simple: {str(e)}")
         return StoryResponse(
             success=False,
             status="error",
             message=f"Internal server error: {str(e)}"
         )
 
-@app.post("/api/characters/upload")
+async def check_uploaded_image(file: UploadFile) -> str:
+    """Reject non-images from their content type and magic bytes before anything is forwarded; returns the extension"""
+    head = await file.read(16)
+    await file.seek(0)
+    try:
+        return check_image_upload(file.filename, file.content_type, head)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+async def stream_image_upload(file: UploadFile, filename: str) -> str:
+    """Forward an upload to storage in chunks (off the event loop) and return its public URL"""
+    return await run_in_threadpool(upload_stream_to_storage, file.file, filename, ASSETS_FOLDER, file.content_type)
+
+@app.post("/api/characters/upload", response_class=FastJSONResponse)
 async def upload_character_image(
     file: UploadFile = File(...),
     name: str = None,
     description: str = None
 ):
     """Upload character image to Supabase storage"""
+    file_extension = await check_uploaded_image(file)
     try:
-        # Read file content
-        content = await file.read()
-        
         # Generate unique filename
-        file_extension = Path(file.filename).suffix
         unique_filename = f"character_{uuid.uuid4()}{file_extension}"
         
-        # Upload to Supabase storage
-        image_url = upload_to_supabase_storage(content, unique_filename, ASSETS_FOLDER)
+        # Stream to Supabase storage
+        image_url = await stream_image_upload(file, unique_filename)
         
         character_data = {
             "name": name or "Unknown Character",
@@ -507,35 +716,27 @@ async def upload_character_image(
         }
             
     except Exception as e:
-        print(f"Error uploading character image: {e}")
+        logger.error(f"Error uploading character image: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/stories/{story_id}/cover/upload")
+@app.post("/api/stories/{story_id}/cover/upload", response_class=FastJSONResponse)
 async def upload_story_cover(
     story_id: str,
     file: UploadFile = File(...)
 ):
     """Upload story cover image to Supabase storage"""
+    logger.info(f"📸 Cover upload received - story_id: '{story_id}', filename: '{file.filename}'")
+    file_extension = await check_uploaded_image(file)
     try:
-        print(f"📸 Cover upload received - story_id: '{story_id}', filename: '{file.filename}'")
-        
-        # Read file content
-        content = await file.read()
-        
-        # Generate filename based on story ID and original file extension
-        file_extension = Path(file.filename).suffix.lower()
-        # Ensure we have a valid extension
-        if not file_extension:
-            file_extension = '.jpg'  # Default to .jpg if no extension
-        
+        # Generate filename based on story ID and the detected image type
         filename = f"story_{story_id}{file_extension}"
         
-        print(f"📁 Generated filename: '{filename}'")
+        logger.debug(f"📁 Generated filename: '{filename}'")
         
-        # Upload to Supabase storage
-        image_url = upload_to_supabase_storage(content, filename, ASSETS_FOLDER)
+        # Stream to Supabase storage
+        image_url = await stream_image_upload(file, filename)
         
-        print(f"✅ Upload successful - URL: {image_url}")
+        logger.info(f"✅ Upload successful - URL: {image_url}")
         
         return {
             "success": True,
@@ -545,10 +746,10 @@ async def upload_story_cover(
         }
             
     except Exception as e:
-        print(f"Error uploading story cover: {e}")
+        logger.error(f"Error uploading story cover: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/stories/{story_id}/characters/upload")
+@app.post("/api/stories/{story_id}/characters/upload", response_class=FastJSONResponse)
 async def upload_story_character(
     story_id: str,
     file: UploadFile = File(...),
@@ -557,16 +758,13 @@ async def upload_story_character(
     description: str = None
 ):
     """Upload character image for a specific story to Supabase storage"""
+    file_extension = await check_uploaded_image(file)
     try:
-        # Read file content
-        content = await file.read()
-        
         # Generate filename based on character index
-        file_extension = Path(file.filename).suffix
         filename = f"char_{character_index}{file_extension}"
         
-        # Upload to Supabase storage
-        image_url = upload_to_supabase_storage(content, filename, ASSETS_FOLDER)
+        # Stream to Supabase storage
+        image_url = await stream_image_upload(file, filename)
         
         character_data = {
             "name": name or f"Character {character_index + 1}",
@@ -584,15 +782,185 @@ async def upload_story_character(
         }
             
     except Exception as e:
-        print(f"Error uploading character image: {e}")
+        logger.error(f"Error uploading character image: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/stories/{story_id}/characters")
+@app.post("/api/stories/{story_id}/characters/batch/upload", response_class=FastJSONResponse)
+async def upload_story_characters_batch(
+    story_id: str,
+    files: List[UploadFile] = File(...),
+    names: List[str] = Form([]),
+    descriptions: List[str] = Form([])
+):
+    """Upload several character images in one request and save them as the story's characters
+    
+    names[i] / descriptions[i] belong to files[i]. Images are normalized and
+    uploaded concurrently; the characters of every file that succeeded are
+    inserted with a single query. Each file gets its own result entry.
+    """
+    if len(files) > MAX_BATCH_UPLOAD_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_UPLOAD_FILES} files per batch")
+
+    semaphore = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
+
+    async def process(index: int, file: UploadFile) -> Dict[str, Any]:
+        result = {"index": index, "filename": file.filename, "success": False}
+        try:
+            if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES} byte limit")
+            file_extension = await check_uploaded_image(file)
+            with limiter_wait("batch_upload"):
+                await semaphore.acquire()
+            try:
+                content = await file.read()
+                normalized = await run_in_threadpool(normalize_image, content, file_extension)
+                filename = object_name("story_character", f"upload{file_extension}", story_id, index)
+                image_url = await run_in_threadpool(upload_to_supabase_storage, normalized or content, filename, ASSETS_FOLDER)
+            finally:
+                semaphore.release()
+            result.update(success=True, image_url=image_url, stored_as=filename)
+        except HTTPException as e:
+            result["error"] = e.detail
+        except Exception as e:
+            logger.error(f"Error uploading batch character image {file.filename}: {e}")
+            result["error"] = str(e)
+        return result
+
+    results = await asyncio.gather(*(process(index, file) for index, file in enumerate(files)))
+
+    uploaded = [result for result in results if result["success"]]
+    characters = [
+        User_Character(
+            story_id=story_id,
+            image_url=result["image_url"],
+            name=names[result["index"]] if result["index"] < len(names) else f"Character {result['index'] + 1}",
+            description=descriptions[result["index"]] if result["index"] < len(descriptions) else ""
+        )
+        for result in uploaded
+    ]
+    saved = False
+    if characters and dao_factory:
+        saved = bool(dao_factory.get_character_dao().create_characters(characters, story_id))
+        if saved:
+            for result, character in zip(uploaded, characters):
+                result["character"] = character.to_json()
+
+    return {
+        "success": bool(uploaded) and (saved or not dao_factory),
+        "uploaded": len(uploaded),
+        "failed": len(results) - len(uploaded),
+        "characters_saved": saved,
+        "results": results
+    }
+
+@app.post("/api/uploads/presign", response_class=FastJSONResponse)
+async def presign_upload(request: PresignUploadRequest):
+    """Reserve an object key and return a signed URL the browser uploads the file to directly"""
+    try:
+        file_name = object_name(request.kind, request.filename, request.story_id, request.character_index)
+        upload = upload_registry.create(
+            request.kind,
+            file_name,
+            story_id=request.story_id,
+            character_index=request.character_index
+        )
+        signed = create_signed_upload_url(upload["object_key"])
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error creating signed upload URL: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "success": True,
+        "upload_id": upload["upload_id"],
+        "object_key": upload["object_key"],
+        "upload_url": signed["url"],
+        "token": signed["token"],
+        "method": signed["method"],
+        "headers": {"Content-Type": request.content_type} if request.content_type else {},
+        "expires_in": UPLOAD_PRESIGN_TTL_SECONDS
+    }
+
+@app.post("/api/uploads/finalize", response_class=FastJSONResponse)
+async def finalize_upload(request: FinalizeUploadRequest, background_tasks: BackgroundTasks):
+    """Register a presigned upload once the file is in storage and start normalizing it"""
+    upload = upload_registry.get(request.upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Unknown or expired upload")
+
+    if upload["status"] == "pending":
+        if not storage_object_exists(upload["object_key"]):
+            raise HTTPException(status_code=409, detail="File has not been uploaded to storage yet")
+        # The client uploaded straight to storage, so nothing has looked at the bytes yet
+        head = await run_in_threadpool(read_storage_object_head, upload["object_key"])
+        if not sniff_image_type(head):
+            await run_in_threadpool(delete_storage_object, upload["object_key"])
+            upload_registry.update(request.upload_id, status="failed", error="Uploaded file is not an image")
+            raise HTTPException(status_code=400, detail="Uploaded file is not a PNG, JPEG, GIF or WebP image")
+        image_url = get_supabase_storage_url(upload["file_name"], upload["folder"].strip("/"))
+        upload_registry.update(request.upload_id, status="normalizing", image_url=image_url)
+        background_tasks.add_task(normalize_upload, request.upload_id)
+        upload = upload_registry.get(request.upload_id)
+    elif not upload["image_url"]:
+        # Rejected by an earlier finalize
+        raise HTTPException(status_code=400, detail=upload["error"] or "Upload was rejected")
+
+    response = {
+        "success": True,
+        "upload_id": upload["upload_id"],
+        "status": upload["status"],
+        "image_url": upload["image_url"],
+        "filename": upload["file_name"],
+        "message": "Upload registered; normalization started"
+    }
+    if upload["kind"] != "cover":
+        default_name = f"Character {upload['character_index'] + 1}" if upload["kind"] == "story_character" else "Unknown Character"
+        response["character"] = {
+            "name": request.name or default_name,
+            "description": request.description or "",
+            "image_url": upload["image_url"],
+            "filename": upload["file_name"]
+        }
+    return response
+
+@app.get("/api/uploads/{upload_id}", response_class=FastJSONResponse)
+async def get_upload_status(upload_id: str):
+    """Normalization status of a finalized upload"""
+    upload = upload_registry.get(upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Unknown or expired upload")
+    return {
+        "success": True,
+        "upload_id": upload["upload_id"],
+        "status": upload["status"],
+        "image_url": upload["image_url"],
+        "error": upload["error"]
+    }
+
+@app.put("/api/uploads/local/{file_path:path}", response_class=FastJSONResponse)
+async def put_local_upload(file_path: str, request: Request, expires: int = 0, token: str = ""):
+    """Signed upload target for the filesystem storage backend (stands in for Supabase's)"""
+    if STORAGE_BACKEND != "local":
+        raise HTTPException(status_code=404, detail="Not found")
+    from local_storage import verify_signed_upload, local_upload_path
+    if not verify_signed_upload(file_path, expires, token):
+        raise HTTPException(status_code=403, detail="Invalid or expired upload signature")
+
+    path = local_upload_path(file_path)
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as f:
+        async for chunk in request.stream():
+            f.write(chunk)
+    os.replace(tmp_path, path)
+    return {"Key": file_path}
+
+@app.post("/api/stories/{story_id}/characters", response_class=FastJSONResponse)
 async def save_story_characters(story_id: str, request: dict):
     """Save/update characters for a specific story (deprecated - use PUT)"""
     return await update_story_characters(story_id, request)
 
-@app.put("/api/stories/{story_id}/characters")
+@app.put("/api/stories/{story_id}/characters", response_class=FastJSONResponse)
 async def update_story_characters(story_id: str, request: dict):
     """Update characters for a specific story"""
     if not dao_factory:
@@ -608,7 +976,7 @@ async def update_story_characters(story_id: str, request: dict):
                 "success": False,
                 "message": "No characters provided"
             }
-        print(characters_data)
+        logger.debug(f"Updating {len(characters_data)} characters for story {story_id}")
         character_dao = dao_factory.get_character_dao()
         saved_characters = []
         
@@ -631,7 +999,6 @@ async def update_story_characters(story_id: str, request: dict):
                 name=name,
                 description=char_data.get("description", "")
             )
-            print("instance : ", character)
             
             # Check if character already exists by ID first, then by name
             existing_char = None
@@ -674,15 +1041,112 @@ async def update_story_characters(story_id: str, request: dict):
         }
         
     except Exception as e:
-        print(f"Error updating story characters: {e}")
+        logger.error(f"Error updating story characters: {e}")
         return {
             "success": False,
             "message": f"Error updating characters: {str(e)}"
         }
 
-@app.get("/api/stories/{story_id}")
-async def get_story(story_id: str):
-    """Get story details using DAO pattern"""
+def story_json(story: Story, characters: Optional[list], scenes: Optional[list],
+               selection: Optional[FieldSelection] = None) -> Dict[str, Any]:
+    """Convert a story and its characters and scenes to a dictionary, limited to a field selection when given"""
+    story_dict = story.to_json(selection.story if selection else None)
+    if "status" in story_dict:
+        story_dict["status"] = "completed"
+    if selection is None or selection.characters is not None:
+        story_dict["characters"] = [char.to_json(selection.characters if selection else None) for char in characters]
+    if selection is None or selection.scenes is not None:
+        story_dict["scenes"] = [scene.to_json(selection.scenes if selection else None) for scene in scenes]
+    return story_dict
+
+@app.post("/api/stories/batch", response_model=StoryBatchResponse, response_model_exclude_unset=True)
+async def get_stories_batch(request: BatchStoriesRequest):
+    """Get several stories with their characters and scenes in three queries, in the order asked for
+
+    Supports the same fields= selection as GET /api/stories/{story_id}.
+    """
+    if not dao_factory:
+        raise HTTPException(status_code=500, detail="Database not available")
+    story_ids = list(dict.fromkeys(request.story_ids))
+    if len(story_ids) > MAX_BATCH_STORIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_STORIES} stories per batch")
+    try:
+        selection = parse_fields(request.fields) if request.fields else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    story_columns = character_columns = scene_columns = None
+    if selection:
+        story_columns = FieldSelection.columns(Story, selection.story)
+        if selection.characters is not None:
+            character_columns = FieldSelection.columns(User_Character, selection.characters) + ("story_id",)
+        if selection.scenes is not None:
+            scene_columns = FieldSelection.columns(Scene, selection.scenes) + ("story_id",)
+    
+    stories = {story.id: story for story in dao_factory.get_story_dao().get_stories(story_ids, columns=story_columns)}
+    found_ids = [story_id for story_id in story_ids if story_id in stories]
+    characters = scenes = {}
+    if selection is None or selection.characters is not None:
+        characters = dao_factory.get_character_dao().get_characters_for_stories(found_ids, columns=character_columns)
+    if selection is None or selection.scenes is not None:
+        scenes = dao_factory.get_scene_dao().get_scenes_for_stories(found_ids, columns=scene_columns)
+    
+    return {
+        "success": True,
+        "stories": [
+            story_json(stories[story_id], characters.get(story_id, []), scenes.get(story_id, []), selection)
+            for story_id in found_ids
+        ],
+        "missing": [story_id for story_id in story_ids if story_id not in stories]
+    }
+
+@app.get("/api/stories/{story_id}/timeline", response_class=FastJSONResponse)
+async def get_story_timeline(story_id: str):
+    """Traced generation runs of a story, oldest first, with the span timeline of each"""
+    if not tracer:
+        raise HTTPException(status_code=404, detail="Tracing is disabled")
+    runs = await run_in_threadpool(tracer.store.timeline, story_id)
+    return {
+        "success": True,
+        "story_id": story_id,
+        "runs": runs
+    }
+
+@app.get("/api/stories/{story_id}/scenes", response_model=SceneDeltaResponse, response_model_exclude_unset=True)
+async def get_changed_scenes(story_id: str, since: Optional[str] = None):
+    """Scenes changed after the version token since (all scenes without it), plus the new version token
+
+    Poll this during image generation instead of re-reading the whole story.
+    Image URLs held in the write buffer show up once they are flushed.
+    """
+    if not dao_factory:
+        raise HTTPException(status_code=500, detail="Database not available")
+    try:
+        since_revision = int(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since must be a version token returned by this endpoint")
+    
+    story = dao_factory.get_story_dao().get_story(story_id)
+    if not story:
+        raise HTTPException(status_code=404, detail="Story not found")
+    
+    scenes, version = dao_factory.get_scene_dao().get_scenes_since(story_id, since_revision)
+    return {
+        "success": True,
+        "story_id": story_id,
+        "status": story.status,
+        "version": str(version),
+        "scenes": [scene.to_json() for scene in scenes]
+    }
+
+@app.get("/api/stories/{story_id}", response_model=StoryDetailResponse, response_model_exclude_unset=True)
+async def get_story(story_id: str, request: Request, response: Response, fields: Optional[str] = None):
+    """Get story details using DAO pattern
+
+    Answers If-None-Match with 304 after a single version query, before the
+    story, characters and scenes are loaded. fields= (see field_selection.py)
+    limits the response, and the columns read, to the attributes asked for.
+    """
     if not dao_factory:
         return {
             "success": True,
@@ -697,74 +1161,63 @@ async def get_story(story_id: str):
             }
         }
     
+    try:
+        selection = parse_fields(fields) if fields else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         # Get DAOs
         story_dao = dao_factory.get_story_dao()
         character_dao = dao_factory.get_character_dao()
         scene_dao = dao_factory.get_scene_dao()
         
-        # Get story
-        story = story_dao.get_story(story_id)
+        version = story_dao.get_story_version(story_id)
+        if version is not None:
+            etag = make_etag("story", story_id, version, fields or "")
+            if etag_matches(request.headers.get("if-none-match"), etag):
+                return not_modified(etag)
+            response.headers.update(cache_headers(etag))
         
-        if story:
-            # Get characters and scenes
-            characters = character_dao.get_story_characters(story_id)
-            scenes = scene_dao.get_story_scenes(story_id)
-            
-            print(f"📖 Retrieved {len(scenes)} scenes for story {story_id}")
-            for scene in scenes:
-                print(f"   Scene {scene.scene_number}: image_url = '{scene.image_url}'")
-            
-            # Convert Story object to dictionary for JSON serialization
-            story_dict = {
-                "id": story.id,
-                "user_id": story.user_id,
-                "title": story.title,
-                "nb_scenes": story.nb_scenes,
-                "nb_chars": story.nb_chars,
-                "story_mode": story.story_mode,
-                "cover_image_url": story.cover_image_url,
-                "background_story": story.background_story,
-                "scenes_paragraph": getattr(story, "scenes_paragraph", ""),  # Include scenes_paragraph
-                "created_at": story.created_at,
-                "updated_at": story.updated_at,
-                "status": "completed"  # Add status field
+        # The ETag is only valid for a body read at (or after) this version: when the cached
+        # entities were read at another one, read them from the database instead
+        cache = dao_factory.cache
+        use_cache = version is None or cache is None or cache.get(version_key(story_id)) == (True, version)
+        
+        if selection:
+            story = story_dao.get_story(story_id, use_cache=use_cache, columns=FieldSelection.columns(Story, selection.story))
+        else:
+            # Get story
+            story = story_dao.get_story(story_id, use_cache=use_cache)
+        
+        if story and selection:
+            characters = scenes = None
+            if selection.characters is not None:
+                characters = character_dao.get_story_characters(
+                    story_id, use_cache=use_cache, columns=FieldSelection.columns(User_Character, selection.characters)
+                )
+            if selection.scenes is not None:
+                scenes = scene_dao.get_story_scenes(
+                    story_id, use_cache=use_cache, columns=FieldSelection.columns(Scene, selection.scenes)
+                )
+            return {
+                "success": True,
+                "story": story_json(story, characters, scenes, selection)
             }
+        elif story:
+            # Get characters and scenes
+            characters = character_dao.get_story_characters(story_id, use_cache=use_cache)
+            scenes = scene_dao.get_story_scenes(story_id, use_cache=use_cache)
+            if not use_cache:
+                cache.set(version_key(story_id), version)
             
-            # Convert User_Character objects to dictionaries for JSON serialization
-            characters_dict = []
-            for char in characters:
-                print(f"🧑 Character '{char.name}': image_url = '{char.image_url}'")
-                char_dict = {
-                    "id": char.id,
-                    "name": char.name,
-                    "description": char.description,
-                    "image_url": char.image_url,  # Use image_url consistently
-                    "analysis": getattr(char, "analysis", "")
-                }
-                characters_dict.append(char_dict)
-            
-            # Convert scene objects to dictionaries for JSON serialization
-            scenes_dict = []
-            for scene in scenes:
-                scene_dict = {
-                    "id": scene.id,
-                    "title": scene.title,
-                    "narrative_text": scene.narrative_text,
-                    "scene_number": scene.scene_number,
-                    "image_prompt": scene.image_prompt,
-                    "image_url": scene.image_url,
-                    "paragraph": scene.paragraph
-                }
-                scenes_dict.append(scene_dict)
-            
-            # Add characters and scenes to story data
-            story_dict["characters"] = characters_dict
-            story_dict["scenes"] = scenes_dict
+            # Logged on every poll, so sampled
+            logger.debug(f"📖 Retrieved {len(scenes)} scenes for story {story_id}",
+                         extra={"story_id": story_id, "sample": True})
             
             return {
                 "success": True,
-                "story": story_dict
+                "story": story_json(story, characters, scenes)
             }
         else:
             return {
@@ -781,7 +1234,7 @@ async def get_story(story_id: str):
             }
             
     except Exception as e:
-        print(f"Error fetching story: {e}")
+        logger.error(f"Error fetching story: {e}")
         return {
             "success": False,
             "error": str(e)
@@ -850,6 +1303,9 @@ async def update_story(story_id: str, request: SimpleStoryRequest):
         updated_story_id = story_dao.update_story(existing_story)
         
         if updated_story_id:
+            if existing_story.status == "completed":
+                # The stored package is now stale
+                schedule_package_build(story_id)
             return StoryResponse(
                 success=True,
                 story_id=story_id,
@@ -864,14 +1320,21 @@ async def update_story(story_id: str, request: SimpleStoryRequest):
             )
             
     except Exception as e:
-        print(f"Error updating story: {e}")
+        logger.error(f"Error updating story: {e}")
         return StoryResponse(
             success=False,
             status="error",
             message=f"Error updating story: {str(e)}"
         )
 
-@app.get("/health")
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics in the text exposition format"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/health", response_class=FastJSONResponse)
 async def health_check():
     """Health check endpoint"""
     return {
@@ -879,21 +1342,87 @@ async def health_check():
         "timestamp": datetime.utcnow().isoformat(),
         "services": {
             "supabase": supabase is not None,
+            "database": DB_BACKEND if dao_factory else None,
+            "storage": STORAGE_BACKEND,
             "gemini": gemini_client is not None,
             "ai_modules": AI_MODULES_AVAILABLE
-        }
+        },
+        "dao_cache": dao_factory.cache_stats() if dao_factory else None,
+        "scene_write_buffer": scene_write_buffer.stats() if scene_write_buffer else None,
+        "storage_http_client": http_client_stats(),
+        "storage_cache": storage_cache_stats(),
+        "story_packages": package_store.stats() if package_store else None,
+        "logging": logging_stats(),
+        "event_loop": loop_monitor.stats() if loop_monitor else None
     }
 
-@app.post("/api/demo/clear-titles")
+def require_query_stats_admin(request: Request):
+    """Query statistics expose tables, query shapes and timings: admin token only"""
+    if not query_recorder or not QUERY_STATS_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Query instrumentation is disabled")
+    if not is_admin_token(request.headers.get("x-admin-token"), QUERY_STATS_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/api/debug/queries", response_class=FastJSONResponse)
+async def get_query_stats(request: Request):
+    """Aggregate DAO query statistics per query shape, plus recent N+1 requests"""
+    require_query_stats_admin(request)
+    return query_recorder.aggregate()
+
+@app.get("/api/debug/queries/{request_id}", response_class=FastJSONResponse)
+async def get_request_query_stats(request_id: str, request: Request):
+    """Every DAO query recorded for one request (see the X-Request-ID response header)"""
+    require_query_stats_admin(request)
+    summary = query_recorder.request_summary(request_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="No queries recorded for this request")
+    return summary
+
+def require_loop_monitor_admin(request: Request):
+    """Stall reports expose stacks, source paths and request paths: admin token only"""
+    if not loop_monitor or not LOOP_MONITOR_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Event loop monitoring is disabled")
+    if not is_admin_token(request.headers.get("x-admin-token"), LOOP_MONITOR_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/api/debug/loop", response_class=FastJSONResponse)
+async def get_loop_stalls(request: Request):
+    """Event loop stalls grouped by the blocking frame, plus the most recent ones with full stacks"""
+    require_loop_monitor_admin(request)
+    return loop_monitor.report()
+
+def require_profile_admin(request: Request):
+    """Profiles are only readable with the profiler admin token"""
+    if not profile_store:
+        raise HTTPException(status_code=404, detail="Request profiling is disabled")
+    if not is_admin_token(profile_token(request.headers, request.query_params), PROFILER_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Profiler admin token required")
+
+@app.get("/api/debug/profiles", response_class=FastJSONResponse)
+async def list_request_profiles(request: Request):
+    """Recently profiled requests, newest first"""
+    require_profile_admin(request)
+    return {"success": True, "profiles": profile_store.list()}
+
+@app.get("/api/debug/profiles/{request_id}")
+async def get_request_profile(request_id: str, request: Request):
+    """Collapsed stacks of a profiled request (flamegraph.pl / speedscope input)"""
+    require_profile_admin(request)
+    collapsed = await run_in_threadpool(profile_store.get, request_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="No profile recorded for this request")
+    return Response(content=collapsed, media_type="text/plain; charset=utf-8")
+
+@app.post("/api/demo/clear-titles", response_class=FastJSONResponse)
 async def clear_demo_titles():
     """Clear all story titles from database"""
     try:
         # Delete all stories from the database
-        result = supabase.table("stories").delete().neq("id", "").execute()
+        deleted_count = dao_factory.get_story_dao().delete_all_stories()
         return {
             "success": True,
             "message": "All story titles cleared from database",
-            "deleted_count": len(result.data) if result.data else 0
+            "deleted_count": deleted_count
         }
     except Exception as e:
         return {
@@ -901,7 +1430,7 @@ async def clear_demo_titles():
             "message": f"Error clearing titles: {str(e)}"
         }
 
-@app.get("/api/demo/titles")
+@app.get("/api/demo/titles", response_class=FastJSONResponse)
 async def get_demo_titles():
     """Get all story titles from database"""
     try:
@@ -921,9 +1450,9 @@ async def get_demo_titles():
 
 
 # User Management Endpoints
-@app.get("/api/user/stories")
-async def get_user_stories(user_id: Optional[str] = None, user_email: Optional[str] = None):
-    """Get all stories for a user by user_id or user_email"""
+@app.get("/api/user/stories", response_model=StoryListResponse, response_model_exclude_unset=True)
+async def get_user_stories(request: Request, response: Response, user_id: Optional[str] = None, user_email: Optional[str] = None):
+    """Get all stories for a user by user_id or user_email (with ETag / If-None-Match support)"""
     try:
         if not dao_factory:
             return {
@@ -947,39 +1476,81 @@ async def get_user_stories(user_id: Optional[str] = None, user_email: Optional[s
                 "message": "User not found"
             }
         
+        version = story_dao.get_user_stories_version(str(user.id))
+        if version is not None:
+            etag = make_etag("user_stories", user.id, version)
+            if etag_matches(request.headers.get("if-none-match"), etag):
+                return not_modified(etag)
+            response.headers.update(cache_headers(etag))
+        
         # Get user's stories
         stories = story_dao.get_user_stories(str(user.id))
         
         # Convert Story objects to dictionaries for JSON serialization
-        stories_dict = []
-        for story in stories:
-            story_dict = {
-                "id": story.id,
-                "title": story.title,
-                # "status": "completed" if story.future_story else "created",
-                "status": story.status,
-                "cover_image_url": story.cover_image_url,
-                "created_at": story.created_at.isoformat() if hasattr(story.created_at, 'isoformat') else story.created_at,
-                "updated_at": story.updated_at.isoformat() if hasattr(story.updated_at, 'isoformat') else story.updated_at,
-                "nb_scenes": story.nb_scenes,
-                "nb_chars": story.nb_chars,
-                "story_mode": story.story_mode
-            }
-            stories_dict.append(story_dict)
-        
         return {
             "success": True,
-            "stories": stories_dict
+            "stories": [story.to_json(Story.LISTING_FIELDS) for story in stories]
         }
         
     except Exception as e:
-        print(f"Error fetching user stories: {e}")
+        logger.error(f"Error fetching user stories: {e}")
         return {
             "success": False,
             "message": f"Error fetching stories: {str(e)}"
         }
 
-@app.get("/api/users/email/{email}")
+@app.get("/api/user/export")
+async def export_user_library(user_id: Optional[str] = None, user_email: Optional[str] = None):
+    """Download every story of a user as one ZIP of story packages
+
+    The X-Export-ID response header names the export; poll
+    /api/user/export/{export_id} for its progress while it downloads.
+    """
+    if not dao_factory:
+        raise HTTPException(status_code=500, detail="Database not available")
+    
+    user_dao = dao_factory.get_user_dao()
+    user = None
+    if user_email:
+        user = user_dao.get_user_by_email(user_email)
+    elif user_id:
+        user = user_dao.get_user(user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    story_dao = dao_factory.get_story_dao()
+    export = export_registry.create(str(user.id), story_dao.count_user_stories(str(user.id)))
+    
+    # Starlette iterates this sync generator in the threadpool
+    return StreamingResponse(
+        stream_library_export(
+            export["export_id"],
+            iter_story_pages(story_dao, str(user.id), EXPORT_PAGE_SIZE),
+            dao_factory.get_scene_dao().get_scenes_for_stories,
+            stored_story_package,
+            download_image_from_supabase,
+            concurrency=EXPORT_FETCH_CONCURRENCY,
+            deadline_seconds=EXPORT_DEADLINE_SECONDS
+        ),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename=creaition_library_{datetime.utcnow():%Y%m%d}.zip",
+            "X-Export-ID": export["export_id"]
+        }
+    )
+
+@app.get("/api/user/export/{export_id}", response_class=FastJSONResponse)
+async def get_export_progress(export_id: str):
+    """Progress of a library export"""
+    export = export_registry.get(export_id)
+    if not export:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return {
+        "success": True,
+        "export": export
+    }
+
+@app.get("/api/users/email/{email}", response_class=FastJSONResponse)
 async def get_user_by_email(email: str):
     """Get user data by email address"""
     try:
@@ -987,14 +1558,12 @@ async def get_user_by_email(email: str):
         user = user_dao.get_user_by_email(email)
         
         if user:
+            credits = credit_ledger.balance(email) if credit_ledger else None
+            if credits is not None:
+                user.credits = credits
             return {
                 "success": True,
-                "user": {
-                    "id": user.id,
-                    "username": user.username,
-                    "email": user.email,
-                    "credits": user.credits
-                }
+                "user": user.to_json()
             }
         else:
             return {
@@ -1002,14 +1571,14 @@ async def get_user_by_email(email: str):
                 "message": "User not found"
             }
     except Exception as e:
-        print(f"Error fetching user: {e}")
+        logger.error(f"Error fetching user: {e}")
         return {
             "success": False,
             "message": f"Error fetching user: {str(e)}"
         }
 
 
-@app.post("/api/users/create")
+@app.post("/api/users/create", response_class=FastJSONResponse)
 async def create_user(request: CreateUserRequest):
     """Create a new user in the database"""
     try:
@@ -1020,12 +1589,7 @@ async def create_user(request: CreateUserRequest):
         if existing_user:
             return {
                 "success": True,
-                "user": {
-                    "id": existing_user.id,
-                    "username": existing_user.username,
-                    "email": existing_user.email,
-                    "credits": existing_user.credits
-                },
+                "user": existing_user.to_json(),
                 "message": "User already exists"
             }
         
@@ -1043,12 +1607,7 @@ async def create_user(request: CreateUserRequest):
             created_user = user_dao.get_user_by_email(request.email)
             return {
                 "success": True,
-                "user": {
-                    "id": created_user.id,
-                    "username": created_user.username,
-                    "email": created_user.email,
-                    "credits": created_user.credits
-                }
+                "user": created_user.to_json()
             }
         else:
             return {
@@ -1056,19 +1615,22 @@ async def create_user(request: CreateUserRequest):
                 "message": "Failed to create user"
             }
     except Exception as e:
-        print(f"Error creating user: {e}")
+        logger.error(f"Error creating user: {e}")
         return {
             "success": False,
             "message": f"Error creating user: {str(e)}"
         }
 
 
-@app.post("/api/users/email/{email}/credits")
+@app.post("/api/users/email/{email}/credits", response_class=FastJSONResponse)
 async def update_user_credits(email: str, request: UpdateCreditsRequest):
     """Update user credits by email"""
     try:
-        user_dao = dao_factory.get_user_dao()
-        success = user_dao.update_user_credits(email, request.credits)
+        if credit_ledger:
+            # Goes through the ledger so open reservations and pending charges stay consistent
+            success = credit_ledger.set_balance(email, request.credits)
+        else:
+            success = dao_factory.get_user_dao().update_user_credits(email, request.credits)
         
         if success:
             return {
@@ -1081,16 +1643,40 @@ async def update_user_credits(email: str, request: UpdateCreditsRequest):
                 "message": "Failed to update credits"
             }
     except Exception as e:
-        print(f"Error updating credits: {e}")
+        logger.error(f"Error updating credits: {e}")
         return {
             "success": False,
             "message": f"Error updating credits: {str(e)}"
         }
 
 
+@app.get("/api/users/email/{email}/credits", response_class=FastJSONResponse)
+async def get_user_credits(email: str):
+    """Get available credits from the ledger's cached aggregate"""
+    if not credit_ledger:
+        return {
+            "success": False,
+            "message": "Database not available"
+        }
+    details = credit_ledger.balance_details(email)
+    if details is None:
+        return {
+            "success": False,
+            "message": "User not found"
+        }
+    return {
+        "success": True,
+        **details
+    }
+
+
 @app.get("/api/stories/{story_id}/download")
-async def download_story_package(story_id: str):
-    """Download a complete story package as a ZIP file containing images and story text"""
+async def download_story_package(story_id: str, request: Request):
+    """Download a complete story package as a ZIP file containing images and story text
+
+    Completed stories are served from their prebuilt package (with ETag and
+    Range support); otherwise the package is streamed as it is built.
+    """
     try:
         if not dao_factory:
             raise HTTPException(status_code=500, detail="Database not available")
@@ -1102,133 +1688,39 @@ async def download_story_package(story_id: str):
         if not story_data:
             raise HTTPException(status_code=404, detail="Story not found")
         
-        # Create a temporary directory for organizing files
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            
-            # Create story text file
-            story_title = story_data.title or 'Untitled Story'
-            safe_title = "".join(c for c in story_title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            
-            story_content = f"""STORY TITLE: {story_title}\n
-
-                BACKGROUND STORY:
-                {story_data.background_story or 'No background story provided.'}
-
-                STORY NARRATIVE:
-                {story_data.scenes_paragraph or 'No narrative available.'}
-
-                STORY DETAILS:
-                - Number of Scenes: {story_data.nb_scenes or 'Unknown'}
-                - Number of Characters: {story_data.nb_chars or 'Unknown'}
-                - Story Mode: {story_data.story_mode or 'Unknown'}
-                - Created: {story_data.created_at or 'Unknown'}
-            """
-            
-            # Write story text file
-            story_file_path = temp_path / f"{safe_title}_story.txt"
-            with open(story_file_path, 'w', encoding='utf-8') as f:
-                f.write(story_content)
-            
-            # Download scene images
-            scene_dao = dao_factory.get_scene_dao()
-            scenes = scene_dao.get_story_scenes(story_id)
-            
-            downloaded_files = [story_file_path]
-            
-            if scenes:
-                # Create images directory
-                images_dir = temp_path / "images"
-                images_dir.mkdir(exist_ok=True)
-                
-                for scene in scenes:
-                    if scene.image_url:
-                        try:
-                            # Download the image
-                            response = requests.get(scene.image_url, timeout=30)
-                            response.raise_for_status()
-                            
-                            # Determine file extension from URL or content type
-                            scene_number = scene.scene_number or 'unknown'
-                            scene_title = scene.title or f'Scene_{scene_number}'
-                            safe_scene_title = "".join(c for c in scene_title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                            
-                            # Try to get extension from URL
-                            url_path = scene.image_url.split('?')[0]  # Remove query parameters
-                            if '.' in url_path:
-                                extension = url_path.split('.')[-1].lower()
-                                if extension not in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-                                    extension = 'jpg'  # Default fallback
-                            else:
-                                extension = 'jpg'  # Default fallback
-                            
-                            image_filename = f"scene_{scene_number:02d}_{safe_scene_title}.{extension}"
-                            image_path = images_dir / image_filename
-                            
-                            # Save the image
-                            with open(image_path, 'wb') as img_file:
-                                img_file.write(response.content)
-                            
-                            downloaded_files.append(image_path)
-                            print(f"✅ Downloaded scene image: {image_filename}")
-                            
-                        except Exception as e:
-                            print(f"⚠️ Failed to download image for scene {scene.scene_number or 'unknown'}: {e}")
-                            continue
-            
-            # Download cover image if available
-            if story_data.cover_image_url:
-                try:
-                    response = requests.get(story_data.cover_image_url, timeout=30)
-                    response.raise_for_status()
-                    
-                    # Get extension for cover image
-                    url_path = story_data.cover_image_url.split('?')[0]
-                    if '.' in url_path:
-                        extension = url_path.split('.')[-1].lower()
-                        if extension not in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-                            extension = 'jpg'
-                    else:
-                        extension = 'jpg'
-                    
-                    cover_filename = f"cover_image.{extension}"
-                    cover_path = temp_path / cover_filename
-                    
-                    with open(cover_path, 'wb') as cover_file:
-                        cover_file.write(response.content)
-                    
-                    downloaded_files.append(cover_path)
-                    print(f"✅ Downloaded cover image: {cover_filename}")
-                    
-                except Exception as e:
-                    print(f"⚠️ Failed to download cover image: {e}")
-            
-            # Create ZIP file in memory
-            zip_buffer = io.BytesIO()
-            
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                for file_path in downloaded_files:
-                    # Get relative path within temp directory
-                    arcname = file_path.relative_to(temp_path)
-                    zip_file.write(file_path, arcname)
-            
-            zip_buffer.seek(0)
-            
-            # Create filename for ZIP
-            zip_filename = f"{safe_title}_story_package.zip"
-            
-            # Return ZIP file as streaming response
-            return StreamingResponse(
-                io.BytesIO(zip_buffer.read()),
-                media_type="application/zip",
-                headers={"Content-Disposition": f"attachment; filename={zip_filename}"}
-            )
+        if package_store and story_data.status == "completed":
+            etag = package_store.etag(story_data)
+            package_path = package_store.get(story_data)
+            if package_path:
+                if etag_matches(request.headers.get("if-none-match"), etag):
+                    return not_modified(etag)
+                return FileResponse(
+                    package_path,
+                    media_type="application/zip",
+                    filename=package_filename(story_data),
+                    headers={"ETag": etag}
+                )
+            # Missing or stale after an edit: stream this one, build for next time
+            schedule_package_build(story_id)
+        
+        scenes = dao_factory.get_scene_dao().get_story_scenes(story_id)
+        
+        # Entries are written and sent one by one as each image is read;
+        # Starlette iterates this sync generator in the threadpool
+        return StreamingResponse(
+            stream_story_package(
+                story_data, scenes, download_image_from_supabase,
+                concurrency=EXPORT_FETCH_CONCURRENCY,
+                deadline_seconds=EXPORT_DEADLINE_SECONDS
+            ),
+            media_type="application/zip",
+            headers={"Content-Disposition": f"attachment; filename={package_filename(story_data)}"}
+        )
     
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error creating story package: {e}")
-        traceback.print_exc()
+        logger.error(f"Error creating story package: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to create story package: {str(e)}")
 
 
@@ -0,0 +1,71 @@
+"""
+fields= selection for story reads
+`fields=title,status,scenes.image_url,characters` picks story attributes and
+nested collections: a bare collection name returns it in full, a dotted
+name returns only that attribute of each item. The selection is also the
+column list handed to the DAOs, so unrequested columns are never read.
+"""
+
+from typing import Optional, Tuple
+
+from Story import Story
+from Scene import Scene
+from User_Character import User_Character
+
+# Nested collection name -> model whose JSON fields it exposes
+COLLECTIONS = {"characters": User_Character, "scenes": Scene}
+# Columns always read for each model (ids, and the scene number scenes are keyed by)
+REQUIRED_COLUMNS = {Story: ("id",), User_Character: ("id",), Scene: ("id", "scene_number")}
+
+
+class FieldSelection:
+    """Parsed fields= value; a collection's fields are None when it is not requested"""
+
+    def __init__(self, story: Tuple[str, ...], characters: Optional[Tuple[str, ...]], scenes: Optional[Tuple[str, ...]]):
+        self.story = story
+        self.characters = characters
+        self.scenes = scenes
+
+    @staticmethod
+    def columns(model, fields: Tuple[str, ...]) -> Tuple[str, ...]:
+        """Columns to read for the given output fields"""
+        required = REQUIRED_COLUMNS[model]
+        return required + tuple(field for field in fields if field not in required)
+
+
+def parse_fields(fields: str) -> FieldSelection:
+    """Parse a fields= value; raises ValueError naming any unknown field"""
+    story_fields = []
+    nested = {name: None for name in COLLECTIONS}
+    unknown = []
+    for item in (part.strip() for part in fields.split(",")):
+        if not item:
+            continue
+        name, _, attribute = item.partition(".")
+        if name in COLLECTIONS:
+            model = COLLECTIONS[name]
+            chosen = nested[name] if nested[name] is not None else []
+            if not attribute:
+                chosen = list(model.JSON_FIELDS)
+            elif attribute in model.JSON_FIELDS:
+                if attribute not in chosen:
+                    chosen.append(attribute)
+            else:
+                unknown.append(item)
+            nested[name] = chosen
+        elif not attribute and item in Story.JSON_FIELDS:
+            if item not in story_fields:
+                story_fields.append(item)
+        else:
+            unknown.append(item)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    def with_id(chosen):
+        return tuple(["id"] + [field for field in chosen if field != "id"])
+
+    return FieldSelection(
+        with_id(story_fields),
+        with_id(nested["characters"]) if nested["characters"] is not None else None,
+        with_id(nested["scenes"]) if nested["scenes"] is not None else None
+    )
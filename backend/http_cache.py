@@ -0,0 +1,33 @@
+"""
+Conditional GET helpers
+Endpoints compute a strong ETag from a cheap version query and answer
+If-None-Match with 304 Not Modified before loading anything else.
+"""
+
+import hashlib
+from typing import Dict, Optional
+
+from fastapi.responses import Response
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag for the given version parts"""
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names etag (or is *)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    """ETag plus no-cache, so browsers keep the response but revalidate it on every use"""
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
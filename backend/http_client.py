@@ -0,0 +1,121 @@
+"""
+Shared pooled HTTP client for storage downloads
+All storage GETs (reference images for Gemini, the ZIP export) go through one
+httpx.Client so connections are kept alive and reused instead of paying a new
+TCP + TLS handshake per image. HTTP/2 is negotiated when the h2 package is
+installed. Connection reuse is tracked through httpcore's trace hook.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from config import (
+    HTTP2_ENABLED, HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE,
+    HTTP_KEEPALIVE_EXPIRY, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+)
+
+try:
+    import h2  # noqa: F401  (only needed for httpx's HTTP/2 support)
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+
+class _ClientStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.new_connections = 0
+        self.bytes_downloaded = 0
+        self.total_ms = 0.0
+        self.http_versions: Dict[str, int] = {}
+
+    def trace(self, event_name: str, info: Dict[str, Any]):
+        """httpcore trace hook: a TCP connect means the pool had no idle connection to reuse"""
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    def record(self, response: Optional[httpx.Response], elapsed_ms: float):
+        with self._lock:
+            self.requests += 1
+            self.total_ms += elapsed_ms
+            if response is None:
+                self.errors += 1
+                return
+            self.bytes_downloaded += len(response.content)
+            self.http_versions[response.http_version] = self.http_versions.get(response.http_version, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(self.requests - self.errors - self.new_connections, 0)
+            completed = self.requests - self.errors
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_rate": round(reused / completed, 4) if completed else 0.0,
+                "bytes_downloaded": self.bytes_downloaded,
+                "avg_ms": round(self.total_ms / self.requests, 2) if self.requests else 0.0,
+                "http_versions": dict(self.http_versions),
+                "http2": HTTP2_ENABLED and H2_AVAILABLE
+            }
+
+
+stats = _ClientStats()
+
+
+def get_http_client() -> httpx.Client:
+    """Return the process-wide client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    http2=HTTP2_ENABLED and H2_AVAILABLE,
+                    limits=httpx.Limits(
+                        max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                    ),
+                    timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                    follow_redirects=True
+                )
+    return _client
+
+
+def http_get(url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    """GET url on the shared client, raising for 4xx/5xx responses (a 304 is returned as is)"""
+    started = time.perf_counter()
+    response = None
+    try:
+        response = get_http_client().get(url, headers=headers, extensions={"trace": stats.trace})
+        if response.is_error:
+            response.raise_for_status()
+        return response
+    except Exception:
+        response = None
+        raise
+    finally:
+        stats.record(response, (time.perf_counter() - started) * 1000)
+
+
+def close_http_client():
+    """Close pooled connections (called on application shutdown)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def http_client_stats() -> Dict[str, Any]:
+    return stats.snapshot()
@@ -4,6 +4,13 @@ import re
 from User_Character import User_Character
 from Scene import Scene
 from supabase_storage import save_temp_image_for_upload
+from app_logging import get_logger, debug_payloads
+from metrics import gemini_call
+from tracing import span
+
+NARRATIVE_MODEL = "gemini-2.5-flash"
+
+logger = get_logger(__name__)
 
 def generate_narrative_scenes(client: genai.Client, chars_data: User_Character, background_story: str, nb_scenes: int) -> tuple[str, str, list]:
     # Upload multiple files
@@ -18,7 +25,8 @@ def generate_narrative_scenes(client: genai.Client, chars_data: User_Character,
         # Download to temporary file for Gemini upload
         temp_file_path = save_temp_image_for_upload(char_data.image_url)
         temp_files.append(temp_file_path)
-        uploaded_file = client.files.upload(file=temp_file_path)
+        with span("gemini.file_upload"), gemini_call("files", "upload"):
+            uploaded_file = client.files.upload(file=temp_file_path)
         uploaded_files.append(uploaded_file)
     
     dynamic_character_section = "\n".join(all_characters_context)
@@ -133,13 +141,15 @@ def generate_narrative_scenes(client: genai.Client, chars_data: User_Character,
         }}
         """
     # Inject the dynamic context
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=uploaded_files + [prompt]
-    )
+    with span("gemini.narrative", model=NARRATIVE_MODEL, nb_scenes=nb_scenes), gemini_call(NARRATIVE_MODEL, "generate_content"):
+        response = client.models.generate_content(
+            model=NARRATIVE_MODEL,
+            contents=uploaded_files + [prompt]
+        )
     
     # Parse and format the response
-    return format_response(chars_data, response.text)
+    with span("narrative.parse"):
+        return format_response(chars_data, response.text)
 
 def format_response(chars_data: User_Character, raw_response: str) -> tuple[str, str, list]:
     """
@@ -245,7 +255,8 @@ def format_response(chars_data: User_Character, raw_response: str) -> tuple[str,
         scenes_paragraph_parts = []
         
         for scene_data in scenes_data:
-            print(f"DEBUG: Processing scene_data: {scene_data}")
+            if debug_payloads():
+                logger.debug(f"Processing scene_data: {scene_data}")
             # Create Scene object with additional null safety
             title = scene_data.get("scene_title", "") if scene_data else ""
             narrative_text = scene_data.get("scene_narrative_text", "") if scene_data else ""
@@ -263,7 +274,7 @@ def format_response(chars_data: User_Character, raw_response: str) -> tuple[str,
                 scene_number=scene_number,
                 image_prompt=image_prompt
             )
-            print(f"DEBUG: Created scene {scene_number}: title='{title}', narrative_length={len(narrative_text)}, prompt_length={len(image_prompt)}")
+            logger.debug(f"Created scene {scene_number}: title='{title}', narrative_length={len(narrative_text)}, prompt_length={len(image_prompt)}")
             scenes_list.append(scene)
             
             # Add to scenes paragraph
@@ -277,7 +288,7 @@ def format_response(chars_data: User_Character, raw_response: str) -> tuple[str,
         return analysis, scenes_paragraph, scenes_list
         
     except json.JSONDecodeError as e:
-        print(f"JSON parsing failed: {e}")
+        logger.warning(f"JSON parsing failed: {e}")
         # Fallback to manual extraction
         return extract_content_manually(raw_response)
     except Exception as e:
@@ -0,0 +1,155 @@
+"""
+Bulk library export
+Streams one ZIP holding the package of every story a user has, as nested
+per-story ZIPs. Stories are read a page at a time (one stories query and one
+scenes query per page), prebuilt packages from the package store are copied
+in as they are, and the rest are built on the fly with their images fetched
+concurrently. Progress is kept in export_registry under the export id, which
+the client can poll while the download runs.
+"""
+
+import os
+import threading
+import time
+import uuid
+import zipfile
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from Story import Story
+from story_package import StreamSink, safe_name, stream_story_package, write_entry_chunks, PACKAGE_CHUNK_SIZE
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class ExportRegistry:
+    """In-process progress of running and recent library exports"""
+
+    MAX_EXPORTS = 200
+
+    def __init__(self):
+        self._exports: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, user_id: str, stories_total: int) -> Dict[str, Any]:
+        export = {
+            "export_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "status": "running",
+            "stories_total": stories_total,
+            "stories_done": 0,
+            "packages_reused": 0,
+            "current_story": None,
+            "missing_images": [],
+            "bytes_sent": 0,
+            "started_at": time.time(),
+            "finished_at": None,
+            "error": None
+        }
+        with self._lock:
+            while len(self._exports) >= self.MAX_EXPORTS:
+                del self._exports[next(iter(self._exports))]
+            self._exports[export["export_id"]] = export
+        return export
+
+    def get(self, export_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            export = self._exports.get(export_id)
+            if not export:
+                return None
+            snapshot = dict(export)
+            snapshot["missing_images"] = list(export["missing_images"])
+        total = snapshot["stories_total"]
+        snapshot["progress"] = round(snapshot["stories_done"] / total, 4) if total else 1.0
+        return snapshot
+
+    def update(self, export_id: str, **changes):
+        with self._lock:
+            if export_id in self._exports:
+                self._exports[export_id].update(changes)
+
+    def advance(self, export_id: str, key: str, amount=1):
+        with self._lock:
+            if export_id in self._exports:
+                self._exports[export_id][key] += amount
+
+
+export_registry = ExportRegistry()
+
+
+def iter_story_pages(story_dao, user_id: str, page_size: int) -> Iterator[List[Story]]:
+    """Page through a user's stories with the listing DAO"""
+    offset = 0
+    while True:
+        page = story_dao.get_user_stories(user_id, limit=page_size, offset=offset)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        offset += page_size
+
+
+def story_archive_name(story: Story) -> str:
+    """Name of a story's package inside the library archive (the id keeps equal titles apart)"""
+    return f"{safe_name(story.title or 'Untitled Story')}_{str(story.id)[:8]}.zip"
+
+
+def _read_file(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(PACKAGE_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def stream_library_export(export_id: str, pages: Iterator[List[Story]],
+                          scenes_for: Callable[[List[str]], Dict[str, list]],
+                          stored_package: Callable[[Story, list], Optional[str]],
+                          fetch: Callable[[str], object], **package_options) -> Iterator[bytes]:
+    """Yield the library ZIP piece by piece
+
+    scenes_for(story_ids) returns the scenes of a page of stories;
+    stored_package(story, scenes) returns the path of a prebuilt package or None.
+    """
+    sink = StreamSink()
+    try:
+        with zipfile.ZipFile(sink, "w") as archive:
+            for page in pages:
+                scenes_by_story = scenes_for([story.id for story in page])
+                for story in page:
+                    export_registry.update(export_id, current_story=story.id)
+                    scenes = scenes_by_story.get(story.id, [])
+                    arcname = story_archive_name(story)
+                    path = stored_package(story, scenes)
+                    if path:
+                        chunks = _read_file(path)
+                        force_zip64 = os.path.getsize(path) > zipfile.ZIP64_LIMIT
+                        export_registry.advance(export_id, "packages_reused")
+                    else:
+                        failures = []
+                        chunks = stream_story_package(story, scenes, fetch, failures=failures, **package_options)
+                        force_zip64 = True  # size unknown until the package is built
+                    for data in write_entry_chunks(archive, sink, arcname, chunks, compress=False, force_zip64=force_zip64):
+                        if data:
+                            export_registry.advance(export_id, "bytes_sent", len(data))
+                            yield data
+                    if not path and failures:
+                        export_registry.advance(export_id, "missing_images", [
+                            {"story_id": story.id, **failure} for failure in failures
+                        ])
+                    export_registry.advance(export_id, "stories_done")
+        # Central directory
+        data = sink.drain()
+        export_registry.advance(export_id, "bytes_sent", len(data))
+        yield data
+        export_registry.update(export_id, status="completed", current_story=None, finished_at=time.time())
+        logger.info(f"✅ Library export {export_id} completed")
+    except GeneratorExit:
+        export_registry.update(export_id, status="cancelled", finished_at=time.time())
+        logger.warning(f"⚠️ Library export {export_id} cancelled by the client")
+        raise
+    except Exception as e:
+        export_registry.update(export_id, status="failed", error=str(e), finished_at=time.time())
+        logger.error(f"❌ Library export {export_id} failed: {e}")
+        raise
@@ -0,0 +1,136 @@
+"""
+Filesystem-backed stand-in for the Supabase storage helpers
+Selected with STORAGE_BACKEND=local: objects are written under
+LOCAL_STORAGE_DIR and served by the API at LOCAL_STORAGE_URL, so the same
+URLs work for the frontend, the AI pipeline and the ZIP export.
+"""
+
+import hashlib
+import hmac
+import os
+import shutil
+import time
+from urllib.parse import quote
+from config import ASSETS_FOLDER, LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL, API_ROOT
+from config import UPLOAD_PRESIGN_TTL_SECONDS, UPLOAD_SIGNING_SECRET, UPLOAD_CHUNK_SIZE
+from http_client import http_get
+from storage_cache import get_storage_cache, map_file
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+def _object_path(file_path: str) -> str:
+    """Resolve a storage key to a file under LOCAL_STORAGE_DIR, refusing keys that escape it"""
+    root = os.path.abspath(LOCAL_STORAGE_DIR)
+    path = os.path.abspath(os.path.join(root, file_path))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"Invalid storage path: {file_path}")
+    return path
+
+
+def upload_to_supabase_storage(file_content: bytes, file_name: str, folder: str = ASSETS_FOLDER) -> str:
+    """Write file to local storage and return its public URL"""
+    try:
+        file_path = f"{folder.strip('/')}/{file_name}"
+        path = _object_path(file_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a half-written object
+        tmp_path = f"{path}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(file_content)
+        os.replace(tmp_path, path)
+        return f"{LOCAL_STORAGE_URL}/{file_path}"
+    except Exception as e:
+        logger.error(f"Error uploading to local storage: {e}")
+        raise e
+
+
+def upload_stream_to_storage(fileobj, file_name: str, folder: str = ASSETS_FOLDER, content_type: str = None) -> str:
+    """Copy a file object to local storage chunk by chunk and return its public URL"""
+    try:
+        file_path = f"{folder.strip('/')}/{file_name}"
+        path = _object_path(file_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.part"
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(fileobj, f, UPLOAD_CHUNK_SIZE)
+        os.replace(tmp_path, path)
+        return f"{LOCAL_STORAGE_URL}/{file_path}"
+    except Exception as e:
+        logger.error(f"Error streaming upload to local storage: {e}")
+        raise e
+
+
+def get_supabase_storage_url(file_name: str, folder: str = ASSETS_FOLDER) -> str:
+    """Get public URL for a file in local storage"""
+    return f"{LOCAL_STORAGE_URL}/{folder.strip('/')}/{file_name}"
+
+
+def local_path_for_url(image_url: str):
+    """Return the local file behind a local storage URL, or None for any other URL"""
+    prefix = f"{LOCAL_STORAGE_URL}/"
+    if not image_url or not image_url.startswith(prefix):
+        return None
+    return _object_path(image_url[len(prefix):].split("?")[0])
+
+
+def download_image_from_supabase(image_url: str) -> bytes:
+    """Memory-map image from local storage (other URLs go through the storage cache)"""
+    try:
+        path = local_path_for_url(image_url)
+        if path is None:
+            cache = get_storage_cache()
+            return cache.get(image_url) if cache else http_get(image_url).content
+        return map_file(path)
+    except Exception as e:
+        logger.error(f"❌ Failed to read image from local storage: {e}")
+        raise e
+
+
+def _upload_signature(file_path: str, expires: int) -> str:
+    message = f"{file_path}:{expires}".encode("utf-8")
+    return hmac.new(UPLOAD_SIGNING_SECRET.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def create_signed_upload_url(file_path: str) -> dict:
+    """Create a signed URL the client can PUT file_path to (served by fast_api.py)"""
+    expires = int(time.time()) + UPLOAD_PRESIGN_TTL_SECONDS
+    token = _upload_signature(file_path, expires)
+    url = f"{API_ROOT}/api/uploads/local/{quote(file_path)}?expires={expires}&token={token}"
+    return {"url": url, "token": token, "method": "PUT"}
+
+
+def verify_signed_upload(file_path: str, expires: int, token: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_upload_signature(file_path, expires), token or "")
+
+
+def local_upload_path(file_path: str) -> str:
+    """File a signed upload to file_path is written to (parent directories created)"""
+    path = _object_path(file_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def storage_object_exists(file_path: str) -> bool:
+    """Check whether an object has been uploaded to file_path"""
+    try:
+        return os.path.isfile(_object_path(file_path))
+    except ValueError:
+        return False
+
+
+def read_storage_object_head(file_path: str, size: int = 16) -> bytes:
+    """First size bytes of the object at file_path"""
+    with open(_object_path(file_path), "rb") as f:
+        return f.read(size)
+
+
+def delete_storage_object(file_path: str):
+    """Remove the object at file_path"""
+    try:
+        os.unlink(_object_path(file_path))
+    except FileNotFoundError:
+        pass
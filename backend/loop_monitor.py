@@ -0,0 +1,180 @@
+"""
+Event loop stall detection
+A heartbeat task on the event loop wakes every LOOP_MONITOR_INTERVAL seconds
+and records how late it woke up (event_loop_lag_seconds). A watchdog thread
+watches the heartbeat: when the loop has not ticked for LOOP_STALL_THRESHOLD
+seconds, something is running blocking code on the loop thread, so it
+captures that thread's stack while the stall is still in progress, logs it
+with the request that was running, and counts it. Recent stalls are kept,
+grouped by the innermost application frame, so blocking calls can be found
+and moved off the loop one by one.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from app_logging import get_logger
+from metrics import registry, Counter, Gauge, Histogram
+
+logger = get_logger(__name__)
+
+EVENT_LOOP_LAG = registry.register(Histogram(
+    "event_loop_lag_seconds", "How late the event loop heartbeat woke up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)))
+EVENT_LOOP_STALLS = registry.register(Counter(
+    "event_loop_stalls_total", "Event loop stalls longer than the stall threshold"))
+EVENT_LOOP_STALL_DURATION = registry.register(Histogram(
+    "event_loop_stall_duration_seconds", "Duration of event loop stalls",
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)))
+EVENT_LOOP_LAST_LAG = registry.register(Gauge(
+    "event_loop_lag_last_seconds", "Lag of the most recent event loop heartbeat"))
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_STACK_LIMIT = 30
+
+
+def _app_frame(stack: traceback.StackSummary) -> Optional[str]:
+    """Innermost frame in this application's code (the call that blocked), as file:line function"""
+    for frame in reversed(stack):
+        path = os.path.abspath(frame.filename)
+        if path.startswith(_APP_DIR) and os.path.abspath(__file__) != path and "site-packages" not in path:
+            return f"{os.path.relpath(path, _APP_DIR)}:{frame.lineno} {frame.name}"
+    return None
+
+
+def request_of(frame) -> Dict[str, Optional[str]]:
+    """Method, path and request id of the HTTP request whose handler owns the frame
+
+    Found from the ASGI scope held by the routing frames further up the stack;
+    the request id is the one the request middleware stores in request.state.
+    """
+    while frame is not None:
+        try:
+            scope = frame.f_locals.get("scope")
+        except Exception:
+            scope = None
+        if isinstance(scope, dict) and scope.get("type") == "http":
+            state = scope.get("state") or {}
+            return {"method": scope.get("method"), "path": scope.get("path"), "request_id": state.get("request_id")}
+        frame = frame.f_back
+    return {"method": None, "path": None, "request_id": None}
+
+
+class LoopMonitor:
+    """Heartbeat task plus watchdog thread for one event loop"""
+
+    MAX_STALLS = 50
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.5):
+        self.interval = interval
+        self.threshold = threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._last_tick = time.monotonic()
+        self._stall: Optional[Dict[str, Any]] = None
+        self._stalls: "deque[Dict[str, Any]]" = deque(maxlen=self.MAX_STALLS)
+        self._by_frame: Dict[str, Dict[str, Any]] = {}
+        self.max_lag = 0.0
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Start monitoring; call from a coroutine running on the loop"""
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._task = loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            EVENT_LOOP_LAG.observe(lag)
+            EVENT_LOOP_LAST_LAG.set(lag)
+            with self._lock:
+                self._last_tick = now
+                self.max_lag = max(self.max_lag, lag)
+                stall, self._stall = self._stall, None
+            if stall:
+                self._end_stall(stall, lag)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                blocked_for = time.monotonic() - self._last_tick
+                if blocked_for < self.threshold or self._stall is not None:
+                    continue
+                stall = self._stall = self._capture(blocked_for)
+            EVENT_LOOP_STALLS.inc()
+            logger.warning(
+                f"⚠️ Event loop blocked for {blocked_for:.2f}s at {stall['frame'] or 'unknown frame'}\n{stall['stack']}",
+                extra={"stall_request_id": stall["request_id"], "stall_request": stall["request"]}
+            )
+
+    def _capture(self, blocked_for: float) -> Dict[str, Any]:
+        """Stack of the loop thread and the task it is running, taken mid-stall"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.extract_stack(frame, limit=_STACK_LIMIT) if frame is not None else traceback.StackSummary()
+        task = asyncio.current_task(self._loop) if self._loop else None
+        request = request_of(frame)
+        return {
+            "started_at": time.time() - blocked_for,
+            "detected_after_s": round(blocked_for, 3),
+            "duration_s": None,
+            "frame": _app_frame(stack),
+            "task": task.get_name() if task is not None else None,
+            "request": f"{request['method']} {request['path']}" if request["path"] else None,
+            "request_id": request["request_id"],
+            "stack": "".join(traceback.format_list(stack))
+        }
+
+    def _end_stall(self, stall: Dict[str, Any], lag: float):
+        # The heartbeat woke up this late: that is how long the loop was blocked
+        stall["duration_s"] = round(max(lag, stall["detected_after_s"] - self.interval), 3)
+        EVENT_LOOP_STALL_DURATION.observe(stall["duration_s"])
+        with self._lock:
+            self._stalls.append(stall)
+            key = stall["frame"] or "unknown"
+            summary = self._by_frame.setdefault(key, {"frame": key, "count": 0, "total_s": 0.0, "max_s": 0.0})
+            summary["count"] += 1
+            summary["total_s"] = round(summary["total_s"] + stall["duration_s"], 3)
+            summary["max_s"] = max(summary["max_s"], stall["duration_s"])
+        logger.info(f"Event loop stall at {key} lasted {stall['duration_s']:.2f}s",
+                    extra={"stall_request_id": stall["request_id"]})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "interval_s": self.interval,
+                "threshold_s": self.threshold,
+                "max_lag_s": round(self.max_lag, 4),
+                "stalls": sum(summary["count"] for summary in self._by_frame.values()),
+                "blocked_now_s": round(time.monotonic() - self._last_tick, 3) if self._stall else 0.0
+            }
+
+    def report(self) -> Dict[str, Any]:
+        """Stall summary per blocking frame (worst first) and the most recent stalls with stacks"""
+        with self._lock:
+            by_frame: List[Dict[str, Any]] = sorted(
+                (dict(summary) for summary in self._by_frame.values()), key=lambda summary: -summary["total_s"]
+            )
+            recent = list(reversed(self._stalls))
+        return dict(self.stats(), by_frame=by_frame, recent=recent)
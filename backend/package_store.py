@@ -0,0 +1,135 @@
+"""
+Prebuilt story package artifacts
+A completed story's ZIP package is built once (in the background, when the
+story is marked completed) and kept on disk under PACKAGE_CACHE_DIR, keyed by
+the story's updated_at. Downloads of an unchanged story are then served
+straight from the file, with an ETag and HTTP Range support so interrupted
+downloads can resume. Any edit bumps updated_at, so the next download misses,
+streams a fresh package and schedules a rebuild; older versions are removed
+once the new one is in place.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from Story import Story
+from story_package import stream_story_package
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class PackageStore:
+    """On-disk story packages, one current version per story"""
+
+    def __init__(self, directory: str, build_workers: int = 1):
+        self.directory = directory
+        self._executor = ThreadPoolExecutor(max_workers=build_workers, thread_name_prefix="package-build")
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.incomplete_builds = 0
+        self.build_errors = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def version(story: Story) -> str:
+        return hashlib.sha256(f"{story.id}:{story.updated_at}".encode("utf-8")).hexdigest()[:16]
+
+    def etag(self, story: Story) -> str:
+        return f'"{story.id}-{self.version(story)}"'
+
+    def _story_dir(self, story_id: str) -> str:
+        return os.path.join(self.directory, str(story_id))
+
+    def _path(self, story: Story) -> str:
+        return os.path.join(self._story_dir(story.id), f"{self.version(story)}.zip")
+
+    def get(self, story: Story) -> Optional[str]:
+        """Path of the package built for the story's current version, or None"""
+        path = self._path(story)
+        found = os.path.exists(path)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return path if found else None
+
+    def build(self, story: Story, scenes: list, fetch: Callable[[str], object], **package_options) -> Optional[str]:
+        """Write the package for the story's current version; returns its path
+
+        Packages missing images are not kept, so a later download retries them.
+        """
+        story_dir = self._story_dir(story.id)
+        os.makedirs(story_dir, exist_ok=True)
+        failures = []
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=story_dir, suffix=".part")
+        try:
+            with os.fdopen(tmp_fd, "wb") as f:
+                for chunk in stream_story_package(story, scenes, fetch, failures=failures, **package_options):
+                    f.write(chunk)
+            if failures:
+                with self._lock:
+                    self.incomplete_builds += 1
+                logger.warning(f"⚠️ Package for story {story.id} is missing {len(failures)} image(s); not cached")
+                os.unlink(tmp_path)
+                return None
+            path = self._path(story)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        # Drop the versions this one replaces
+        for name in os.listdir(story_dir):
+            if name.endswith(".zip") and os.path.join(story_dir, name) != path:
+                try:
+                    os.unlink(os.path.join(story_dir, name))
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self.builds += 1
+        logger.info(f"📦 Built package for story {story.id}")
+        return path
+
+    def schedule(self, story_id: str, build: Callable[[str], Any]):
+        """Run build(story_id) in the background unless a build for the story is already queued"""
+        with self._lock:
+            if story_id in self._scheduled:
+                return
+            self._scheduled.add(story_id)
+
+        def run():
+            try:
+                build(story_id)
+            except Exception as e:
+                with self._lock:
+                    self.build_errors += 1
+                logger.error(f"❌ Failed to build package for story {story_id}: {e}")
+            finally:
+                with self._lock:
+                    self._scheduled.discard(story_id)
+
+        self._executor.submit(run)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "builds": self.builds,
+                "incomplete_builds": self.incomplete_builds,
+                "build_errors": self.build_errors,
+                "scheduled": len(self._scheduled)
+            }
@@ -0,0 +1,140 @@
+"""
+On-demand sampling profiler for single requests
+An admin sends a request with the header `X-Profile: <PROFILER_ADMIN_TOKEN>`
+(or the query parameter `_profile=<token>`); only that request is profiled.
+A sampler thread reads the event loop thread's stack every PROFILER_INTERVAL
+seconds and keeps the samples taken while that request's handler was on the
+stack. The result is stored in collapsed-stack format ("frame;frame;frame
+count" lines, as read by flamegraph.pl, speedscope and friends) under the
+request id, which the response returns in X-Profile-ID. Requests without the
+header pay for one header lookup.
+
+Work handed to the threadpool (run_in_threadpool) runs on other threads and
+is not attributed to the request, so it is not in the profile.
+"""
+
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app_logging import get_logger
+from loop_monitor import request_of
+
+logger = get_logger(__name__)
+
+PROFILE_HEADER = "x-profile"
+PROFILE_QUERY_PARAM = "_profile"
+_MAX_DEPTH = 128
+
+
+def profile_token(headers, query_params) -> Optional[str]:
+    """Profiling token sent with a request, if any"""
+    return headers.get(PROFILE_HEADER) or query_params.get(PROFILE_QUERY_PARAM)
+
+
+def is_admin_token(token: Optional[str], admin_token: str) -> bool:
+    return bool(admin_token and token) and hmac.compare_digest(token.encode("utf-8"), admin_token.encode("utf-8"))
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})".replace(";", ":")
+
+
+def collapse(frame) -> str:
+    """Stack of a frame, root first, as one collapsed-stack line"""
+    names = []
+    while frame is not None and len(names) < _MAX_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class RequestProfiler:
+    """Samples the event loop thread while one request's handler is running on it"""
+
+    def __init__(self, request_id: str, interval: float = 0.005):
+        self.request_id = request_id
+        self.interval = interval
+        self._thread_id = threading.get_ident()
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+        self.ticks = 0
+
+    def start(self):
+        """Start sampling; call on the event loop thread"""
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name=f"profiler-{self.request_id[:8]}", daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.ticks += 1
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None or request_of(frame)["request_id"] != self.request_id:
+                continue
+            self._stacks[collapse(frame)] += 1
+
+    def stop(self, method: str, path: str, status: int) -> Dict[str, Any]:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        samples = sum(self._stacks.values())
+        return {
+            "request_id": self.request_id,
+            "request": f"{method} {path}",
+            "status": status,
+            "created_at": time.time(),
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "interval_ms": self.interval * 1000,
+            "ticks": self.ticks,
+            "samples": samples,
+            "collapsed": "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+        }
+
+
+class ProfileStore:
+    """Collapsed-stack profiles on disk, one file per request id; the newest max_profiles are kept"""
+
+    def __init__(self, directory: str, max_profiles: int = 50):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, request_id: str) -> str:
+        return os.path.join(self.directory, f"{os.path.basename(request_id)}.folded")
+
+    def save(self, profile: Dict[str, Any]):
+        request_id = profile["request_id"]
+        with open(self._path(request_id), "w", encoding="utf-8") as f:
+            f.write(profile["collapsed"])
+        with self._lock:
+            self._index[request_id] = {key: value for key, value in profile.items() if key != "collapsed"}
+            while len(self._index) > self.max_profiles:
+                old_id, _ = self._index.popitem(last=False)
+                try:
+                    os.unlink(self._path(old_id))
+                except FileNotFoundError:
+                    pass
+        logger.info(f"🔬 Profiled {profile['request']}: {profile['samples']} samples in {profile['duration_ms']:.0f}ms",
+                    extra={"profile_id": request_id})
+
+    def get(self, request_id: str) -> Optional[str]:
+        """Collapsed stacks of a profiled request"""
+        try:
+            with open(self._path(request_id), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(reversed(self._index.values()))
@@ -0,0 +1,282 @@
+"""
+Per-request query instrumentation for the DAO layer
+Every database round trip made through a DAO (Supabase query builder chains
+and RPCs, or SqliteDatabase statements) is recorded with its table, operation,
+row count, latency and estimated payload size, grouped by the current request
+id (see request_context.py). A request that runs the same query shape more than
+n_plus_one_threshold times is flagged as a probable N+1 pattern.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from request_context import get_request_id
+from metrics import DAO_QUERY_DURATION
+from tracing import record_span
+
+
+# DAO operations that show up as spans of a traced generation run
+_TRACED_OPERATIONS = ("insert", "update", "upsert", "delete", "rpc")
+
+
+def _row_size(row) -> int:
+    """Rough size of one row or parameter tuple: string lengths plus a fixed width per other value"""
+    values = row.values() if isinstance(row, dict) else row if isinstance(row, (list, tuple)) else (row,)
+    return sum(len(value) if isinstance(value, (str, bytes)) else 8 for value in values)
+
+
+def _payload_size(value) -> int:
+    """Estimated wire size of a request/response body
+
+    Sizes the first row only and multiplies by the row count, so recording a
+    query stays cheap however many rows it returned; nested values count as
+    fixed-width, which undercounts JSON columns.
+    """
+    if not value:
+        return 0
+    if isinstance(value, list) and isinstance(value[0], (dict, list, tuple)):
+        return _row_size(value[0]) * len(value)
+    return _row_size(value)
+
+
+class _RequestQueries:
+    """Queries recorded for one in-flight request"""
+
+    MAX_KEPT = 200
+
+    def __init__(self, request_id: str, label: str, client_request_id: Optional[str] = None):
+        self.request_id = request_id
+        self.label = label
+        self.client_request_id = client_request_id
+        self.started_at = time.time()
+        self.count = 0
+        self.total_ms = 0.0
+        self.total_bytes = 0
+        self.shapes: Dict[str, int] = {}
+        self.queries: List[Dict[str, Any]] = []
+
+    def add(self, query: Dict[str, Any]):
+        self.count += 1
+        self.total_ms += query["latency_ms"]
+        self.total_bytes += query["bytes"]
+        self.shapes[query["shape"]] = self.shapes.get(query["shape"], 0) + 1
+        if len(self.queries) < self.MAX_KEPT:
+            self.queries.append(query)
+
+
+class QueryRecorder:
+    """Collects query records per request and aggregate statistics per query shape"""
+
+    def __init__(self, n_plus_one_threshold: int = 5, max_requests: int = 200):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.max_requests = max_requests
+        self._active: Dict[str, _RequestQueries] = {}
+        self._finished: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._shapes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.flagged_requests = 0
+
+    # Request lifecycle
+
+    def begin(self, request_id: str, label: str = "", client_request_id: Optional[str] = None):
+        with self._lock:
+            self._active[request_id] = _RequestQueries(request_id, label, client_request_id)
+
+    def end(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """Close a request and return its summary (kept for later lookup)"""
+        with self._lock:
+            queries = self._active.pop(request_id, None)
+            if queries is None:
+                return None
+            summary = self._summarize(queries)
+            self.requests += 1
+            if summary["n_plus_one"]:
+                self.flagged_requests += 1
+            self._finished[request_id] = summary
+            while len(self._finished) > self.max_requests:
+                self._finished.popitem(last=False)
+        return summary
+
+    def _summarize(self, queries: _RequestQueries) -> Dict[str, Any]:
+        return {
+            "request_id": queries.request_id,
+            "client_request_id": queries.client_request_id,
+            "request": queries.label,
+            "queries": queries.count,
+            "total_ms": round(queries.total_ms, 2),
+            "bytes": queries.total_bytes,
+            "n_plus_one": [
+                {"shape": shape, "count": count}
+                for shape, count in sorted(queries.shapes.items(), key=lambda item: -item[1])
+                if count > self.n_plus_one_threshold
+            ],
+            "details": queries.queries
+        }
+
+    # Recording
+
+    def record(self, table: str, operation: str, shape: str, rows: int, latency_ms: float, payload_bytes: int):
+        query = {
+            "table": table,
+            "operation": operation,
+            "shape": shape,
+            "rows": rows,
+            "latency_ms": round(latency_ms, 3),
+            "bytes": payload_bytes
+        }
+        request_id = get_request_id()
+        DAO_QUERY_DURATION.observe(latency_ms / 1000, table=table, operation=operation)
+        if operation in _TRACED_OPERATIONS:
+            record_span(f"dao.{operation}", latency_ms, table=table, rows=rows)
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                stats = self._shapes[shape] = {
+                    "table": table, "operation": operation,
+                    "count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "bytes": 0
+                }
+            stats["count"] += 1
+            stats["total_ms"] += latency_ms
+            stats["max_ms"] = max(stats["max_ms"], latency_ms)
+            stats["rows"] += rows
+            stats["bytes"] += payload_bytes
+            if request_id and request_id in self._active:
+                self._active[request_id].add(query)
+
+    # Reporting
+
+    def request_summary(self, request_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if request_id in self._active:
+                return self._summarize(self._active[request_id])
+            return self._finished.get(request_id)
+
+    def aggregate(self) -> Dict[str, Any]:
+        """Per-shape totals plus the most recent requests flagged as N+1"""
+        with self._lock:
+            shapes = sorted(
+                (
+                    dict(stats, shape=shape,
+                         total_ms=round(stats["total_ms"], 2),
+                         max_ms=round(stats["max_ms"], 2),
+                         avg_ms=round(stats["total_ms"] / stats["count"], 3))
+                    for shape, stats in self._shapes.items()
+                ),
+                key=lambda stats: -stats["total_ms"]
+            )
+            flagged = [
+                {k: v for k, v in summary.items() if k != "details"}
+                for summary in reversed(self._finished.values()) if summary["n_plus_one"]
+            ]
+            return {
+                "requests": self.requests,
+                "flagged_requests": self.flagged_requests,
+                "n_plus_one_threshold": self.n_plus_one_threshold,
+                "shapes": shapes,
+                "recent_n_plus_one": flagged[:20]
+            }
+
+    def reset(self):
+        with self._lock:
+            self._finished.clear()
+            self._shapes.clear()
+            self.requests = 0
+            self.flagged_requests = 0
+
+
+# Supabase (postgrest) instrumentation
+
+_WRITE_OPERATIONS = ("insert", "update", "upsert", "delete")
+_FILTER_METHODS = {"eq", "neq", "gt", "gte", "lt", "lte", "like", "ilike", "is_", "in_", "contains", "match"}
+
+
+class _InstrumentedQuery:
+    """Wraps a postgrest builder chain and times its execute()"""
+
+    def __init__(self, builder, recorder: QueryRecorder, table: str, operation: str = "select",
+                 filters: tuple = (), request_bytes: int = 0):
+        self._builder = builder
+        self._recorder = recorder
+        self._table = table
+        self._operation = operation
+        self._filters = filters
+        self._request_bytes = request_bytes
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if not hasattr(result, "execute"):
+                return result
+            operation, filters, request_bytes = self._operation, self._filters, self._request_bytes
+            if name in _WRITE_OPERATIONS or (name == "select" and operation == "select"):
+                operation = name
+                if name in ("insert", "update", "upsert") and args:
+                    request_bytes = _payload_size(args[0])
+            elif name in _FILTER_METHODS and args:
+                filters = filters + (f"{args[0]} {name.rstrip('_')}",)
+            return _InstrumentedQuery(result, self._recorder, self._table, operation, filters, request_bytes)
+
+        return call
+
+    def execute(self):
+        started = time.perf_counter()
+        result = self._builder.execute()
+        latency_ms = (time.perf_counter() - started) * 1000
+        data = getattr(result, "data", None)
+        rows = len(data) if isinstance(data, list) else (1 if data else 0)
+        shape = f"{self._operation} {self._table}"
+        if self._filters:
+            shape += " where " + ", ".join(sorted(self._filters))
+        self._recorder.record(self._table, self._operation, shape, rows, latency_ms,
+                              self._request_bytes + _payload_size(data))
+        return result
+
+
+class InstrumentedClient:
+    """Supabase client proxy whose table() and rpc() chains are recorded"""
+
+    def __init__(self, client, recorder: QueryRecorder):
+        self._client = client
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def table(self, name: str):
+        return _InstrumentedQuery(self._client.table(name), self._recorder, name)
+
+    def rpc(self, fn: str, params: Optional[Dict[str, Any]] = None, *args, **kwargs):
+        builder = self._client.rpc(fn, params or {}, *args, **kwargs)
+        return _InstrumentedQuery(builder, self._recorder, fn, "rpc", request_bytes=_payload_size(params))
+
+
+# SQLite instrumentation
+
+_SQL_TABLE = re.compile(r"^\s*(SELECT\b.*?\bFROM|INSERT\b.*?\bINTO|UPDATE|DELETE\s+FROM)\s+(\w+)", re.I | re.S)
+_SQL_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+def record_sql(recorder: QueryRecorder, sql: str, params, rows: int, latency_ms: float, result=None):
+    """Record one statement run by SqliteDatabase"""
+    match = _SQL_TABLE.match(sql)
+    operation = sql.split(None, 1)[0].lower() if sql.strip() else "sql"
+    table = match.group(2) if match else "?"
+    shape = _SQL_IN_LIST.sub("(?, ...)", " ".join(sql.split()))
+    recorder.record(table, operation, shape, rows, latency_ms, _payload_size(params) + _payload_size(result))
+
+
+def instrument(client, recorder: QueryRecorder):
+    """Attach recorder to a database client used by the DAOs"""
+    if hasattr(client, "recorder"):
+        # SqliteDatabase records its own statements
+        client.recorder = recorder
+        return client
+    return InstrumentedClient(client, recorder)
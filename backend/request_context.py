@@ -0,0 +1,30 @@
+"""
+Per-request context shared by the instrumentation modules
+The HTTP middleware in fast_api.py sets the request id for the duration of a
+request; sync work handed to the threadpool inherits it through contextvars.
+"""
+
+import contextvars
+import uuid
+from typing import Optional
+
+request_id_var: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar("request_id", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    """Id of the request being handled, or None outside a request (background threads)"""
+    return request_id_var.get()
+
+
+def new_request_id() -> str:
+    """Mint the id a request is tracked under
+
+    Always server-generated: the query recorder and the profiler key
+    per-request state on it, so two requests must never share one.
+    """
+    return uuid.uuid4().hex
+
+
+def client_request_id(incoming: Optional[str]) -> Optional[str]:
+    """X-Request-ID sent by the client, kept only as a correlation field"""
+    return incoming[:128] if incoming else None
@@ -0,0 +1,111 @@
+"""
+Base class for the slotted domain models (Story, Scene, User_Character, User)
+Each subclass declares its database columns once; from_row / from_rows /
+to_row / to_json are then generated as straight-line code at class creation,
+so DAOs and handlers never walk attributes with getattr/dict.get loops.
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+
+def _iso(value):
+    """Render timestamps the way the API has always returned them"""
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+class RowModel:
+    __slots__ = ()
+
+    # (attribute, default) pairs that map one-to-one to database columns
+    COLUMNS: Sequence[tuple] = ()
+    # Columns whose NULL is read back as the default instead of None
+    COALESCE: Sequence[str] = ()
+    # (attribute, factory) pairs for in-memory attributes that are not columns
+    EXTRA: Sequence[tuple] = ()
+    # Attributes rendered as ISO strings by to_row / to_json
+    TIMESTAMPS: Sequence[str] = ("created_at", "updated_at")
+    # Attributes returned by to_json() when no field list is given
+    JSON_FIELDS: Sequence[str] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.COLUMNS:
+            _generate_converters(cls)
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name, None)!r}" for name, _ in self.COLUMNS)
+        return f"{type(self).__name__}({values})"
+
+    # Generic (field-list) paths; the no-argument paths are replaced per class
+
+    def to_row(self, columns: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        timestamps = self.TIMESTAMPS
+        return {
+            name: _iso(getattr(self, name)) if name in timestamps else getattr(self, name)
+            for name in columns
+        }
+
+    def to_json(self, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        timestamps = self.TIMESTAMPS
+        return {
+            name: _iso(getattr(self, name, None)) if name in timestamps else getattr(self, name, None)
+            for name in fields
+        }
+
+
+def _generate_converters(cls):
+    """Compile from_row/from_rows/to_row/to_json for cls from its declarations"""
+    columns = [name for name, _ in cls.COLUMNS]
+    extras = [name for name, _ in cls.EXTRA]
+    missing = set(cls.__slots__) - set(columns) - set(extras)
+    if missing:
+        raise TypeError(f"{cls.__name__}: slots without a column or EXTRA entry: {sorted(missing)}")
+
+    namespace: Dict[str, Any] = {"_iso": _iso, "_new": object.__new__}
+    lines = ["def from_row(cls, row):", "    self = _new(cls)", "    get = row.get"]
+    for i, (name, default) in enumerate(cls.COLUMNS):
+        namespace[f"_d{i}"] = default
+        if name in cls.COALESCE:
+            lines.append(f"    value = get({name!r})")
+            lines.append(f"    self.{name} = _d{i} if value is None else value")
+        else:
+            lines.append(f"    self.{name} = get({name!r}, _d{i})")
+    for i, (name, factory) in enumerate(cls.EXTRA):
+        namespace[f"_x{i}"] = factory
+        lines.append(f"    self.{name} = _x{i}()")
+    lines.append("    return self")
+
+    def render(names):
+        return ", ".join(
+            f"{name!r}: _iso(self.{name})" if name in cls.TIMESTAMPS else f"{name!r}: self.{name}"
+            for name in names
+        )
+
+    lines += [
+        "def to_row(self, columns=None):",
+        "    if columns is not None:",
+        "        return _generic_to_row(self, columns)",
+        f"    return {{{render(columns)}}}",
+        "def to_json(self, fields=None):",
+        "    if fields is not None:",
+        "        return _generic_to_json(self, fields)",
+        f"    return {{{render(cls.JSON_FIELDS)}}}",
+    ]
+    namespace["_generic_to_row"] = RowModel.to_row
+    namespace["_generic_to_json"] = RowModel.to_json
+    exec("\n".join(lines), namespace)
+
+    from_row = namespace["from_row"]
+
+    def from_rows(klass, rows: Optional[List[Dict[str, Any]]]) -> list:
+        return [from_row(klass, row) for row in rows or ()]
+
+    from_row.__doc__ = f"Build a {cls.__name__} from a database row"
+    from_rows.__doc__ = f"Build a list of {cls.__name__} from database rows"
+    namespace["to_row"].__doc__ = "Column values (timestamps as ISO strings), optionally restricted to columns"
+    namespace["to_json"].__doc__ = "API representation, optionally restricted to fields"
+    cls.from_row = classmethod(from_row)
+    cls.from_rows = classmethod(from_rows)
+    cls.to_row = namespace["to_row"]
+    cls.to_json = namespace["to_json"]
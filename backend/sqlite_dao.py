@@ -0,0 +1,610 @@
+"""
+Embedded SQLite implementation of the DAO interfaces
+Lets the API run (and be benchmarked / load-tested) on a single machine
+without a Supabase project. Selected with DB_BACKEND=sqlite in config.py.
+The schema mirrors database_setup.sql, including the indexes and the
+updated_at triggers.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from User_Character import User_Character
+from Story import Story
+from Scene import Scene
+from User import User
+from dao import StoryDAO, CharacterDAO, SceneDAO, UserDAO, STORY_UPDATE_COLUMNS, CHARACTER_UPDATE_COLUMNS, story_version, select_list
+from query_stats import record_sql
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    credits INTEGER NOT NULL DEFAULT 999 CHECK (credits >= 0),
+    created_at TEXT DEFAULT ({_NOW}),
+    updated_at TEXT DEFAULT ({_NOW})
+);
+
+CREATE TABLE IF NOT EXISTS stories (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    title TEXT NOT NULL,
+    nb_scenes INTEGER NOT NULL DEFAULT 1,
+    nb_chars INTEGER NOT NULL DEFAULT 1,
+    story_mode TEXT NOT NULL DEFAULT 'adventure',
+    cover_image_url TEXT,
+    background_story TEXT,
+    status TEXT DEFAULT 'created',
+    created_at TEXT DEFAULT ({_NOW}),
+    updated_at TEXT DEFAULT ({_NOW}),
+    scenes_paragraph TEXT
+);
+
+CREATE TABLE IF NOT EXISTS user_character (
+    id TEXT PRIMARY KEY,
+    story_id TEXT NOT NULL REFERENCES stories(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    description TEXT,
+    image_url TEXT,
+    analysis TEXT,
+    updated_at TEXT DEFAULT ({_NOW})
+);
+
+CREATE TABLE IF NOT EXISTS scenes (
+    id TEXT PRIMARY KEY,
+    story_id TEXT NOT NULL REFERENCES stories(id) ON DELETE CASCADE,
+    scene_number INTEGER NOT NULL,
+    title TEXT,
+    narrative_text TEXT,
+    image_prompt TEXT,
+    image_url TEXT,
+    paragraph TEXT,
+    revision INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT DEFAULT ({_NOW}),
+    updated_at TEXT DEFAULT ({_NOW}),
+    UNIQUE (story_id, scene_number)
+);
+
+CREATE TABLE IF NOT EXISTS credit_ledger (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    reservation_id TEXT NOT NULL,
+    job_id TEXT,
+    kind TEXT NOT NULL CHECK (kind IN ('reserve', 'settle', 'refund')),
+    amount INTEGER NOT NULL,
+    delta INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT DEFAULT ({_NOW})
+);
+
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_stories_user_id ON stories(user_id);
+CREATE INDEX IF NOT EXISTS idx_stories_created_at ON stories(created_at);
+CREATE INDEX IF NOT EXISTS idx_user_character_story_id ON user_character(story_id);
+CREATE INDEX IF NOT EXISTS idx_scenes_story_id ON scenes(story_id);
+CREATE INDEX IF NOT EXISTS idx_scenes_scene_number ON scenes(story_id, scene_number);
+CREATE INDEX IF NOT EXISTS idx_credit_ledger_user_id ON credit_ledger(user_id);
+CREATE INDEX IF NOT EXISTS idx_credit_ledger_reservation_id ON credit_ledger(reservation_id);
+
+CREATE TRIGGER IF NOT EXISTS update_users_updated_at AFTER UPDATE ON users FOR EACH ROW
+BEGIN UPDATE users SET updated_at = {_NOW} WHERE id = NEW.id; END;
+
+CREATE TRIGGER IF NOT EXISTS update_stories_updated_at AFTER UPDATE ON stories FOR EACH ROW
+BEGIN UPDATE stories SET updated_at = {_NOW} WHERE id = NEW.id; END;
+
+CREATE TRIGGER IF NOT EXISTS update_scenes_updated_at AFTER UPDATE ON scenes FOR EACH ROW
+BEGIN UPDATE scenes SET updated_at = {_NOW} WHERE id = NEW.id; END;
+
+INSERT OR IGNORE INTO users (id, username, email, credits)
+VALUES ('00000000-0000-0000-0000-000000000001', 'testuser', 'test@example.com', 999);
+"""
+
+# Columns added after the first release: (table, column, definition) added to older databases.
+# SQLite cannot add a column with a non-constant default, so existing rows start out NULL.
+MIGRATIONS = (
+    ("user_character", "updated_at", "TEXT"),
+    ("scenes", "revision", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+# Triggers and indexes on migrated columns, created once the columns exist.
+# Scene revisions come from one counter across all scenes (writes are serialized), the
+# stand-in for scene_revision_seq on Postgres: it never goes back, even when the scenes
+# holding the highest revisions are deleted. Databases created before the counter seed
+# it from the highest revision stored and get their triggers replaced.
+TRIGGERS = f"""
+CREATE INDEX IF NOT EXISTS idx_scenes_revision ON scenes(story_id, revision);
+CREATE INDEX IF NOT EXISTS idx_scenes_revision_max ON scenes(revision);
+
+CREATE TABLE IF NOT EXISTS scene_revision_counter (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO scene_revision_counter (id, value) SELECT 1, COALESCE(MAX(revision), 0) FROM scenes;
+
+DROP TRIGGER IF EXISTS insert_scenes_revision;
+CREATE TRIGGER insert_scenes_revision AFTER INSERT ON scenes FOR EACH ROW
+BEGIN
+    UPDATE scene_revision_counter SET value = value + 1 WHERE id = 1;
+    UPDATE scenes SET revision = (SELECT value FROM scene_revision_counter WHERE id = 1) WHERE id = NEW.id;
+END;
+
+DROP TRIGGER IF EXISTS update_scenes_revision;
+CREATE TRIGGER update_scenes_revision AFTER UPDATE ON scenes FOR EACH ROW WHEN NEW.revision = OLD.revision
+BEGIN
+    UPDATE scene_revision_counter SET value = value + 1 WHERE id = 1;
+    UPDATE scenes SET revision = (SELECT value FROM scene_revision_counter WHERE id = 1) WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS update_user_character_updated_at AFTER UPDATE ON user_character FOR EACH ROW
+BEGIN UPDATE user_character SET updated_at = {_NOW} WHERE id = NEW.id; END;
+"""
+
+
+class SqliteDatabase:
+    """One shared connection guarded by a lock (SQLite serializes writers anyway)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        self.recorder = None  # QueryRecorder set by query_stats.instrument()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("PRAGMA foreign_keys=ON")
+            self.conn.executescript(SCHEMA)
+            self._migrate()
+            self.conn.executescript(TRIGGERS)
+
+    def _migrate(self):
+        for table, column, definition in MIGRATIONS:
+            columns = {row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                logger.info(f"🔧 Added column {table}.{column}")
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        started = time.perf_counter()
+        with self.lock:
+            rows = [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+        if self.recorder:
+            record_sql(self.recorder, sql, params, len(rows), (time.perf_counter() - started) * 1000, rows)
+        return rows
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Run one statement and return the number of affected rows"""
+        started = time.perf_counter()
+        with self.lock:
+            count = self.conn.execute(sql, params).rowcount
+        if self.recorder:
+            record_sql(self.recorder, sql, params, count, (time.perf_counter() - started) * 1000)
+        return count
+
+    def executemany(self, sql: str, rows: Iterable[Sequence[Any]]) -> int:
+        rows = list(rows)
+        started = time.perf_counter()
+        with self.lock, self.transaction():
+            count = self.conn.executemany(sql, rows).rowcount
+        if self.recorder:
+            record_sql(self.recorder, sql, rows, count, (time.perf_counter() - started) * 1000)
+        return count
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def insert(self, table: str, row: Dict[str, Any]) -> int:
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        return self.execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", list(row.values()))
+
+    def update(self, table: str, data: Dict[str, Any], where: Dict[str, Any]) -> int:
+        assignments = ", ".join(f"{column} = ?" for column in data)
+        conditions = " AND ".join(f"{column} = ?" for column in where)
+        return self.execute(
+            f"UPDATE {table} SET {assignments} WHERE {conditions}",
+            list(data.values()) + list(where.values())
+        )
+
+
+class SqliteStoryDAO(StoryDAO):
+    def __init__(self, database: SqliteDatabase):
+        self.db = database
+
+    def create_story(self, story: Story) -> str:
+        """Create a new story in the database"""
+        try:
+            story_id = str(uuid.uuid4())
+            story.id = story_id
+            story.status = "created"
+            story.created_at = story.updated_at = datetime.utcnow().isoformat()
+            if self.db.insert("stories", story.to_row()):
+                return story_id
+            return None
+        except Exception as e:
+            logger.error(f"Error creating story: {e}")
+            return None
+
+    def update_story_complete(self, story: Story) -> bool:
+        """Mark story as complete with images"""
+        return self.update_story_status(story.id, "completed")
+
+    def update_story_status(self, story_id: str, status: str) -> bool:
+        """Set the status of a story by ID"""
+        try:
+            return bool(self.db.update("stories", {"status": status}, {"id": story_id}))
+        except Exception as e:
+            logger.error(f"Error updating story status: {e}")
+            return False
+
+    def update_story(self, story: Story) -> str:
+        """Update story with new details"""
+        try:
+            if self.db.update("stories", story.to_row(STORY_UPDATE_COLUMNS), {"id": story.id}):
+                return str(story.id)
+            return None
+        except Exception as e:
+            logger.error(f"Error updating story: {e}")
+            return None
+
+    def get_story(self, story_id: str, use_cache: bool = True, columns: Optional[Sequence[str]] = None) -> Optional[Story]:
+        """Get story by ID, reading only columns when given"""
+        try:
+            rows = self.db.query(f"SELECT {select_list(columns)} FROM stories WHERE id = ?", (story_id,))
+            return Story.from_row(rows[0]) if rows else None
+        except Exception as e:
+            logger.error(f"Error fetching story: {e}")
+            return None
+
+    def get_stories(self, story_ids: List[str], columns: Optional[Sequence[str]] = None) -> List[Story]:
+        """Get several stories by ID in one query (in no particular order)"""
+        if not story_ids:
+            return []
+        try:
+            placeholders = ", ".join("?" for _ in story_ids)
+            return Story.from_rows(self.db.query(
+                f"SELECT {select_list(columns)} FROM stories WHERE id IN ({placeholders})", tuple(story_ids)
+            ))
+        except Exception as e:
+            logger.error(f"Error fetching stories: {e}")
+            return []
+
+    def get_user_stories(self, user_id: str, limit: Optional[int] = None, offset: int = 0) -> List[Story]:
+        """Get all stories for a user, newest first (one page of them when limit is given)"""
+        try:
+            sql = "SELECT * FROM stories WHERE user_id = ? ORDER BY created_at DESC, id"
+            params = (user_id,)
+            if limit is not None:
+                sql += " LIMIT ? OFFSET ?"
+                params += (limit, offset)
+            return Story.from_rows(self.db.query(sql, params))
+        except Exception as e:
+            logger.error(f"Error fetching user stories: {e}")
+            return []
+
+    def get_story_version(self, story_id: str) -> Optional[str]:
+        """Cheap change token for a story, its scenes' images and its characters (None if not found)"""
+        try:
+            rows = self.db.query(
+                "SELECT s.updated_at, "
+                "(SELECT json_group_array(json_array(scene_number, image_url, updated_at)) FROM scenes WHERE story_id = s.id) AS scenes, "
+                "(SELECT json_group_array(json_array(id, updated_at)) FROM user_character WHERE story_id = s.id) AS characters "
+                "FROM stories s WHERE s.id = ?",
+                (story_id,)
+            )
+            if not rows:
+                return None
+            row = rows[0]
+            return story_version(row["updated_at"], json.loads(row["scenes"]), json.loads(row["characters"]))
+        except Exception as e:
+            logger.error(f"Error fetching story version: {e}")
+            return None
+
+    def get_user_stories_version(self, user_id: str) -> Optional[str]:
+        """Cheap change token for a user's story listing"""
+        try:
+            rows = self.db.query("SELECT id, updated_at FROM stories WHERE user_id = ? ORDER BY id", (user_id,))
+            return "|".join(f"{row['id']}:{row['updated_at']}" for row in rows)
+        except Exception as e:
+            logger.error(f"Error fetching user stories version: {e}")
+            return None
+
+    def count_user_stories(self, user_id: str) -> int:
+        """Number of stories a user has"""
+        try:
+            rows = self.db.query("SELECT COUNT(*) AS n FROM stories WHERE user_id = ?", (user_id,))
+            return rows[0]["n"]
+        except Exception as e:
+            logger.error(f"Error counting user stories: {e}")
+            return 0
+
+    def get_all_stories(self) -> List[Story]:
+        """Get all stories from all users"""
+        try:
+            return Story.from_rows(self.db.query("SELECT * FROM stories ORDER BY created_at DESC"))
+        except Exception as e:
+            logger.error(f"Error fetching all stories: {e}")
+            return []
+
+    def delete_all_stories(self) -> int:
+        """Delete every story (demo reset); returns the number of deleted rows"""
+        try:
+            return self.db.execute("DELETE FROM stories")
+        except Exception as e:
+            logger.error(f"Error deleting stories: {e}")
+            return 0
+
+
+class SqliteCharacterDAO(CharacterDAO):
+    def __init__(self, database: SqliteDatabase):
+        self.db = database
+
+    def create_character(self, character: User_Character, story_id: str) -> str:
+        """Create a character and associate with story"""
+        try:
+            char_id = str(uuid.uuid4())
+            character.id = char_id
+            if not character.story_id:
+                character.story_id = story_id
+            if self.db.insert("user_character", character.to_row()):
+                return char_id
+            return None
+        except Exception as e:
+            logger.error(f"Error creating character: {e}")
+            return None
+
+    def create_characters(self, characters: List[User_Character], story_id: str) -> List[str]:
+        """Create several characters for a story in a single transaction"""
+        try:
+            if not characters:
+                return []
+            for character in characters:
+                character.id = str(uuid.uuid4())
+                if not character.story_id:
+                    character.story_id = story_id
+            rows = [character.to_row() for character in characters]
+            columns = list(rows[0])
+            self.db.executemany(
+                f"INSERT INTO user_character ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [[row[column] for column in columns] for row in rows]
+            )
+            return [character.id for character in characters]
+        except Exception as e:
+            logger.error(f"Error creating characters: {e}")
+            return []
+
+    def update_character(self, character: User_Character) -> bool:
+        """Update a single character"""
+        try:
+            return bool(self.db.update("user_character", character.to_row(CHARACTER_UPDATE_COLUMNS), {"id": character.id}))
+        except Exception as e:
+            logger.error(f"Error updating character: {e}")
+            return False
+
+    def update_character_analysis(self, character: User_Character) -> bool:
+        """Update character with AI analysis"""
+        try:
+            return bool(self.db.update("user_character", {"analysis": character.analysis}, {"id": character.id}))
+        except Exception as e:
+            logger.error(f"Error updating character analysis: {e}")
+            return False
+
+    def get_characters_for_stories(self, story_ids: List[str], columns: Optional[Sequence[str]] = None) -> Dict[str, List[User_Character]]:
+        """Characters of several stories in one query, by story ID (columns, when given, must include story_id)"""
+        characters_by_story: Dict[str, List[User_Character]] = {story_id: [] for story_id in story_ids}
+        if not story_ids:
+            return characters_by_story
+        try:
+            placeholders = ", ".join("?" for _ in story_ids)
+            rows = self.db.query(
+                f"SELECT {select_list(columns)} FROM user_character WHERE story_id IN ({placeholders})", tuple(story_ids)
+            )
+            for character in User_Character.from_rows(rows):
+                characters_by_story.setdefault(character.story_id, []).append(character)
+            return characters_by_story
+        except Exception as e:
+            logger.error(f"Error fetching characters for stories: {e}")
+            return characters_by_story
+
+    def get_story_characters(self, story_id: str, use_cache: bool = True, columns: Optional[Sequence[str]] = None) -> List[User_Character]:
+        """Get all characters for a story, reading only columns when given"""
+        try:
+            return User_Character.from_rows(self.db.query(
+                f"SELECT {select_list(columns)} FROM user_character WHERE story_id = ?", (story_id,)
+            ))
+        except Exception as e:
+            logger.error(f"Error fetching story characters: {e}")
+            return []
+
+
+class SqliteSceneDAO(SceneDAO):
+    def __init__(self, database: SqliteDatabase):
+        self.db = database
+
+    def create_scene(self, scene: Scene, story_id: str, scene_number: int) -> str:
+        """Create a scene for a story"""
+        try:
+            scene_id = str(uuid.uuid4())
+            scene.id = scene_id
+            scene.story_id = story_id
+            scene.scene_number = scene_number
+            scene_data = scene.to_row()
+            scene_data["created_at"] = datetime.utcnow().isoformat()
+            if self.db.insert("scenes", scene_data):
+                return scene_id
+            return None
+        except Exception as e:
+            logger.error(f"Error creating scene: {e}")
+            return None
+
+    def get_story_scenes(self, story_id: str, use_cache: bool = True, columns: Optional[Sequence[str]] = None) -> List[Scene]:
+        """Get all scenes for a story, ordered by scene number, reading only columns when given"""
+        try:
+            return Scene.from_rows(self.db.query(
+                f"SELECT {select_list(columns)} FROM scenes WHERE story_id = ? ORDER BY scene_number", (story_id,)
+            ))
+        except Exception as e:
+            logger.error(f"Error fetching story scenes: {e}")
+            return []
+
+    def get_scenes_for_stories(self, story_ids: List[str], columns: Optional[Sequence[str]] = None) -> Dict[str, List[Scene]]:
+        """Scenes of several stories in one query, by story ID and ordered by scene number
+        (columns, when given, must include story_id)"""
+        scenes_by_story: Dict[str, List[Scene]] = {story_id: [] for story_id in story_ids}
+        if not story_ids:
+            return scenes_by_story
+        try:
+            placeholders = ", ".join("?" for _ in story_ids)
+            rows = self.db.query(
+                f"SELECT {select_list(columns)} FROM scenes WHERE story_id IN ({placeholders}) ORDER BY story_id, scene_number",
+                tuple(story_ids)
+            )
+            for scene in Scene.from_rows(rows):
+                scenes_by_story.setdefault(scene.story_id, []).append(scene)
+            return scenes_by_story
+        except Exception as e:
+            logger.error(f"Error fetching scenes for stories: {e}")
+            return scenes_by_story
+
+    def get_scenes_since(self, story_id: str, since: Optional[int] = None) -> Tuple[List[Scene], int]:
+        """Scenes of a story changed after revision since (all of them if None), and the newest revision seen"""
+        try:
+            if since is None:
+                rows = self.db.query("SELECT * FROM scenes WHERE story_id = ? ORDER BY scene_number", (story_id,))
+            else:
+                rows = self.db.query(
+                    "SELECT * FROM scenes WHERE story_id = ? AND revision > ? ORDER BY scene_number",
+                    (story_id, since)
+                )
+            return Scene.from_rows(rows), max([since or 0] + [row["revision"] for row in rows])
+        except Exception as e:
+            logger.error(f"Error fetching changed scenes: {e}")
+            return [], since or 0
+
+    def update_scene_image_url(self, story_id: str, scene_number: int, image_url: str) -> bool:
+        """Update the image_url for a specific scene"""
+        try:
+            self.db.update("scenes", {"image_url": image_url}, {"story_id": story_id, "scene_number": scene_number})
+            return True
+        except Exception as e:
+            logger.error(f"Error updating scene image URL: {e}")
+            return False
+
+    def update_scene_image_urls(self, story_id: str, image_urls: Dict[int, str]) -> bool:
+        """Update the image_url of several scenes of a story in one transaction"""
+        try:
+            self.db.executemany(
+                "UPDATE scenes SET image_url = ? WHERE story_id = ? AND scene_number = ?",
+                [(image_url, story_id, scene_number) for scene_number, image_url in image_urls.items()]
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error updating scene image URLs: {e}")
+            return False
+
+    def delete_story_scenes(self, story_id: str) -> bool:
+        """Delete all scenes for a specific story"""
+        try:
+            self.db.execute("DELETE FROM scenes WHERE story_id = ?", (story_id,))
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting story scenes: {e}")
+            return False
+
+
+class SqliteUserDAO(UserDAO):
+    def __init__(self, database: SqliteDatabase):
+        self.db = database
+
+    def create_user(self, user: User) -> str:
+        """Create a new user in the database"""
+        try:
+            user_id = str(uuid.uuid4())
+            user.id = user_id
+            user.credits = 999  # Default 999 credits
+            user.created_at = user.updated_at = datetime.utcnow().isoformat()
+            return user_id if self.db.insert("users", user.to_row()) else None
+        except Exception as e:
+            logger.error(f"Error creating user: {e}")
+            return None
+
+    def get_user_by_email(self, email: str, use_cache: bool = True) -> Optional[User]:
+        """Get user by email address"""
+        try:
+            rows = self.db.query("SELECT * FROM users WHERE email = ?", (email,))
+            return User.from_row(rows[0]) if rows else None
+        except Exception as e:
+            logger.error(f"Error getting user by email: {e}")
+            return None
+
+    def get_user(self, user_id: str) -> Optional[User]:
+        """Get user by ID"""
+        try:
+            rows = self.db.query("SELECT * FROM users WHERE id = ?", (user_id,))
+            return User.from_row(rows[0]) if rows else None
+        except Exception as e:
+            logger.error(f"Error getting user by id: {e}")
+            return None
+
+    def update_user(self, user: User) -> bool:
+        """Update user information"""
+        try:
+            return bool(self.db.update("users", user.to_row(("username", "email", "credits")), {"id": user.id}))
+        except Exception as e:
+            logger.error(f"Error updating user: {e}")
+            return False
+
+    def update_user_credits(self, email: str, credits: int) -> bool:
+        """Update user credits by email"""
+        try:
+            return bool(self.db.update("users", {"credits": credits}, {"email": email}))
+        except Exception as e:
+            logger.error(f"Error updating user credits: {e}")
+            return False
+
+    def record_credit_entries(self, entries: List[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+        """Persist a batch of credit ledger entries and apply their deltas in one transaction
+        (same contract as the record_credit_entries() function in database_setup.sql)"""
+        try:
+            with self.db.transaction() as conn:
+                totals: Dict[str, int] = {}
+                for entry in entries:
+                    inserted = conn.execute(
+                        "INSERT OR IGNORE INTO credit_ledger "
+                        "(id, user_id, reservation_id, job_id, kind, amount, delta, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (entry["id"], entry["user_id"], entry["reservation_id"], entry["job_id"],
+                         entry["kind"], entry["amount"], entry["delta"], entry["created_at"])
+                    ).rowcount
+                    if inserted:
+                        totals[entry["user_id"]] = totals.get(entry["user_id"], 0) + entry["delta"]
+                balances = {}
+                for user_id, delta in totals.items():
+                    conn.execute("UPDATE users SET credits = MAX(credits + ?, 0) WHERE id = ?", (delta, user_id))
+                    row = conn.execute("SELECT credits FROM users WHERE id = ?", (user_id,)).fetchone()
+                    if row:
+                        balances[user_id] = row["credits"]
+                return balances
+        except Exception as e:
+            logger.error(f"Error recording credit entries: {e}")
+            return None
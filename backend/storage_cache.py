@@ -0,0 +1,258 @@
+"""
+Local disk cache for storage objects
+Character and scene images are read from storage several times per story
+(narrative call, image call, ZIP export). Objects fetched over HTTP are kept
+under STORAGE_CACHE_DIR, bounded by STORAGE_CACHE_MAX_BYTES with LRU
+eviction, and revalidated with their ETag once they are older than
+STORAGE_CACHE_REVALIDATE_SECONDS. Hits are returned as read-only memory maps,
+so they cost neither a network round trip nor a copy into Python memory.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+
+from config import STORAGE_CACHE_ENABLED, STORAGE_CACHE_DIR, STORAGE_CACHE_MAX_BYTES, STORAGE_CACHE_REVALIDATE_SECONDS
+from http_client import http_get
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+Buffer = Union[bytes, mmap.mmap]
+
+
+def map_file(path: str) -> Buffer:
+    """Memory-map a file read-only (empty files come back as b"")"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _Entry:
+    __slots__ = ("url", "size", "etag", "last_modified", "validated_at")
+
+    def __init__(self, url: str, size: int, etag: Optional[str], last_modified: Optional[str], validated_at: float):
+        self.url = url
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.validated_at = validated_at
+
+
+class StorageCache:
+    """Byte-bounded LRU of storage objects on local disk, keyed by URL"""
+
+    def __init__(self, directory: str, max_bytes: int, revalidate_after: float = 300.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stale_served = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    # Layout: <key>.bin holds the object, <key>.json its URL and validators
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _data_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self):
+        """Rebuild the LRU from disk after a restart, least recently used first"""
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-5]
+            try:
+                with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                stat = os.stat(self._data_path(key))
+            except (OSError, ValueError):
+                self._remove_files(key)
+                continue
+            entry = _Entry(meta["url"], stat.st_size, meta.get("etag"), meta.get("last_modified"), meta.get("validated_at", 0))
+            found.append((stat.st_atime, key, entry))
+        for _, key, entry in sorted(found, key=lambda item: item[0]):
+            self._entries[key] = entry
+            self.total_bytes += entry.size
+        self._evict()
+
+    def _remove_files(self, key: str):
+        for path in (self._data_path(key), self._meta_path(key)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _write_meta(self, key: str, entry: _Entry):
+        meta = {"url": entry.url, "etag": entry.etag, "last_modified": entry.last_modified, "validated_at": entry.validated_at}
+        tmp_path = f"{self._meta_path(key)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(key))
+
+    def _evict(self):
+        """Drop least recently used objects until the cache fits in max_bytes (caller holds the lock or is __init__)"""
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry.size
+            self.evictions += 1
+            # Open memory maps of an evicted file stay valid after the unlink
+            self._remove_files(key)
+
+    def _store(self, key: str, url: str, content: bytes, etag: Optional[str], last_modified: Optional[str]):
+        if len(content) > self.max_bytes:
+            return
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        with os.fdopen(tmp_fd, "wb") as f:
+            f.write(content)
+        entry = _Entry(url, len(content), etag, last_modified, time.time())
+        with self._lock:
+            os.replace(tmp_path, self._data_path(key))
+            self._write_meta(key, entry)
+            previous = self._entries.pop(key, None)
+            if previous:
+                self.total_bytes -= previous.size
+            self._entries[key] = entry
+            self.total_bytes += entry.size
+            self._evict()
+
+    def _cached_path(self, key: str) -> Optional[str]:
+        path = self._data_path(key)
+        if os.path.exists(path):
+            return path
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self.total_bytes -= entry.size
+        return None
+
+    # Public API
+
+    def _fetch(self, url: str):
+        """Make sure url is cached and fresh; returns (cached path, None) or (None, content) if not cacheable"""
+        key = self._key(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+
+        if entry and time.time() - entry.validated_at < self.revalidate_after:
+            path = self._cached_path(key)
+            if path:
+                with self._lock:
+                    self.hits += 1
+                return path, None
+            entry = None
+
+        headers = {}
+        if entry and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        try:
+            response = http_get(url, headers=headers or None)
+        except Exception:
+            path = self._cached_path(key) if entry else None
+            if path:
+                # Storage unreachable: a stale copy beats failing the export / generation
+                with self._lock:
+                    self.stale_served += 1
+                logger.warning(f"⚠️  Serving stale cached copy of {url}")
+                return path, None
+            raise
+
+        if response.status_code == 304:
+            path = self._cached_path(key) if entry else None
+            if path:
+                with self._lock:
+                    self.revalidated += 1
+                    entry.validated_at = time.time()
+                    self._write_meta(key, entry)
+                return path, None
+            response = http_get(url)
+
+        with self._lock:
+            self.misses += 1
+        self._store(key, url, response.content, response.headers.get("etag"), response.headers.get("last-modified"))
+        path = self._cached_path(key)
+        return (path, None) if path else (None, response.content)
+
+    def fetch(self, url: str) -> Optional[str]:
+        """Path of the cached, fresh copy of url (None if the object is too large to cache)"""
+        return self._fetch(url)[0]
+
+    def get(self, url: str) -> Buffer:
+        """Object content: a memory map of the cached file, or the downloaded bytes if too large to cache"""
+        path, content = self._fetch(url)
+        if path:
+            try:
+                return map_file(path)
+            except FileNotFoundError:
+                # Evicted between fetch and open
+                return http_get(url).content
+        return content
+
+    def invalidate(self, url: str):
+        """Forget url (called after it is overwritten by an upload)"""
+        key = self._key(url)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self.total_bytes -= entry.size
+            self._remove_files(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.revalidated + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "stale_served": self.stale_served,
+                "hit_rate": round((self.hits + self.revalidated) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+
+_cache: Optional[StorageCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_storage_cache() -> Optional[StorageCache]:
+    """Process-wide cache, or None when STORAGE_CACHE_ENABLED is off"""
+    global _cache
+    if not STORAGE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = StorageCache(STORAGE_CACHE_DIR, STORAGE_CACHE_MAX_BYTES, STORAGE_CACHE_REVALIDATE_SECONDS)
+    return _cache
+
+
+def storage_cache_stats() -> Optional[Dict[str, Any]]:
+    return _cache.stats() if _cache else None
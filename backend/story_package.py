@@ -0,0 +1,187 @@
+"""
+Streaming ZIP packages for story downloads
+The archive is written to an unseekable sink (entries carry data
+descriptors), and the sink is drained after every chunk, so bytes go to the
+client as soon as each image has been read and memory use does not grow
+with the package size. Images are already compressed and are STORED; only
+the story text is DEFLATEd.
+
+Images are fetched concurrently by a small thread pool that runs at most
+`concurrency` fetches ahead of the entry being written, so the archive keeps
+a deterministic order. Whatever has not arrived by the export deadline (or
+failed) is left out and listed in a manifest.json entry.
+"""
+
+import json
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from Story import Story
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+PACKAGE_IMAGE_EXTENSIONS = ("jpg", "jpeg", "png", "gif", "webp")
+PACKAGE_CHUNK_SIZE = 256 * 1024
+
+
+def safe_name(text: str) -> str:
+    return "".join(c for c in text if c.isalnum() or c in (' ', '-', '_')).rstrip()
+
+
+def image_extension(url: str) -> str:
+    """File extension taken from an image URL, defaulting to jpg"""
+    url_path = url.split('?')[0]  # Remove query parameters
+    if '.' in url_path:
+        extension = url_path.split('.')[-1].lower()
+        if extension in PACKAGE_IMAGE_EXTENSIONS:
+            return extension
+    return 'jpg'
+
+
+def package_filename(story: Story) -> str:
+    return f"{safe_name(story.title or 'Untitled Story')}_story_package.zip"
+
+
+def story_text(story: Story) -> str:
+    story_title = story.title or 'Untitled Story'
+    return f"""STORY TITLE: {story_title}\n
+
+                BACKGROUND STORY:
+                {story.background_story or 'No background story provided.'}
+
+                STORY NARRATIVE:
+                {story.scenes_paragraph or 'No narrative available.'}
+
+                STORY DETAILS:
+                - Number of Scenes: {story.nb_scenes or 'Unknown'}
+                - Number of Characters: {story.nb_chars or 'Unknown'}
+                - Story Mode: {story.story_mode or 'Unknown'}
+                - Created: {story.created_at or 'Unknown'}
+            """
+
+
+def package_images(story: Story, scenes: list) -> List[Tuple[str, str]]:
+    """(archive name, image URL) of every image in the package, in archive order"""
+    images = []
+    for scene in scenes:
+        if not scene.image_url:
+            continue
+        try:
+            scene_number = f"{scene.scene_number:02d}" if isinstance(scene.scene_number, int) and scene.scene_number else "unknown"
+            safe_scene_title = safe_name(scene.title or f'Scene_{scene_number}')
+            images.append((f"images/scene_{scene_number}_{safe_scene_title}.{image_extension(scene.image_url)}", scene.image_url))
+        except Exception as e:
+            # A malformed scene loses its image, not the whole export
+            logger.warning(f"⚠️ Skipping image of scene {scene.scene_number!r} in the package: {e}")
+    if story.cover_image_url:
+        images.append((f"cover_image.{image_extension(story.cover_image_url)}", story.cover_image_url))
+    return images
+
+
+class StreamSink:
+    """Write-only, unseekable file object whose contents are handed out by drain()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def write_entry_chunks(archive: zipfile.ZipFile, sink: StreamSink, arcname: str, chunks: Iterable,
+                       compress: bool, force_zip64: bool = False) -> Iterator[bytes]:
+    """Write an archive entry from an iterable of chunks, yielding the archive bytes produced along the way"""
+    info = zipfile.ZipInfo(arcname)
+    info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with archive.open(info, "w", force_zip64=force_zip64) as entry:
+        for chunk in chunks:
+            entry.write(chunk)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _write_entry(archive: zipfile.ZipFile, sink: StreamSink, arcname: str, content, compress: bool) -> Iterator[bytes]:
+    view = memoryview(content)
+    chunks = (view[offset:offset + PACKAGE_CHUNK_SIZE] for offset in range(0, len(view), PACKAGE_CHUNK_SIZE))
+    yield from write_entry_chunks(archive, sink, arcname, chunks, compress, force_zip64=len(view) > zipfile.ZIP64_LIMIT)
+    view.release()
+
+
+def _package_chunks(story: Story, scenes: list, fetch: Callable[[str], object],
+                    concurrency: int, deadline_seconds: float, failures: List[Dict[str, Any]]) -> Iterator[bytes]:
+    sink = StreamSink()
+    images = package_images(story, scenes)
+    deadline = time.monotonic() + deadline_seconds
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="package-fetch")
+    futures = {}
+
+    def submit_up_to(index: int):
+        # Keep a bounded window of fetches in flight ahead of the writer; none start after the deadline
+        if time.monotonic() >= deadline:
+            return
+        for i in range(index, min(index + concurrency, len(images))):
+            if i not in futures:
+                futures[i] = executor.submit(fetch, images[i][1])
+
+    try:
+        with zipfile.ZipFile(sink, "w") as archive:
+            safe_title = safe_name(story.title or 'Untitled Story')
+            yield from _write_entry(archive, sink, f"{safe_title}_story.txt", story_text(story).encode("utf-8"), compress=True)
+
+            for index, (arcname, url) in enumerate(images):
+                submit_up_to(index)
+                future = futures.pop(index, None)
+                if future is None:
+                    # Deadline passed before this fetch was scheduled: report it without starting it
+                    failures.append({"file": arcname, "url": url, "error": "export deadline exceeded"})
+                    continue
+                try:
+                    content = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FutureTimeoutError:
+                    future.cancel()
+                    failures.append({"file": arcname, "url": url, "error": "export deadline exceeded"})
+                    logger.warning(f"⚠️ Export deadline exceeded before {arcname} arrived")
+                    continue
+                except Exception as e:
+                    failures.append({"file": arcname, "url": url, "error": str(e)})
+                    logger.warning(f"⚠️ Failed to download image {arcname}: {e}")
+                    continue
+                yield from _write_entry(archive, sink, arcname, content, compress=False)
+                logger.debug(f"✅ Added image to package: {arcname}")
+
+            if failures:
+                manifest = {
+                    "complete": False,
+                    "included": len(images) - len(failures),
+                    "missing": failures
+                }
+                yield from _write_entry(archive, sink, "manifest.json", json.dumps(manifest, indent=2).encode("utf-8"), compress=True)
+        # Central directory
+        yield sink.drain()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_story_package(story: Story, scenes: list, fetch: Callable[[str], object],
+                         concurrency: int = 4, deadline_seconds: float = 60.0,
+                         failures: Optional[List[Dict[str, Any]]] = None) -> Iterator[bytes]:
+    """Yield the story package ZIP piece by piece; fetch(url) returns an image's bytes
+
+    Images left out of the package are appended to failures when a list is given.
+    """
+    failures = failures if failures is not None else []
+    for chunk in _package_chunks(story, scenes, fetch, concurrency, deadline_seconds, failures):
+        if chunk:
+            yield chunk
@@ -1,4 +1,12 @@
-from config import supabase, supabase_service, ASSETS_FOLDER, OUTPUT_FOLDER, BUCKET_NAME
+from config import supabase, supabase_service, ASSETS_FOLDER, OUTPUT_FOLDER, BUCKET_NAME, STORAGE_BACKEND
+from config import SUPABASE_URL, SUPABASE_ANON_KEY, SUPABASE_SERVICE_KEY, UPLOAD_CHUNK_SIZE
+from http_client import http_get, get_http_client
+from storage_cache import get_storage_cache
+from metrics import instrument_storage
+from tracing import traced
+from app_logging import get_logger
+
+logger = get_logger(__name__)
 
 # Helper functions for Supabase Storage
 def upload_to_supabase_storage(file_content: bytes, file_name: str, folder: str = ASSETS_FOLDER) -> str:
@@ -19,12 +27,56 @@ def upload_to_supabase_storage(file_content: bytes, file_name: str, folder: str
         if result:
             # Get public URL (can use either client for this)
             public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(file_path)
+            # The object may have been overwritten (upsert), so drop any cached copy
+            cache = get_storage_cache()
+            if cache:
+                cache.invalidate(public_url)
             return public_url
         else:
             raise Exception("Failed to upload to Supabase storage")
             
     except Exception as e:
-        print(f"Error uploading to Supabase storage: {e}")
+        logger.error(f"Error uploading to Supabase storage: {e}")
+        raise e
+
+def read_chunks(fileobj, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Yield a file object's content chunk by chunk"""
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+def upload_stream_to_storage(fileobj, file_name: str, folder: str = ASSETS_FOLDER, content_type: str = None) -> str:
+    """Stream a file object to Supabase storage chunk by chunk and return public URL
+    
+    Unlike upload_to_supabase_storage the content is never held in memory as
+    a whole; the body is sent with chunked transfer encoding on the shared
+    HTTP client.
+    """
+    try:
+        file_path = f"{folder.strip('/')}/{file_name}"
+        key = SUPABASE_SERVICE_KEY or SUPABASE_ANON_KEY
+        response = get_http_client().post(
+            f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/{BUCKET_NAME}/{file_path}",
+            content=read_chunks(fileobj),
+            headers={
+                "Authorization": f"Bearer {key}",
+                "apikey": key,
+                "x-upsert": "true",
+                "Content-Type": content_type or "application/octet-stream"
+            }
+        )
+        response.raise_for_status()
+        
+        public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(file_path)
+        cache = get_storage_cache()
+        if cache:
+            cache.invalidate(public_url)
+        return public_url
+        
+    except Exception as e:
+        logger.error(f"Error streaming upload to Supabase storage: {e}")
         raise e
 
 def get_supabase_storage_url(file_name: str, folder: str = ASSETS_FOLDER) -> str:
@@ -42,29 +94,79 @@ def upload_generated_image_to_supabase(image_bytes: bytes, story_name: str, scen
         # Upload to output folder in Supabase storage
         image_url = upload_to_supabase_storage(image_bytes, filename, OUTPUT_FOLDER)
         
-        print(f"✅ Uploaded scene image to Supabase: {filename}")
+        logger.info(f"✅ Uploaded scene image to Supabase: {filename}")
         return image_url
         
     except Exception as e:
-        print(f"❌ Failed to upload scene image to Supabase: {e}")
+        logger.error(f"❌ Failed to upload scene image to Supabase: {e}")
         raise e
 
+def create_signed_upload_url(file_path: str) -> dict:
+    """Create a presigned URL the client can PUT file_path to directly"""
+    storage_client = supabase_service if supabase_service else supabase
+    signed = storage_client.storage.from_(BUCKET_NAME).create_signed_upload_url(file_path)
+    return {"url": signed["signed_url"], "token": signed["token"], "method": "PUT"}
+
+def storage_object_exists(file_path: str) -> bool:
+    """Check whether an object has been uploaded to file_path"""
+    try:
+        storage_client = supabase_service if supabase_service else supabase
+        return bool(storage_client.storage.from_(BUCKET_NAME).exists(file_path))
+    except Exception as e:
+        logger.error(f"❌ Failed to check storage object {file_path}: {e}")
+        return False
+
+def read_storage_object_head(file_path: str, size: int = 16) -> bytes:
+    """First size bytes of the object at file_path, fetched with a Range request"""
+    key = SUPABASE_SERVICE_KEY or SUPABASE_ANON_KEY
+    response = http_get(
+        f"{SUPABASE_URL}/storage/v1/object/authenticated/{BUCKET_NAME}/{file_path}",
+        headers={"Authorization": f"Bearer {key}", "apikey": key, "Range": f"bytes=0-{size - 1}"}
+    )
+    return response.content[:size]
+
+def delete_storage_object(file_path: str):
+    """Remove the object at file_path"""
+    storage_client = supabase_service if supabase_service else supabase
+    storage_client.storage.from_(BUCKET_NAME).remove([file_path])
+
 def download_image_from_supabase(image_url: str) -> bytes:
-    """Download image from Supabase storage URL for processing"""
+    """Download image from Supabase storage URL for processing
+    
+    With the storage cache enabled the result is a read-only memory map of
+    the cached copy (bytes-like), not a bytes object.
+    """
     try:
-        import requests
-        response = requests.get(image_url)
-        response.raise_for_status()
-        return response.content
+        cache = get_storage_cache()
+        if cache:
+            return cache.get(image_url)
+        return http_get(image_url).content
     except Exception as e:
-        print(f"❌ Failed to download image from Supabase: {e}")
+        logger.error(f"❌ Failed to download image from Supabase: {e}")
         raise e
 
+@traced("reference.download")
 def save_temp_image_for_upload(image_url: str) -> str:
     """Download image from Supabase and save temporarily for Gemini upload"""
     try:
+        import os
         import tempfile
         
+        # Hard-link the cached copy instead of writing the bytes out again;
+        # callers unlink the temp path, which leaves the cache entry intact
+        cache = get_storage_cache()
+        cached_path = cache.fetch(image_url) if cache and STORAGE_BACKEND != "local" else None
+        if cached_path:
+            fd, temp_path = tempfile.mkstemp(suffix='.jpg')
+            os.close(fd)
+            os.unlink(temp_path)
+            try:
+                os.link(cached_path, temp_path)
+                return temp_path
+            except OSError:
+                # Cache and temp dir on different filesystems: fall back to a copy
+                pass
+        
         # Download image content
         image_content = download_image_from_supabase(image_url)
         
@@ -74,7 +176,7 @@ def save_temp_image_for_upload(image_url: str) -> str:
             return temp_file.name
             
     except Exception as e:
-        print(f"❌ Failed to create temp file for image: {e}")
+        logger.error(f"❌ Failed to create temp file for image: {e}")
         raise e
 
 def upload_story_cover_to_supabase(image_bytes: bytes, story_title: str, file_extension: str) -> str:
@@ -87,11 +189,11 @@ def upload_story_cover_to_supabase(image_bytes: bytes, story_title: str, file_ex
         # Upload to assets folder in Supabase storage
         image_url = upload_to_supabase_storage(image_bytes, filename, ASSETS_FOLDER)
         
-        print(f"✅ Uploaded story cover to Supabase: {filename}")
+        logger.info(f"✅ Uploaded story cover to Supabase: {filename}")
         return image_url
         
     except Exception as e:
-        print(f"❌ Failed to upload story cover to Supabase: {e}")
+        logger.error(f"❌ Failed to upload story cover to Supabase: {e}")
         raise e
 
 def upload_character_image_to_supabase(image_bytes: bytes, character_index: int, file_extension: str) -> str:
@@ -103,9 +205,31 @@ def upload_character_image_to_supabase(image_bytes: bytes, character_index: int,
         # Upload to assets folder in Supabase storage
         image_url = upload_to_supabase_storage(image_bytes, filename, ASSETS_FOLDER)
         
-        print(f"✅ Uploaded character image to Supabase: {filename}")
+        logger.info(f"✅ Uploaded character image to Supabase: {filename}")
         return image_url
         
     except Exception as e:
-        print(f"❌ Failed to upload character image to Supabase: {e}")
+        logger.error(f"❌ Failed to upload character image to Supabase: {e}")
         raise e
+
+
+# Filesystem stand-in for offline runs: the helpers above resolve these names
+# at call time, so they transparently use local storage as well.
+if STORAGE_BACKEND == "local":
+    from local_storage import (
+        upload_to_supabase_storage, upload_stream_to_storage, get_supabase_storage_url, download_image_from_supabase,
+        create_signed_upload_url, storage_object_exists, read_storage_object_head, delete_storage_object
+    )
+
+
+def _stream_size(args, result) -> int:
+    # The file object has been read to the end by the upload
+    return args[0].tell()
+
+
+# Latency and byte metrics (and trace spans for uploads) for whichever backend is in effect
+upload_to_supabase_storage = traced("storage.upload", backend=STORAGE_BACKEND)(
+    instrument_storage(STORAGE_BACKEND, "upload", "upload", lambda args, result: len(args[0]))(upload_to_supabase_storage))
+upload_stream_to_storage = traced("storage.upload", backend=STORAGE_BACKEND)(
+    instrument_storage(STORAGE_BACKEND, "upload_stream", "upload", _stream_size)(upload_stream_to_storage))
+download_image_from_supabase = instrument_storage(STORAGE_BACKEND, "download", "download", lambda args, result: len(result))(download_image_from_supabase)
@@ -0,0 +1,17 @@
+"""
+The backend modules import each other by bare name (run from backend/), and
+config.py reads the environment at import time: run the tests against the
+embedded SQLite / filesystem backends with runtime state in a temporary
+directory.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="creaition-tests-"))
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("STORAGE_BACKEND", "local")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
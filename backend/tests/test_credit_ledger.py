@@ -0,0 +1,131 @@
+import threading
+
+import pytest
+
+from credit_ledger import CreditLedger, InsufficientCreditsError
+
+
+class User:
+    def __init__(self, user_id: str, email: str, credits: int):
+        self.id = user_id
+        self.email = email
+        self.credits = credits
+
+
+class FakeUserDAO:
+    """Applies ledger batches like the record_credit_entries database function"""
+
+    def __init__(self, credits: int = 10):
+        self.user = User("u1", "a@example.com", credits)
+        self.batches = []
+        self.fail_next = 0
+
+    def get_user_by_email(self, email, use_cache=True):
+        return User(self.user.id, self.user.email, self.user.credits) if email == self.user.email else None
+
+    def record_credit_entries(self, entries):
+        if self.fail_next:
+            self.fail_next -= 1
+            return None
+        self.batches.append([(entry["kind"], entry["amount"], entry["delta"]) for entry in entries])
+        self.user.credits += sum(entry["delta"] for entry in entries)
+        return {self.user.id: self.user.credits}
+
+    def update_user_credits(self, email, credits):
+        self.user.credits = credits
+        return True
+
+
+def test_reserve_then_refund_restores_balance():
+    dao = FakeUserDAO(10)
+    ledger = CreditLedger(dao)
+
+    reservation = ledger.reserve("a@example.com", 4, "job-1")
+    assert ledger.balance("a@example.com") == 6
+    assert ledger.balance_details("a@example.com")["held"] == 4
+
+    ledger.refund(reservation)
+    ledger.refund(reservation)  # closing twice is a no-op
+    assert ledger.balance("a@example.com") == 10
+
+    assert ledger.flush()
+    assert dao.batches == [[("reserve", 4, 0), ("refund", 4, 0)]]
+    assert dao.user.credits == 10
+
+
+def test_partial_settle_charges_used_and_releases_rest():
+    dao = FakeUserDAO(10)
+    ledger = CreditLedger(dao)
+
+    reservation = ledger.reserve("a@example.com", 5, "job-1")
+    ledger.settle(reservation, used=3)
+    assert ledger.balance("a@example.com") == 7
+
+    assert ledger.flush()
+    assert dao.batches == [[("reserve", 5, 0), ("settle", 3, -3), ("refund", 2, 0)]]
+    assert dao.user.credits == 7
+    assert ledger.balance_details("a@example.com") == {"credits": 7, "held": 0, "pending": 0}
+
+
+def test_concurrent_reservations_never_overspend():
+    ledger = CreditLedger(FakeUserDAO(10))
+    ledger.balance("a@example.com")
+    granted, refused = [], []
+
+    def reserve(index):
+        try:
+            granted.append(ledger.reserve("a@example.com", 3, f"job-{index}"))
+        except InsufficientCreditsError:
+            refused.append(index)
+
+    threads = [threading.Thread(target=reserve, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(granted) == 3 and len(refused) == 5
+    assert ledger.balance("a@example.com") == 1
+
+
+def test_failed_flush_keeps_entries_for_replay_in_order():
+    dao = FakeUserDAO(10)
+    ledger = CreditLedger(dao)
+    first = ledger.reserve("a@example.com", 2, "job-1")
+    ledger.settle(first)
+
+    dao.fail_next = 1
+    assert not ledger.flush()
+    assert dao.batches == []
+    # The unflushed charge still counts against the balance
+    assert ledger.balance("a@example.com") == 8
+
+    second = ledger.reserve("a@example.com", 1, "job-2")
+    ledger.refund(second)
+    assert ledger.flush()
+    assert dao.batches == [[("reserve", 2, 0), ("settle", 2, -2), ("reserve", 1, 0), ("refund", 1, 0)]]
+    assert dao.user.credits == 8
+    assert ledger.balance_details("a@example.com") == {"credits": 8, "held": 0, "pending": 0}
+
+
+def test_set_balance_is_refused_when_pending_entries_cannot_be_flushed():
+    dao = FakeUserDAO(10)
+    ledger = CreditLedger(dao)
+    ledger.settle(ledger.reserve("a@example.com", 3, "job-1"))
+
+    dao.fail_next = 1
+    assert not ledger.set_balance("a@example.com", 50)
+    assert dao.user.credits == 10
+    assert ledger.balance("a@example.com") == 7
+
+    assert ledger.set_balance("a@example.com", 50)
+    assert dao.batches == [[("reserve", 3, 0), ("settle", 3, -3)]]
+    assert dao.user.credits == 50
+    assert ledger.balance_details("a@example.com") == {"credits": 50, "held": 0, "pending": 0}
+
+
+def test_reserve_more_than_available_raises():
+    ledger = CreditLedger(FakeUserDAO(2))
+    with pytest.raises(InsufficientCreditsError):
+        ledger.reserve("a@example.com", 3, "job-1")
+    assert ledger.balance("a@example.com") == 2
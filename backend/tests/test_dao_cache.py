@@ -0,0 +1,94 @@
+import threading
+
+from dao_cache import EntityCache, CachedStoryDAO, story_key
+
+
+class Story:
+    def __init__(self, story_id: str, title: str):
+        self.id = story_id
+        self.title = title
+
+
+class BlockingStoryDAO:
+    """Story DAO whose reads can be held mid-flight to interleave a write"""
+
+    def __init__(self):
+        self.rows = {"s1": Story("s1", "old")}
+        self.read_started = threading.Event()
+        self.release_read = threading.Event()
+        self.block_reads = False
+
+    def get_story(self, story_id, columns=None):
+        row = self.rows.get(story_id)
+        row = Story(row.id, row.title) if row else None
+        if self.block_reads:
+            self.read_started.set()
+            self.release_read.wait(5)
+        return row
+
+    def update_story(self, story):
+        self.rows[story.id] = Story(story.id, story.title)
+        return True
+
+
+def test_read_through_caches_and_invalidates_on_write():
+    dao = BlockingStoryDAO()
+    cached = CachedStoryDAO(dao, EntityCache())
+    assert cached.get_story("s1").title == "old"
+    dao.rows["s1"].title = "changed behind the cache"
+    assert cached.get_story("s1").title == "old"
+
+    cached.update_story(Story("s1", "new"))
+    assert cached.get_story("s1").title == "new"
+
+
+def test_invalidation_during_load_does_not_store_stale_row():
+    dao = BlockingStoryDAO()
+    cache = EntityCache()
+    cached = CachedStoryDAO(dao, cache)
+    dao.block_reads = True
+    results = []
+    reader = threading.Thread(target=lambda: results.append(cached.get_story("s1")))
+    reader.start()
+    assert dao.read_started.wait(5)
+
+    # The write lands after the reader fetched the old row but before it is cached
+    dao.block_reads = False
+    cached.update_story(Story("s1", "new"))
+    dao.release_read.set()
+    reader.join(5)
+
+    assert results[0].title == "old"
+    found, _ = cache.get(story_key("s1"))
+    assert not found
+    assert cached.get_story("s1").title == "new"
+
+
+def test_prefix_invalidation_and_clear_during_load():
+    cache = EntityCache()
+    generation = cache.begin_load("user:a@b.c")
+    cache.invalidate_prefix("user:")
+    assert not cache.finish_load("user:a@b.c", generation, "stale")
+
+    generation = cache.begin_load("story:s1")
+    cache.clear()
+    assert not cache.finish_load("story:s1", generation, "stale")
+
+    generation = cache.begin_load("story:s1")
+    assert cache.finish_load("story:s1", generation, "fresh")
+    assert cache.get("story:s1") == (True, "fresh")
+
+
+def test_failed_load_is_not_tracked():
+    cache = EntityCache()
+    cached = CachedStoryDAO(BlockingStoryDAO(), cache)
+
+    def failing(story_id, columns=None):
+        raise RuntimeError("db down")
+
+    cached._dao.get_story = failing
+    try:
+        cached.get_story("s1")
+    except RuntimeError:
+        pass
+    assert cache._loads == {}
@@ -0,0 +1,35 @@
+from dao import DAOFactory
+from Scene import Scene
+from Story import Story
+
+TEST_USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+def make_story(factory) -> str:
+    return factory.get_story_dao().create_story(Story(TEST_USER_ID, "Title", 3, 0, "adventure", None))
+
+
+def test_scene_revisions_keep_increasing_after_scenes_are_recreated(tmp_path):
+    factory = DAOFactory.for_sqlite(str(tmp_path / "creaition.db"))
+    scene_dao = factory.get_scene_dao()
+    story_id = make_story(factory)
+    for number in (1, 2, 3):
+        scene_dao.create_scene(Scene(f"Scene {number}", "", number, ""), story_id, number)
+    scene_dao.update_scene_image_urls(story_id, {1: "https://img/1.png", 2: "https://img/2.png"})
+
+    scenes, seen = scene_dao.get_scenes_since(story_id)
+    assert len(scenes) == 3
+
+    # Regenerating the story deletes the scenes holding the highest revisions
+    scene_dao.delete_story_scenes(story_id)
+    for number in (1, 2):
+        scene_dao.create_scene(Scene(f"New scene {number}", "", number, ""), story_id, number)
+
+    changed, version = scene_dao.get_scenes_since(story_id, seen)
+    assert [scene.title for scene in changed] == ["New scene 1", "New scene 2"]
+    assert version > seen
+
+    scene_dao.update_scene_image_urls(story_id, {2: "https://img/new-2.png"})
+    changed, latest = scene_dao.get_scenes_since(story_id, version)
+    assert [scene.image_url for scene in changed] == ["https://img/new-2.png"]
+    assert latest > version
@@ -0,0 +1,48 @@
+import io
+import threading
+import time
+import zipfile
+
+from Scene import Scene
+from Story import Story
+from story_package import stream_story_package
+
+
+def make_scenes(count: int):
+    scenes = []
+    for number in range(1, count + 1):
+        scene = Scene(f"Scene {number}", "", number, "")
+        scene.image_url = f"https://img/{number}.png"
+        scenes.append(scene)
+    return scenes
+
+
+def test_images_after_the_deadline_are_reported_without_being_fetched():
+    fetched = []
+    release = threading.Event()
+
+    def slow_fetch(url):
+        fetched.append(url)
+        release.wait(2)
+        return b"png"
+
+    failures = []
+    started = time.monotonic()
+    data = b"".join(stream_story_package(Story("u1", "Title", 8, 0, "adventure", None), make_scenes(8), slow_fetch,
+                                         concurrency=2, deadline_seconds=0.2, failures=failures))
+    release.set()
+
+    assert time.monotonic() - started < 1.5
+    # Only the first window of fetches was ever started
+    assert len(fetched) == 2
+    assert len(failures) == 8
+    assert all(failure["error"] == "export deadline exceeded" for failure in failures)
+    names = zipfile.ZipFile(io.BytesIO(data)).namelist()
+    assert "manifest.json" in names and not any(name.startswith("images/") for name in names)
+
+
+def test_scene_without_number_is_packaged():
+    scenes = make_scenes(1)
+    scenes[0].scene_number = None
+    data = b"".join(stream_story_package(Story("u1", "Title", 1, 0, "adventure", None), scenes, lambda url: b"png"))
+    assert "images/scene_unknown_Scene 1.png" in zipfile.ZipFile(io.BytesIO(data)).namelist()
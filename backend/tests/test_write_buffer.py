@@ -0,0 +1,108 @@
+from Scene import Scene
+from Story import Story
+from write_buffer import SceneWriteBuffer, BufferedSceneDAO, BufferedStoryDAO
+
+
+class FakeSceneDAO:
+    def __init__(self, story_id: str, nb_scenes: int = 3):
+        self.image_urls = {story_id: {number: "" for number in range(1, nb_scenes + 1)}}
+        self.fail = False
+
+    def get_story_scenes(self, story_id, use_cache=True, columns=None):
+        scenes = []
+        for number, image_url in sorted(self.image_urls.get(story_id, {}).items()):
+            scene = Scene(f"Scene {number}", "", number, "")
+            scene.image_url = image_url
+            scenes.append(scene)
+        return scenes
+
+    def update_scene_image_urls(self, story_id, image_urls):
+        if self.fail:
+            return False
+        self.image_urls[story_id].update(image_urls)
+        return True
+
+
+class FakeStoryDAO:
+    def __init__(self, story_id: str):
+        self.statuses = {story_id: "generating"}
+
+    def get_story(self, story_id, use_cache=True, columns=None):
+        story = Story("u1", "Title", 3, 0, "adventure", None)
+        story.id = story_id
+        story.status = self.statuses[story_id]
+        return story
+
+    def get_story_version(self, story_id):
+        return f"v:{self.statuses[story_id]}"
+
+    def update_story_status(self, story_id, status):
+        self.statuses[story_id] = status
+        return True
+
+
+def test_journal_replays_unflushed_writes_after_crash(tmp_path):
+    journal = str(tmp_path / "write_buffer.journal")
+    scene_dao, story_dao = FakeSceneDAO("s1"), FakeStoryDAO("s1")
+
+    crashed = SceneWriteBuffer(scene_dao, story_dao, journal)
+    crashed.queue_scene_image_url("s1", 1, "https://img/1.png")
+    crashed.queue_scene_image_url("s1", 2, "https://img/2.png")
+    crashed.queue_story_status("s1", "completed")
+    # No flush: the process dies with the writes only in the journal
+    assert scene_dao.image_urls["s1"][1] == ""
+
+    restarted = SceneWriteBuffer(scene_dao, story_dao, journal)
+    assert restarted.pending_scene_urls("s1") == {1: "https://img/1.png", 2: "https://img/2.png"}
+    assert restarted.pending_status("s1") == "completed"
+
+    assert restarted.flush()
+    assert scene_dao.image_urls["s1"] == {1: "https://img/1.png", 2: "https://img/2.png", 3: ""}
+    assert story_dao.statuses["s1"] == "completed"
+
+    # Flushed writes are compacted out of the journal
+    assert SceneWriteBuffer(scene_dao, story_dao, journal).stats()["pending_scene_writes"] == 0
+
+
+def test_torn_journal_line_is_skipped(tmp_path):
+    journal = tmp_path / "write_buffer.journal"
+    journal.write_text(
+        '{"story_id": "s1", "scene_number": 1, "image_url": "https://img/1.png"}\n'
+        '{"story_id": "s1", "scene_numb'
+    )
+    buffer = SceneWriteBuffer(FakeSceneDAO("s1"), FakeStoryDAO("s1"), str(journal))
+    assert buffer.pending_scene_urls("s1") == {1: "https://img/1.png"}
+
+
+def test_reads_overlay_buffered_writes(tmp_path):
+    scene_dao, story_dao = FakeSceneDAO("s1"), FakeStoryDAO("s1")
+    buffer = SceneWriteBuffer(scene_dao, story_dao, str(tmp_path / "journal"))
+    scenes = BufferedSceneDAO(scene_dao, buffer)
+    stories = BufferedStoryDAO(story_dao, buffer)
+    version_before = stories.get_story_version("s1")
+
+    scenes.update_scene_image_url("s1", 2, "https://img/2.png")
+    stories.update_story_complete(stories.get_story("s1"))
+
+    assert [scene.image_url for scene in scenes.get_story_scenes("s1")] == ["", "https://img/2.png", ""]
+    assert stories.get_story("s1").status == "completed"
+    assert stories.get_story_version("s1") != version_before
+    # Nothing has reached the database yet
+    assert scene_dao.image_urls["s1"][2] == "" and story_dao.statuses["s1"] == "generating"
+
+
+def test_failed_flush_keeps_writes_pending(tmp_path):
+    journal = str(tmp_path / "journal")
+    scene_dao, story_dao = FakeSceneDAO("s1"), FakeStoryDAO("s1")
+    buffer = SceneWriteBuffer(scene_dao, story_dao, journal)
+    buffer.queue_scene_image_url("s1", 1, "https://img/1.png")
+
+    scene_dao.fail = True
+    assert not buffer.flush()
+    assert buffer.pending_scene_urls("s1") == {1: "https://img/1.png"}
+    assert SceneWriteBuffer(scene_dao, story_dao, journal).pending_scene_urls("s1") == {1: "https://img/1.png"}
+
+    scene_dao.fail = False
+    assert buffer.flush()
+    assert scene_dao.image_urls["s1"][1] == "https://img/1.png"
+    assert buffer.pending_scene_urls("s1") == {}
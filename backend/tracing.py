@@ -0,0 +1,272 @@
+"""
+Generation run tracing
+A story generation or image generation run is one trace: every pipeline
+stage inside it (reference image downloads, Gemini file uploads, the
+narrative call and its parsing, each scene image call, storage uploads and
+each DAO write) is a span carrying the run's trace id, its parent span and
+its timing. When the run ends the trace is appended to the story's
+timeline on disk (the last TRACE_MAX_RUNS runs per story, served by
+GET /api/stories/{story_id}/timeline) and handed to any registered
+exporters on a background thread.
+
+Spans outside a run cost a context variable lookup and nothing else.
+"""
+
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import contextvars
+from typing import Any, Callable, Dict, List, Optional
+
+from request_context import get_request_id
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+_current_trace: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("trace", default=None)
+_current_span: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar("span", default=None)
+
+
+class Trace:
+    """Spans recorded for one generation run"""
+
+    MAX_SPANS = 2000
+
+    def __init__(self, name: str, story_id: Optional[str] = None):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.story_id = story_id
+        self.request_id = get_request_id()
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def offset_ms(self, started: float) -> float:
+        """Milliseconds from the start of the run to a perf_counter() reading"""
+        return round((started - self._started) * 1000, 3)
+
+    def add_span(self, span: Dict[str, Any]):
+        with self._lock:
+            if len(self.spans) < self.MAX_SPANS:
+                self.spans.append(span)
+
+    def finish(self, status: str = "ok", error: Optional[str] = None):
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        self.status = status
+        self.error = error
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "story_id": self.story_id,
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "spans": spans
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def set_trace_story(story_id: str):
+    """Attach the running trace to a story (for runs that create the story)"""
+    trace = _current_trace.get()
+    if trace and story_id:
+        trace.story_id = str(story_id)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a pipeline stage as a span of the current run, if there is one"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    started = time.perf_counter()
+    status, error = "ok", None
+    try:
+        yield
+    except BaseException as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        trace.add_span({
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "trace_id": trace.trace_id,
+            "name": name,
+            "start_ms": trace.offset_ms(started),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "status": status,
+            "error": error,
+            "attributes": attributes
+        })
+
+
+def record_span(name: str, duration_ms: float, status: str = "ok", **attributes):
+    """Add an already-timed operation that just finished (e.g. a DAO query) to the current run"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    ended = time.perf_counter()
+    trace.add_span({
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": _current_span.get(),
+        "trace_id": trace.trace_id,
+        "name": name,
+        "start_ms": trace.offset_ms(ended - duration_ms / 1000),
+        "duration_ms": round(duration_ms, 3),
+        "status": status,
+        "error": None,
+        "attributes": attributes
+    })
+
+
+def traced(name: str, **attributes) -> Callable:
+    """Decorate a function so each call is a span of the current run"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class TraceStore:
+    """Per-story timelines as JSON files, newest run last"""
+
+    def __init__(self, directory: str, max_runs: int = 20):
+        self.directory = directory
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, story_id: str) -> str:
+        return os.path.join(self.directory, f"{os.path.basename(str(story_id))}.json")
+
+    def timeline(self, story_id: str) -> List[Dict[str, Any]]:
+        try:
+            with open(self._path(story_id), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Unreadable timeline for story {story_id}: {e}")
+            return []
+
+    def append(self, trace: Dict[str, Any]):
+        story_id = trace["story_id"]
+        with self._lock:
+            runs = self.timeline(story_id)
+            runs.append(trace)
+            runs = runs[-self.max_runs:]
+            # Write then rename so readers never see a half-written timeline
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(runs, f, default=str)
+                os.replace(tmp_path, self._path(story_id))
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+
+
+class Tracer:
+    """Starts runs, persists finished traces and feeds the exporters"""
+
+    def __init__(self, store: Optional[TraceStore] = None):
+        self.store = store
+        self._exporters: List[Callable[[Dict[str, Any]], Any]] = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+
+    def add_exporter(self, exporter: Callable[[Dict[str, Any]], Any]):
+        """exporter(trace_json) is called on a background thread for every finished run"""
+        self._exporters.append(exporter)
+
+    @contextmanager
+    def run(self, name: str, story_id: Optional[str] = None):
+        """Trace everything inside the block as one run"""
+        trace = Trace(name, story_id)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.finish("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_trace.reset(token)
+            if trace.duration_ms is None:
+                trace.finish(trace.status, trace.error)
+            self._finish(trace)
+
+    def _finish(self, trace: Trace):
+        data = trace.to_json()
+        if self.store and trace.story_id:
+            try:
+                self.store.append(data)
+            except Exception as e:
+                logger.error(f"❌ Failed to persist trace {trace.trace_id}: {e}")
+        for exporter in self._exporters:
+            self._executor.submit(self._export, exporter, data)
+
+    @staticmethod
+    def _export(exporter: Callable, data: Dict[str, Any]):
+        try:
+            exporter(data)
+        except Exception as e:
+            logger.warning(f"⚠️ Trace exporter failed for {data['trace_id']}: {e}")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def trace_run(tracer_of: Callable[[], Optional[Tracer]], name: str) -> Callable:
+    """Decorate an async endpoint so each call is one traced run
+
+    Endpoints report failure by returning {"success": False, "error": ...};
+    that marks the run as failed too.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            tracer = tracer_of()
+            if tracer is None:
+                return await fn(*args, **kwargs)
+            with tracer.run(name) as trace:
+                result = await fn(*args, **kwargs)
+                if isinstance(result, dict) and result.get("success") is False:
+                    trace.finish("error", str(result.get("error")))
+                return result
+        return wrapper
+    return decorate
+
+
+def http_exporter(url: str, post: Callable) -> Callable[[Dict[str, Any]], Any]:
+    """Exporter that POSTs each trace as JSON to a collector URL"""
+    def export(data: Dict[str, Any]):
+        response = post(url, json=data, timeout=5.0)
+        response.raise_for_status()
+    return export
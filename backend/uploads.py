@@ -0,0 +1,262 @@
+"""
+Direct-to-storage uploads for CreAItion
+The presign endpoint reserves an object key and returns a signed upload URL
+so the browser sends the file straight to storage; the finalize endpoint
+checks the object landed and runs normalize_upload() in the background. The
+API process never holds the upload in memory.
+"""
+
+import io
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config import ASSETS_FOLDER, UPLOAD_PRESIGN_TTL_SECONDS, UPLOAD_MAX_DIMENSION, MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_FILES
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Extensions accepted for image uploads, mapped to the Pillow format they are re-encoded in
+IMAGE_FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WEBP", ".gif": "GIF"}
+# Leading bytes of each accepted image type -> canonical extension
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+
+class UploadError(Exception):
+    """Raised for uploads that cannot be presigned or finalized"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Extension of the image type identified by the first bytes of a file, or None"""
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def check_image_upload(filename: Optional[str], content_type: Optional[str], head: bytes) -> str:
+    """Reject non-image uploads from their declared type and magic bytes; returns the extension to store under"""
+    if content_type and not content_type.startswith("image/"):
+        raise UploadError(f"Unsupported content type: {content_type}", 415)
+    sniffed = sniff_image_type(head)
+    if not sniffed:
+        raise UploadError("File is not a PNG, JPEG, GIF or WebP image", 415)
+    extension = Path(filename or "").suffix.lower()
+    # Keep the client's extension when it names the same format (.jpeg vs .jpg)
+    if IMAGE_FORMATS.get(extension) == IMAGE_FORMATS[sniffed]:
+        return extension
+    return sniffed
+
+
+def object_name(kind: str, filename: str, story_id: Optional[str] = None, character_index: int = 0) -> str:
+    """Storage file name for an upload, following the names the upload endpoints use
+
+    A short random suffix keeps presigned keys unique, so a re-upload never
+    collides with (or needs to overwrite) an object that may be cached.
+    """
+    extension = Path(filename or "").suffix.lower() or ".jpg"
+    if extension not in IMAGE_FORMATS:
+        raise UploadError(f"Unsupported image type: {extension}")
+    suffix = uuid.uuid4().hex[:8]
+    if kind == "character":
+        return f"character_{uuid.uuid4()}{extension}"
+    if kind == "cover":
+        if not story_id:
+            raise UploadError("story_id is required for cover uploads")
+        return f"story_{story_id}_{suffix}{extension}"
+    if kind == "story_character":
+        if not story_id:
+            raise UploadError("story_id is required for story character uploads")
+        return f"char_{character_index}_{suffix}{extension}"
+    raise UploadError(f"Unknown upload kind: {kind}")
+
+
+class UploadRegistry:
+    """In-process record of presigned uploads and their normalization status"""
+
+    MAX_UPLOADS = 1000
+
+    def __init__(self):
+        self._uploads: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, kind: str, file_name: str, folder: str = ASSETS_FOLDER, **details) -> Dict[str, Any]:
+        upload = {
+            "upload_id": str(uuid.uuid4()),
+            "kind": kind,
+            "file_name": file_name,
+            "folder": folder,
+            "object_key": f"{folder.strip('/')}/{file_name}",
+            "status": "pending",
+            "image_url": None,
+            "error": None,
+            "expires_at": time.time() + UPLOAD_PRESIGN_TTL_SECONDS,
+            **details
+        }
+        with self._lock:
+            self._prune()
+            self._uploads[upload["upload_id"]] = upload
+        return upload
+
+    def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            return dict(upload) if upload else None
+
+    def update(self, upload_id: str, **changes):
+        with self._lock:
+            if upload_id in self._uploads:
+                self._uploads[upload_id].update(changes)
+
+    def _prune(self):
+        """Forget expired, never-finalized uploads and cap the registry size"""
+        now = time.time()
+        for upload_id in [u for u, upload in self._uploads.items() if upload["status"] == "pending" and upload["expires_at"] < now]:
+            del self._uploads[upload_id]
+        while len(self._uploads) >= self.MAX_UPLOADS:
+            del self._uploads[next(iter(self._uploads))]
+
+
+upload_registry = UploadRegistry()
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    """ASGI middleware capping request bodies of upload endpoints at MAX_UPLOAD_BYTES
+    (MAX_UPLOAD_BYTES per file for batch uploads)
+
+    A declared Content-Length over the limit is rejected before any of the body
+    is read; chunked bodies are counted as they stream in and cut off as soon
+    as they cross the limit.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _limit_for(self, scope) -> Optional[int]:
+        """Body size limit for an upload request, or None for any other request"""
+        path = scope["path"]
+        if scope["method"] not in ("POST", "PUT"):
+            return None
+        if path.endswith("/batch/upload"):
+            return self.max_bytes * MAX_BATCH_UPLOAD_FILES
+        if path.endswith("/upload") or path.startswith("/api/uploads/local/"):
+            return self.max_bytes
+        return None
+
+    async def __call__(self, scope, receive, send):
+        limit = self._limit_for(scope) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        response_started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Answer 413 right away: the app may turn the error below into a generic 400
+                    if not response_started and not rejected:
+                        rejected = True
+                        await self._reject(send, limit)
+                    raise UploadTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLarge:
+            pass
+
+    async def _reject(self, send, limit: int):
+        body = f'{{"detail": "Upload exceeds the {limit} byte limit"}}'.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def normalize_image(content, extension: str) -> Optional[bytes]:
+    """Apply EXIF orientation and cap the longest side at UPLOAD_MAX_DIMENSION
+
+    Returns the re-encoded image, or None when the upload is already normal
+    (so it is not rewritten). Raises ValueError if content is not an image.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.load()
+    except Exception as e:
+        raise ValueError(f"Not a valid image: {e}")
+
+    image_format = IMAGE_FORMATS.get(extension.lower(), image.format or "PNG")
+    needs_rotation = image.getexif().get(0x0112, 1) != 1
+    too_large = max(image.size) > UPLOAD_MAX_DIMENSION
+    if not needs_rotation and not too_large and image.format == image_format:
+        return None
+
+    image = ImageOps.exif_transpose(image)
+    if too_large:
+        image.thumbnail((UPLOAD_MAX_DIMENSION, UPLOAD_MAX_DIMENSION))
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    image.save(output, format=image_format)
+    return output.getvalue()
+
+
+def normalize_upload(upload_id: str):
+    """Background task: normalize a finalized upload in place and record the outcome"""
+    from supabase_storage import download_image_from_supabase, upload_to_supabase_storage
+
+    upload = upload_registry.get(upload_id)
+    if not upload:
+        return
+    try:
+        content = download_image_from_supabase(upload["image_url"])
+        normalized = normalize_image(content, Path(upload["file_name"]).suffix)
+        if normalized is not None:
+            upload_to_supabase_storage(normalized, upload["file_name"], upload["folder"])
+            logger.info(f"✅ Normalized upload {upload['object_key']}")
+        upload_registry.update(upload_id, status="ready")
+    except Exception as e:
+        logger.error(f"❌ Failed to normalize upload {upload['object_key']}: {e}")
+        upload_registry.update(upload_id, status="failed", error=str(e))
@@ -0,0 +1,280 @@
+"""
+Write-behind buffer for scene image URLs and story status updates
+Image generation used to send one UPDATE per scene plus one per status change.
+The buffer coalesces those per story and flushes them as a single batched
+write on a short interval or when the generation job ends. Every queued write
+is appended to a local journal (and fsynced) before it is acknowledged, and the
+journal is replayed on startup, so a crash between generation and flush does
+not lose any image URL.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class SceneWriteBuffer:
+    """Per-story pending scene image URLs and status, flushed in batches"""
+
+    def __init__(self, scene_dao, story_dao, journal_path: Optional[str] = None, flush_interval: float = 0.5):
+        self.scene_dao = scene_dao
+        self.story_dao = story_dao
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        # story_id -> {"scenes": {scene_number: image_url}, "status": Optional[str]}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._journal = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.queued_writes = 0
+        self.flushed_batches = 0
+        if journal_path:
+            os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+            self._replay()
+            self._journal = open(journal_path, "a", encoding="utf-8")
+
+    # Journal
+
+    def _replay(self):
+        """Load writes that were acknowledged but never flushed before the last shutdown"""
+        if not os.path.exists(self.journal_path):
+            return
+        replayed = 0
+        with open(self.journal_path, "r", encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-append; everything before it is intact
+                    continue
+                self._apply(record)
+                replayed += 1
+        if replayed:
+            logger.info(f"♻️  Replayed {replayed} buffered scene writes from {self.journal_path}")
+
+    def _append(self, record: Dict[str, Any]):
+        if not self._journal:
+            return
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _rewrite_journal(self):
+        """Compact the journal down to what is still pending"""
+        if not self._journal:
+            return
+        tmp_path = f"{self.journal_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as tmp:
+            for story_id, pending in self._pending.items():
+                for scene_number, image_url in pending["scenes"].items():
+                    tmp.write(json.dumps({"story_id": story_id, "scene_number": scene_number, "image_url": image_url}) + "\n")
+                if pending["status"]:
+                    tmp.write(json.dumps({"story_id": story_id, "status": pending["status"]}) + "\n")
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        self._journal.close()
+        os.replace(tmp_path, self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _apply(self, record: Dict[str, Any]):
+        pending = self._pending.setdefault(record["story_id"], {"scenes": {}, "status": None})
+        if "scene_number" in record:
+            pending["scenes"][int(record["scene_number"])] = record["image_url"]
+        else:
+            pending["status"] = record["status"]
+
+    # Queueing
+
+    def queue_scene_image_url(self, story_id: str, scene_number: int, image_url: str):
+        record = {"story_id": story_id, "scene_number": scene_number, "image_url": image_url}
+        with self._lock:
+            self._append(record)
+            self._apply(record)
+            self.queued_writes += 1
+
+    def queue_story_status(self, story_id: str, status: str):
+        record = {"story_id": story_id, "status": status}
+        with self._lock:
+            self._append(record)
+            self._apply(record)
+            self.queued_writes += 1
+
+    def discard(self, story_id: str):
+        """Forget pending scene URLs for a story whose scenes are being replaced"""
+        with self._lock:
+            pending = self._pending.get(story_id)
+            if pending:
+                pending["scenes"].clear()
+                if not pending["status"]:
+                    del self._pending[story_id]
+                self._rewrite_journal()
+
+    # Read overlay
+
+    def pending_scene_urls(self, story_id: str) -> Dict[int, str]:
+        with self._lock:
+            pending = self._pending.get(story_id)
+            return dict(pending["scenes"]) if pending else {}
+
+    def pending_status(self, story_id: str) -> Optional[str]:
+        with self._lock:
+            pending = self._pending.get(story_id)
+            return pending["status"] if pending else None
+
+    # Flushing
+
+    def flush(self, story_id: Optional[str] = None) -> bool:
+        """Write pending updates for one story (or all of them); returns False if any write failed"""
+        with self._flush_lock:
+            with self._lock:
+                story_ids = [story_id] if story_id else list(self._pending)
+                snapshots = {
+                    sid: {"scenes": dict(self._pending[sid]["scenes"]), "status": self._pending[sid]["status"]}
+                    for sid in story_ids if sid in self._pending
+                }
+
+            all_ok = True
+            flushed_any = False
+            for sid, snapshot in snapshots.items():
+                ok = True
+                if snapshot["scenes"]:
+                    ok = self.scene_dao.update_scene_image_urls(sid, snapshot["scenes"])
+                if ok and snapshot["status"]:
+                    ok = self.story_dao.update_story_status(sid, snapshot["status"])
+                if not ok:
+                    all_ok = False
+                    continue
+
+                flushed_any = True
+                self.flushed_batches += 1
+                with self._lock:
+                    # Drop only what was written; values queued during the flush stay pending
+                    pending = self._pending.get(sid)
+                    if pending is None:
+                        continue
+                    for scene_number, image_url in snapshot["scenes"].items():
+                        if pending["scenes"].get(scene_number) == image_url:
+                            del pending["scenes"][scene_number]
+                    if pending["status"] == snapshot["status"]:
+                        pending["status"] = None
+                    if not pending["scenes"] and not pending["status"]:
+                        del self._pending[sid]
+
+            if flushed_any:
+                with self._lock:
+                    self._rewrite_journal()
+            return all_ok
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️  Scene write buffer flush failed: {e}")
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="scene-write-buffer-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread and write out everything still pending"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending_stories": len(self._pending),
+                "pending_scene_writes": sum(len(p["scenes"]) for p in self._pending.values()),
+                "queued_writes": self.queued_writes,
+                "flushed_batches": self.flushed_batches
+            }
+
+
+class _BufferedDAO:
+    """Delegates everything it does not override to the wrapped DAO"""
+
+    def __init__(self, dao, buffer: SceneWriteBuffer):
+        self._dao = dao
+        self._buffer = buffer
+
+    def __getattr__(self, name):
+        return getattr(self._dao, name)
+
+
+class BufferedSceneDAO(_BufferedDAO):
+    def get_story_scenes(self, story_id: str, use_cache: bool = True, columns=None):
+        """Get all scenes for a story with pending image URLs applied"""
+        scenes = self._dao.get_story_scenes(story_id, use_cache=use_cache, columns=columns)
+        pending = self._buffer.pending_scene_urls(story_id)
+        for scene in scenes:
+            if scene.scene_number in pending:
+                scene.image_url = pending[scene.scene_number]
+        return scenes
+
+    def get_scenes_for_stories(self, story_ids, columns=None):
+        """Scenes of several stories with pending image URLs applied"""
+        scenes_by_story = self._dao.get_scenes_for_stories(story_ids, columns=columns)
+        for story_id, scenes in scenes_by_story.items():
+            pending = self._buffer.pending_scene_urls(story_id)
+            for scene in scenes:
+                if scene.scene_number in pending:
+                    scene.image_url = pending[scene.scene_number]
+        return scenes_by_story
+
+    def update_scene_image_url(self, story_id: str, scene_number: int, image_url: str) -> bool:
+        """Queue the image URL; it is durable once this returns and written on the next flush"""
+        self._buffer.queue_scene_image_url(story_id, scene_number, image_url)
+        return True
+
+    def delete_story_scenes(self, story_id: str) -> bool:
+        self._buffer.discard(story_id)
+        return self._dao.delete_story_scenes(story_id)
+
+
+class BufferedStoryDAO(_BufferedDAO):
+    def get_story(self, story_id: str, use_cache: bool = True, columns=None):
+        """Get story by ID with a pending status applied"""
+        story = self._dao.get_story(story_id, use_cache=use_cache, columns=columns)
+        status = self._buffer.pending_status(story_id)
+        if story and status:
+            story.status = status
+        return story
+
+    def get_story_version(self, story_id: str):
+        """Stored version token extended with the story's pending status and scene image URLs"""
+        version = self._dao.get_story_version(story_id)
+        if version is None:
+            return None
+        pending_urls = sorted(self._buffer.pending_scene_urls(story_id).items())
+        status = self._buffer.pending_status(story_id)
+        if not pending_urls and not status:
+            return version
+        return f"{version}|pending:{status}:{pending_urls}"
+
+    def get_stories(self, story_ids, columns=None):
+        """Get several stories with their pending statuses applied"""
+        stories = self._dao.get_stories(story_ids, columns=columns)
+        for story in stories:
+            status = self._buffer.pending_status(story.id)
+            if status:
+                story.status = status
+        return stories
+
+    def update_story_complete(self, story) -> bool:
+        """Queue the completed status; written together with the story's scene updates"""
+        self._buffer.queue_story_status(story.id, "completed")
+        return True
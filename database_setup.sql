@@ -5,6 +5,7 @@
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
 -- Drop all existing tables in correct order (reverse of dependencies)
+DROP TABLE IF EXISTS public.credit_ledger CASCADE;
 DROP TABLE IF EXISTS public.scenes CASCADE;
 DROP TABLE IF EXISTS public.user_character CASCADE;
 DROP TABLE IF EXISTS public.stories CASCADE;
@@ -12,6 +13,10 @@ DROP TABLE IF EXISTS public.users CASCADE;
 
 -- Drop any existing functions
 DROP FUNCTION IF EXISTS update_updated_at_column() CASCADE;
+DROP FUNCTION IF EXISTS bump_scene_revision() CASCADE;
+DROP SEQUENCE IF EXISTS public.scene_revision_seq;
+DROP FUNCTION IF EXISTS record_credit_entries(JSONB) CASCADE;
+DROP FUNCTION IF EXISTS update_scene_image_urls(UUID, JSONB) CASCADE;
 
 -- Create users table (simplified - email-based authentication)
 CREATE TABLE public.users (
@@ -46,9 +51,13 @@ CREATE TABLE public.user_character (
     name VARCHAR(255) NOT NULL,
     description TEXT,
     image_url TEXT,
-    analysis TEXT
+    analysis TEXT,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Monotonic revision counter for scenes (see GET /api/stories/{story_id}/scenes?since=)
+CREATE SEQUENCE public.scene_revision_seq;
+
 -- Create scenes table
 CREATE TABLE public.scenes (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -59,11 +68,24 @@ CREATE TABLE public.scenes (
     image_prompt TEXT,
     image_url TEXT,
     paragraph TEXT,
+    revision BIGINT NOT NULL DEFAULT nextval('public.scene_revision_seq'),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     UNIQUE(story_id, scene_number)
 );
 
+-- Create credit_ledger table (reserve/settle/refund entries written in batches by the API)
+CREATE TABLE public.credit_ledger (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+    reservation_id UUID NOT NULL,
+    job_id VARCHAR(255),
+    kind VARCHAR(20) NOT NULL CHECK (kind IN ('reserve', 'settle', 'refund')),
+    amount INTEGER NOT NULL,
+    delta INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- Create indexes for performance
 CREATE INDEX idx_users_email ON public.users(email);
 CREATE INDEX idx_stories_user_id ON public.stories(user_id);
@@ -71,6 +93,9 @@ CREATE INDEX idx_stories_created_at ON public.stories(created_at);
 CREATE INDEX idx_user_character_story_id ON public.user_character(story_id);
 CREATE INDEX idx_scenes_story_id ON public.scenes(story_id);
 CREATE INDEX idx_scenes_scene_number ON public.scenes(story_id, scene_number);
+CREATE INDEX idx_scenes_revision ON public.scenes(story_id, revision);
+CREATE INDEX idx_credit_ledger_user_id ON public.credit_ledger(user_id);
+CREATE INDEX idx_credit_ledger_reservation_id ON public.credit_ledger(reservation_id);
 
 -- Add constraints
 ALTER TABLE public.stories 
@@ -105,12 +130,70 @@ CREATE TRIGGER update_scenes_updated_at
     BEFORE UPDATE ON public.scenes 
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+-- Every scene update takes a new revision
+CREATE OR REPLACE FUNCTION bump_scene_revision()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.revision = nextval('public.scene_revision_seq');
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER bump_scenes_revision 
+    BEFORE UPDATE ON public.scenes 
+    FOR EACH ROW EXECUTE FUNCTION bump_scene_revision();
+
+CREATE TRIGGER update_user_character_updated_at 
+    BEFORE UPDATE ON public.user_character 
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Apply a batch of credit ledger entries in one transaction and return the new balances.
+-- Entries already recorded (same id) are skipped, so retrying a batch is safe.
+CREATE OR REPLACE FUNCTION record_credit_entries(p_entries JSONB)
+RETURNS TABLE(user_id UUID, credits INTEGER) AS $$
+    WITH inserted AS (
+        INSERT INTO public.credit_ledger (id, user_id, reservation_id, job_id, kind, amount, delta, created_at)
+        SELECT e.id, e.user_id, e.reservation_id, e.job_id, e.kind, e.amount, e.delta, e.created_at
+        FROM jsonb_to_recordset(p_entries) AS e(
+            id UUID, user_id UUID, reservation_id UUID, job_id VARCHAR,
+            kind VARCHAR, amount INTEGER, delta INTEGER, created_at TIMESTAMPTZ
+        )
+        ON CONFLICT (id) DO NOTHING
+        RETURNING credit_ledger.user_id, credit_ledger.delta
+    ), totals AS (
+        SELECT inserted.user_id, SUM(inserted.delta)::INTEGER AS delta
+        FROM inserted
+        GROUP BY inserted.user_id
+    )
+    UPDATE public.users
+    SET credits = GREATEST(public.users.credits + totals.delta, 0)
+    FROM totals
+    WHERE public.users.id = totals.user_id
+    RETURNING public.users.id, public.users.credits;
+$$ LANGUAGE sql;
+
+-- Set the image_url of several scenes of a story in one statement (write-behind buffer flushes).
+-- Update only: scenes deleted or renumbered since the URLs were queued are not recreated.
+CREATE OR REPLACE FUNCTION update_scene_image_urls(p_story_id UUID, p_image_urls JSONB)
+RETURNS INTEGER AS $$
+    WITH updated AS (
+        UPDATE public.scenes
+        SET image_url = u.image_url
+        FROM jsonb_to_recordset(p_image_urls) AS u(scene_number INTEGER, image_url TEXT)
+        WHERE public.scenes.story_id = p_story_id
+          AND public.scenes.scene_number = u.scene_number
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$ LANGUAGE sql;
+
 -- Disable Row Level Security (RLS) for simplified development
 -- This ensures no authentication issues during development
 ALTER TABLE public.users DISABLE ROW LEVEL SECURITY;
 ALTER TABLE public.stories DISABLE ROW LEVEL SECURITY;
 ALTER TABLE public.user_character DISABLE ROW LEVEL SECURITY;
 ALTER TABLE public.scenes DISABLE ROW LEVEL SECURITY;
+ALTER TABLE public.credit_ledger DISABLE ROW LEVEL SECURITY;
 
 -- Insert a test user for development (optional)
 INSERT INTO public.users (username, email, credits) 
@@ -122,13 +205,16 @@ GRANT ALL ON public.users TO authenticated, anon;
 GRANT ALL ON public.stories TO authenticated, anon;
 GRANT ALL ON public.user_character TO authenticated, anon;
 GRANT ALL ON public.scenes TO authenticated, anon;
+GRANT ALL ON public.credit_ledger TO authenticated, anon;
+GRANT EXECUTE ON FUNCTION record_credit_entries(JSONB) TO authenticated, anon;
 GRANT USAGE ON ALL SEQUENCES IN SCHEMA public TO authenticated, anon;
+GRANT USAGE ON SEQUENCE public.scene_revision_seq TO authenticated, anon;
 
 -- Display completion message
 DO $$
 BEGIN
     RAISE NOTICE 'Database setup completed successfully!';
-    RAISE NOTICE 'Tables created: users, stories, user_character, scenes';
+    RAISE NOTICE 'Tables created: users, stories, user_character, scenes, credit_ledger';
     RAISE NOTICE 'RLS disabled for development';
     RAISE NOTICE 'Test user created: test@example.com with 999 credits';
 END $$;
@@ -0,0 +1,54 @@
+import { API_URL } from './config';
+
+export type UploadKind = 'character' | 'cover' | 'story_character';
+
+export interface DirectUploadOptions {
+  storyId?: string;
+  characterIndex?: number;
+  name?: string;
+  description?: string;
+}
+
+// Upload an image straight to storage: presign on the API, PUT the file to the
+// signed URL, then finalize so the API registers it and normalizes it.
+export async function uploadImageDirect(file: File, kind: UploadKind, options: DirectUploadOptions = {}) {
+  const presignResponse = await fetch(`${API_URL}uploads/presign`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      kind,
+      filename: file.name,
+      content_type: file.type || undefined,
+      story_id: options.storyId,
+      character_index: options.characterIndex ?? 0,
+    }),
+  });
+  const presign = await presignResponse.json();
+  if (!presignResponse.ok || !presign.success) {
+    throw new Error(presign.detail || 'Could not start upload');
+  }
+
+  const uploadResponse = await fetch(presign.upload_url, {
+    method: presign.method,
+    headers: presign.headers,
+    body: file,
+  });
+  if (!uploadResponse.ok) {
+    throw new Error(`Upload failed with status ${uploadResponse.status}`);
+  }
+
+  const finalizeResponse = await fetch(`${API_URL}uploads/finalize`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      upload_id: presign.upload_id,
+      name: options.name,
+      description: options.description,
+    }),
+  });
+  const result = await finalizeResponse.json();
+  if (!finalizeResponse.ok || !result.success) {
+    throw new Error(result.detail || 'Could not finalize upload');
+  }
+  return result;
+}
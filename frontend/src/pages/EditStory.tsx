@@ -13,6 +13,7 @@ import { cn } from "@/lib/utils";
 import Header from "@/components/Header";
 import { useAuth } from "@/contexts/AuthContext";
 import { API_URL } from "../lib/config";
+import { uploadImageDirect } from "../lib/uploads";
 
 interface StoryData {
   id: string;
@@ -120,15 +121,7 @@ const EditStory = () => {
     setUploadError("");
 
     try {
-      const formData = new FormData();
-      formData.append('file', file);
-
-      const response = await fetch(`${API_URL}stories/${storyId}/cover/upload`, {
-        method: 'POST',
-        body: formData,
-      });
-
-      const result = await response.json();
+      const result = await uploadImageDirect(file, 'cover', { storyId });
 
       if (result.success) {
         setStoryImage(file);
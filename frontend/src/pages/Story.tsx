@@ -10,6 +10,7 @@ import Header from "@/components/Header";
 import { useAuth } from "@/contexts/AuthContext";
 import { ChevronLeft, ChevronRight, RotateCcw, Check, Settings, Image, Plus, Coins, Loader2, AlertCircle, Upload, Save } from "lucide-react";
 import { API_URL } from '../lib/config';
+import { uploadImageDirect } from '../lib/uploads';
 
 interface StoryData {
   id: string;
@@ -258,18 +259,11 @@ const Story = () => {
     setUploadError("");
 
     try {
-      const formData = new FormData();
-      formData.append('file', file);
-      formData.append('name', 'Character Image');
-      formData.append('description', 'Character image for the story');
-
-      const response = await fetch(`${API_URL}characters/upload`, {
-        method: 'POST',
-        body: formData,
+      const result = await uploadImageDirect(file, 'character', {
+        name: 'Character Image',
+        description: 'Character image for the story',
       });
 
-      const result = await response.json();
-
       if (result.success) {
         const updatedCharacters = [...characters];
         updatedCharacters[index] = { 